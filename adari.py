@@ -1,7 +1,29 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+import re
+import secrets
 import time
+import admission
+import grading
+import live_tests
+import papers
+import practice
+import question_bank
+import results_db
+import session_store
+import submission_queue
+
+# Test configuration
+FULL_MOCK_SECONDS = 2 * 60 * 60  # 2 hour full mock
+LIVE_REFRESH_SECONDS = 5         # how often a waiting candidate's live test card checks admission
+
+# Attempts live in the process-wide session store: in memory while active, on disk while idle
+sessions = session_store.get_store()
+# Live tests are pre-warmed and closed on the server's own clock, whether or not anyone is on the page
+live = live_tests.get_schedule()
+# Dashboards and analytics give way to candidates mid-test when the process is busy
+admission_control = admission.get_controller()
 
 # Set page config
 st.set_page_config(
@@ -40,6 +62,23 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+def student_id():
+    """This browser's candidate id; attempts are kept per candidate and test so they resume after a restart
+
+    The id travels in the URL so a reload, or another worker, keeps the same
+    attempts. It is a placeholder until the app has real sign-in: it is not
+    authenticated, and anyone holding a candidate's link acts as them.
+    """
+    if 'student_id' not in st.session_state:
+        candidate = st.query_params.get("student", "")
+        # Attempt ids are "<candidate>:<test>", so an id from the URL must not contain a colon
+        if not re.fullmatch(r"ADA[0-9a-f]{12}", candidate):
+            candidate = f"ADA{secrets.token_hex(6)}"
+        st.session_state.student_id = candidate
+    if st.query_params.get("student") != st.session_state.student_id:
+        st.query_params["student"] = st.session_state.student_id
+    return st.session_state.student_id
+
 # Sidebar navigation
 def sidebar():
     with st.sidebar:
@@ -48,14 +87,15 @@ def sidebar():
         # Navigation menu
         selected = st.radio(
             "Navigation",
-            ["Home", "Test Series", "Live Tests", "Practice", "Performance Analytics"]
+            ["Home", "Test Series", "Live Tests", "Practice", "Performance Analytics"],
+            key="navigation"
         )
         
         # User profile section
         st.sidebar.markdown("---")
         st.sidebar.markdown("### User Profile")
         st.sidebar.text("Student Name: John Doe")
-        st.sidebar.text("ID: ADA2024001")
+        st.sidebar.text(f"ID: {student_id()}")
         
         return selected
 
@@ -63,26 +103,39 @@ def sidebar():
 def home():
     st.title("Welcome to Adari Institute ICET Test Series")
     
-    # Quick stats
+    # Quick stats and recent activity come from indexed lookups in the results store
+    user_email = st.session_state.get('user_email')
+    if user_email:
+        summary = results_db.user_summary(user_email)
+        attempts = results_db.attempts_for_email(user_email, limit=5)
+    else:
+        summary = {"attempts": 0, "average_score": 0}
+        attempts = results_db.recent_attempts(limit=5)
+
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric(label="Tests Attempted", value="15")
+        st.metric(label="Tests Attempted", value=str(summary["attempts"]))
     with col2:
-        st.metric(label="Average Score", value="75%")
+        st.metric(label="Average Score", value=f"{summary['average_score']:.1f}")
     with col3:
         st.metric(label="Tests Available", value="30")
     
     # Recent activity
     st.subheader("Recent Activity")
     recent_tests = pd.DataFrame({
-        'Test Name': ['Full Mock Test 1', 'Sectional Test - Quant', 'Topic Test - DI'],
-        'Date': ['2024-12-14', '2024-12-13', '2024-12-12'],
-        'Score': ['82/100', '45/50', '28/30']
+        'Test Name': [a['test_id'] for a in attempts],
+        'Date': [a['completion_date'][:10] for a in attempts],
+        'Score': [f"{a['score']:g} ({a['total_questions']} questions)" for a in attempts]
     })
     # Set the index to None to hide it
     recent_tests.index = ['' for _ in range(len(recent_tests))]
     st.dataframe(recent_tests)
 
+def busy_notice(title):
+    """Stand-in for a page whose work was shed to keep tests in progress responsive"""
+    st.title(title)
+    st.info("Many tests are in progress right now, so this page is paused. Please check back in a few minutes.")
+
 # Test series page
 def test_series():
     st.title("Available Test Series")
@@ -93,77 +146,243 @@ def test_series():
         test_type = st.selectbox("Filter by:", 
             ["All Tests", "Full Length", "Sectional", "Topic Wise"])
     
-    # Display tests
-    for i in range(3):
+    show_last_result()
+    
+    # Display tests, filtered through the catalogue's test type index
+    tests = question_bank.catalog_index().select(
+        exam="ICET", test_type=None if test_type == "All Tests" else test_type
+    )
+    if not tests:
+        st.info(f"No {test_type} tests available yet")
+    for i, info in enumerate(tests):
         with st.container():
             st.markdown(f"""
             <div class="test-card">
-                <h3>ICET Full Mock Test {i+1}</h3>
-                <p>Duration: 2 hours | Questions: 100 | Max Marks: 100</p>
+                <h3>{info.title}</h3>
+                <p>{info.test_type} | Questions: {info.questions} | Sections: {', '.join(info.sections)}</p>
                 <p>Last Attempted: {datetime.now().strftime('%b %d, %Y')}</p>
             </div>
             """, unsafe_allow_html=True)
             col1, col2, col3 = st.columns([1,1,2])
             with col1:
-                st.button(f"Start Test {i+1}", key=f"start_{i}")
+                # An attempt left open, even before a server restart, is resumed rather than restarted
+                attempt_id = f"{student_id()}:{info.test_id}"
+                label = "Resume Test" if sessions.in_progress(attempt_id) else f"Start Test {i+1}"
+                if st.button(label, key=f"start_{i}"):
+                    sessions.open(attempt_id, info.questions)
+                    st.session_state.attempt_id = attempt_id
+                    st.session_state.active_test = info.test_id
+                    st.query_params["attempt"] = attempt_id
+                    st.rerun()
             with col2:
                 st.button(f"View Syllabus {i+1}", key=f"syllabus_{i}")
             with col3:
                 st.progress(0.8, text="80% Success Rate")
 
+# Live tests page
+def live_tests_page():
+    st.title("Live Tests")
+    show_last_result()
+    tests = [test for test in live.tests() if time.time() < test.ends_at]
+    if not tests:
+        st.write("No live tests currently scheduled.")
+        return
+    live_test_cards(tests)
+
+# Refreshes on its own so a waiting candidate sees Start unlock at their admission time
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_test_cards(tests):
+    for test in tests:
+        status, seconds = live.admission(test.live_id, student_id())
+        with st.container():
+            st.markdown(f"""
+            <div class="test-card">
+                <h3>{test.title}</h3>
+                <p>Starts: {datetime.fromtimestamp(test.starts_at).strftime('%b %d, %Y %H:%M')} |
+                Ends: {datetime.fromtimestamp(test.ends_at).strftime('%b %d, %Y %H:%M')}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            if status == live_tests.UNREGISTERED:
+                if live.registration_open(test):
+                    st.button("Register", key=f"register_{test.live_id}",
+                              on_click=live.register,
+                              args=(test.live_id, student_id(), st.session_state.get('user_name'),
+                                    st.session_state.get('user_email')))
+                else:
+                    st.info("Registration has closed")
+                continue
+            if status == live_tests.WAITING:
+                st.info(f"Registered. You will be admitted in {format_clock(seconds)}")
+            else:
+                st.success(f"Live now: {format_clock(seconds)} left")
+            if st.button("Start Live Test", key=f"live_{test.live_id}", disabled=status != live_tests.OPEN):
+                if live.start(test.live_id, student_id()) is not None:
+                    st.session_state.attempt_id = live_tests.attempt_id(test.live_id, student_id())
+                    st.session_state.live_id = test.live_id
+                    st.session_state.active_test = test.test_id
+                    st.query_params["attempt"] = st.session_state.attempt_id
+                    st.rerun()
+
 # Test interface
+def format_clock(seconds):
+    seconds = max(0, int(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def show_last_result():
+    if 'last_result' in st.session_state:
+        score, total = st.session_state.pop('last_result')
+        st.success(f"Test submitted! Score: {score:g}/{total}")
+
+def go_to_question(step, count):
+    """Move between questions before the question is redrawn"""
+    attempt = sessions.get(st.session_state.attempt_id)
+    attempt.visit(min(max(0, attempt.current + step), count - 1))
+    sessions.save(st.session_state.attempt_id, attempt)
+
+def toggle_review():
+    attempt = sessions.get(st.session_state.attempt_id)
+    attempt.mark(attempt.current, not attempt.is_marked(attempt.current))
+    sessions.save(st.session_state.attempt_id, attempt)
+
+def leave_test():
+    del st.session_state.attempt_id
+    st.session_state.pop('live_id', None)
+    st.query_params.pop("attempt", None)
+
+def submit_attempt(test, attempt):
+    """Grade the attempt, queue its result and close it in the session store"""
+    name, email = st.session_state.get('user_name'), st.session_state.get('user_email')
+    if 'live_id' in st.session_state:
+        result = live.submit(st.session_state.live_id, student_id(), name, email)
+        if result is not None:
+            st.session_state.last_result = result[:2]
+        leave_test()
+        return
+    # Only the call that closes the attempt records it, however many tabs submit
+    if sessions.finish(st.session_state.attempt_id):
+        results = grading.grade_one(attempt.responses, grading.answer_key(test.questions), grading.ICET_SCHEME)
+        elapsed = min(time.time() - attempt.started_at, FULL_MOCK_SECONDS)
+        submission_queue.submit({
+            "test_id": test.test_id,
+            "name": name,
+            "email": email,
+            "score": results['score'],
+            "total_questions": len(test.questions),
+            "completion_time": f"{int(elapsed // 60):02d}:{int(elapsed % 60):02d}",
+            "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "responses": attempt.responses.tolist()
+        })
+        st.session_state.last_result = (results['score'], len(test.questions) * grading.ICET_SCHEME.correct)
+    leave_test()
+
+def resume_from_link():
+    """Pick up the attempt named in the URL, as when the load balancer moves a candidate to another worker"""
+    attempt_id = st.query_params.get("attempt")
+    if (attempt_id and 'attempt_id' not in st.session_state
+            and attempt_id.startswith(f"{student_id()}:") and sessions.in_progress(attempt_id)):
+        test_id = attempt_id.split(":", 1)[1]
+        if test_id.startswith("live:"):
+            test = live.get(test_id[len("live:"):])
+            if test is None:
+                return
+            st.session_state.live_id, test_id = test.live_id, test.test_id
+        st.session_state.attempt_id = attempt_id
+        st.session_state.active_test = test_id
+        st.session_state.navigation = "Live Tests" if 'live_id' in st.session_state else "Test Series"
+
 def test_interface():
     st.title("Test in Progress")
+    test = question_bank.load_test(st.session_state.active_test)
+    attempt_id = st.session_state.attempt_id
+    attempt = sessions.get(attempt_id)
+    if attempt is None:
+        # Submitted from another tab, or by the live test closing
+        leave_test()
+        st.rerun()
+    number = 0 if attempt.current is None else attempt.current
+    attempt.visit(number)
+    
+    # A live test has its own shuffled paper and ends for everyone at once
+    live_id = st.session_state.get('live_id')
+    paper = live.paper(live_id, student_id()) if live_id else None
+    questions = paper.questions if paper else test.questions
+    deadline = live.get(live_id).ends_at if live_id else attempt.started_at + FULL_MOCK_SECONDS
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        submit_attempt(test, attempt)
+        st.rerun()
     
     # Timer and progress
     col1, col2 = st.columns([3,1])
     with col1:
-        st.progress(0.6, text="60/100 Questions")
+        answered = attempt.summary()["answered"]
+        st.progress(answered / len(questions), text=f"{answered}/{len(questions)} Questions")
     with col2:
-        st.markdown("""
+        st.markdown(f"""
         <div style='text-align: center; padding: 10px; background-color: #f0f2f6; border-radius: 5px;'>
-            Time Remaining: 01:30:00
+            Time Remaining: {format_clock(remaining)}
         </div>
         """, unsafe_allow_html=True)
     
     # Question display
-    st.markdown("### Question 1")
-    st.write("Sample question text goes here...")
+    question = questions[number]
+    st.markdown(f"### Question {number + 1}" + (" 🔖" if attempt.is_marked(number) else ""))
+    st.write(question.text)
     
-    # Options
-    options = ['Option A', 'Option B', 'Option C', 'Option D']
-    selected_option = st.radio("Select your answer:", options)
+    # Options; a resumed attempt starts from the answer it left off with
+    options = papers.shown_options(paper, number) if paper else question.options
+    selected_option = st.radio("Select your answer:", range(len(options)),
+                               format_func=options.__getitem__, index=attempt.response(number),
+                               key=f"{attempt_id}_q{number}")
+    attempt.answer(number, selected_option)
+    if not sessions.save(attempt_id, attempt):
+        st.rerun()   # another tab or worker moved the attempt on; redraw it as it now stands
     
     # Navigation buttons
     col1, col2, col3 = st.columns([1,1,1])
     with col1:
-        st.button("Previous")
+        st.button("Previous", on_click=go_to_question, args=(-1, len(questions)))
     with col2:
-        st.button("Mark for Review")
+        st.button("Mark for Review", on_click=toggle_review)
     with col3:
-        st.button("Next")
+        st.button("Next", on_click=go_to_question, args=(1, len(questions)))
+    
+    if st.button("Submit Test"):
+        submit_attempt(test, attempt)
+        st.rerun()
 
 # Main app logic
 def main():
+    resume_from_link()
     selected = sidebar()
     
     if selected == "Home":
-        home()
+        with admission_control.optional() as allowed:
+            if allowed:
+                home()
+            else:
+                busy_notice("Welcome to Adari Institute ICET Test Series")
+    elif selected in ("Test Series", "Live Tests") and 'attempt_id' in st.session_state:
+        with admission_control.in_test():
+            test_interface()
     elif selected == "Test Series":
         test_series()
     elif selected == "Live Tests":
-        st.title("Live Tests")
-        st.write("No live tests currently scheduled.")
+        live_tests_page()
     elif selected == "Practice":
         st.title("Practice Section")
-        st.write("Choose topics to practice...")
+        practice.practice_panel()
     elif selected == "Performance Analytics":
-        st.title("Your Performance Analytics")
-        # Sample performance data
-        performance_data = pd.DataFrame({
-            'Test Score': [75, 82, 78, 85, 90]
-        }, index=['Test 1', 'Test 2', 'Test 3', 'Test 4', 'Test 5'])
-        st.line_chart(performance_data)
+        with admission_control.optional() as allowed:
+            if not allowed:
+                busy_notice("Your Performance Analytics")
+                return
+            st.title("Your Performance Analytics")
+            # Sample performance data
+            performance_data = pd.DataFrame({
+                'Test Score': [75, 82, 78, 85, 90]
+            }, index=['Test 1', 'Test 2', 'Test 3', 'Test 4', 'Test 5'])
+            st.line_chart(performance_data)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
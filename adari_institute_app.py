@@ -1,6 +1,12 @@
 import streamlit as st
 import pandas as pd
 import random
+import secrets
+import admission
+import grading
+import papers
+
+admission_control = admission.get_controller()
 
 class AdariInstituteApp:
     def _init_(self):
@@ -19,39 +25,25 @@ class AdariInstituteApp:
         self.exams = {
             "ICET": {
                 "full_name": "Integrated ICET Exam",
-                "subjects": ["Logical Reasoning", "Quantitative Aptitude", "English"]
+                "subjects": ["Logical Reasoning", "Quantitative Aptitude", "English"],
+                "minutes": 150
             },
             "TSPSC": {
                 "full_name": "Telangana State Public Service Commission",
-                "subjects": ["General Knowledge", "Arithmetic", "Reasoning"]
+                "subjects": ["General Knowledge", "Arithmetic", "Reasoning"],
+                "minutes": 150
             },
             "GATE": {
                 "full_name": "Graduate Aptitude Test in Engineering",
-                "subjects": ["Engineering Mathematics", "Technical Subjects", "Aptitude"]
+                "subjects": ["Engineering Mathematics", "Technical Subjects", "Aptitude"],
+                "minutes": 180
             }
         }
         
-        # Sample questions (would typically be from a database)
-        self.questions = {
-            "Logical Reasoning": [
-                {
-                    "question": "If A > B and B > C, then A is definitely greater than C",
-                    "options": ["True", "False", "Depends on the context", "Cannot be determined"],
-                    "correct_answer": "True"
-                },
-                {
-                    "question": "What comes next in the sequence: 2, 6, 12, 20, ?",
-                    "options": ["30", "28", "26", "24"],
-                    "correct_answer": "30"
-                }
-            ],
-            "Quantitative Aptitude": [
-                {
-                    "question": "If 2x + 3 = 15, what is the value of x?",
-                    "options": ["4", "5", "6", "7"],
-                    "correct_answer": "6"
-                }
-            ]
+        # Question bank test for each subject, loaded when a test series first needs it
+        self.subject_tests = {
+            "Logical Reasoning": "adari-logical-reasoning",
+            "Quantitative Aptitude": "adari-quantitative-aptitude"
         }
     
     def login_page(self):
@@ -71,6 +63,7 @@ class AdariInstituteApp:
                 # Simple login validation (replace with proper authentication)
                 if username == "student" and password == "adari2024":
                     st.session_state.logged_in = True
+                    st.session_state.username = username
                     st.experimental_rerun()
                 else:
                     st.error("Invalid credentials")
@@ -92,41 +85,80 @@ class AdariInstituteApp:
         
         # Start Test Button
         if st.button("Start Test Series"):
-            st.session_state.current_exam = selected_exam
+            st.session_state.ticket = secrets.token_hex(16)
+            st.session_state.waiting = selected_exam
+            self.begin_test()
             st.experimental_rerun()
     
+    def begin_test(self):
+        """Open the test series once the admission controller has a slot for this candidate"""
+        duration = self.exams[st.session_state.waiting]['minutes'] * 60
+        admitted, position, eta = admission_control.request(st.session_state.ticket, duration)
+        if admitted:
+            st.session_state.current_exam = st.session_state.pop('waiting')
+            # The attempt keeps only this seed; its paper is rebuilt from it for review or re-grading
+            st.session_state.paper_seed = secrets.randbelow(2**31)
+        return admitted, position, eta
+    
+    @st.fragment(run_every=admission.WAIT_POLL_SECONDS)
+    def waiting_room(self):
+        """Hold the candidate's place in line, asking again every few seconds"""
+        st.title(f"{self.exams[st.session_state.waiting]['full_name']} - Test Series")
+        admitted, position, eta = self.begin_test()
+        if admitted:
+            st.rerun()
+        if position is None:
+            st.error("Too many candidates are waiting right now. This page will keep trying.")
+        else:
+            minutes, seconds = divmod(int(eta), 60)
+            st.info(f"All test slots are taken right now. You are number {position} in line, "
+                    f"about {minutes:02d}:{seconds:02d} to go. Your test will start automatically.")
+    
     def test_series_page(self):
         """Page for conducting test series"""
         st.title(f"{self.exams[st.session_state.current_exam]['full_name']} - Test Series")
         
-        # Select a random subject for demonstration
-        subject = random.choice(self.exams[st.session_state.current_exam]['subjects'])
+        if 'paper_seed' not in st.session_state:
+            st.session_state.paper_seed = secrets.randbelow(2**31)
+        seed = st.session_state.paper_seed
+        
+        # Select a random subject for demonstration, fixed for the attempt by its seed
+        subject = random.Random(seed).choice(self.exams[st.session_state.current_exam]['subjects'])
         st.subheader(f"Subject: {subject}")
         
-        # Prepare questions
-        questions = self.questions.get(subject, [])
+        # Prepare questions: the candidate's paper is assembled once and reruns hit the cache
+        test_id = self.subject_tests.get(subject)
+        paper = papers.get_paper(st.session_state.get('username'), test_id, seed) if test_id else None
+        questions = paper.questions if paper else []
         
         # Display questions
         user_answers = {}
         for i, q in enumerate(questions, 1):
-            st.write(f"*Question {i}:* {q['question']}")
+            st.write(f"*Question {i}:* {q.text}")
+            options = papers.shown_options(paper, i - 1)
             user_answers[i] = st.radio(
                 f"Select your answer for Question {i}", 
-                q['options'], 
+                range(len(options)), 
+                format_func=options.__getitem__,
                 key=f"q{i}"
             )
         
         # Submit Test Button
         if st.button("Submit Test"):
-            self.evaluate_test(questions, user_answers)
+            admission_control.release(st.session_state.get('ticket'))
+            self.evaluate_test(paper, user_answers)
     
-    def evaluate_test(self, questions, user_answers):
+    def evaluate_test(self, paper, user_answers):
         """Evaluate the test and show results"""
+        questions = paper.questions if paper else []
         total_questions = len(questions)
-        correct_answers = sum(
-            1 for i, q in enumerate(questions, 1) 
-            if user_answers[i] == q['correct_answer']
-        )
+        # Responses are graded, like the answer key, as bank option indices
+        responses = [
+            grading.UNATTEMPTED if user_answers[i] is None else papers.original_option(paper, i - 1, user_answers[i])
+            for i in range(1, total_questions + 1)
+        ]
+        results = grading.grade_one(responses, grading.answer_key(questions), grading.PLAIN_SCHEME)
+        correct_answers = results['correct']
         
         percentage = (correct_answers / total_questions) * 100
         
@@ -147,10 +179,18 @@ class AdariInstituteApp:
         """Main application flow"""
         if not st.session_state.logged_in:
             self.login_page()
+        elif 'waiting' in st.session_state:
+            self.waiting_room()
         elif st.session_state.current_exam is None:
             self.dashboard()
         else:
-            self.test_series_page()
+            # In-test runs are never shed, and count towards shedding optional work elsewhere
+            with admission_control.in_test():
+                ticket = st.session_state.get('ticket')
+                if not admission_control.heartbeat(ticket):
+                    # The slot lapsed while the browser was idle; the test is under way, so it gets one back
+                    admission_control.readmit(ticket, self.exams[st.session_state.current_exam]['minutes'] * 60)
+                self.test_series_page()
 
 # Run the application
 if __name__ == "_main_":
@@ -0,0 +1,310 @@
+import bisect
+import heapq
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Admission control configuration
+MAX_ACTIVE_ATTEMPTS = 200   # attempts a process runs at once; further Start clicks wait in line
+MAX_WAITING = 5000          # candidates in line before Start is refused outright
+ATTEMPT_SECONDS = 300       # first estimate of how long an attempt keeps its slot, for waiting times
+HOLD_SMOOTHING = 0.1        # weight of each finished attempt in the moving average of slot hold time
+ACTIVE_GRACE = 120          # an attempt not seen for its test's duration and this long is abandoned and frees its slot
+CLAIM_SECONDS = 30          # a candidate admitted from the line must show up within this long
+WAIT_TTL = 30               # a waiting candidate whose page stops asking leaves the line after this long
+WAIT_POLL_SECONDS = 3       # how often the waiting screen asks again
+EXPIRY_INTERVAL = 1.0       # seconds between scans for abandoned slots and places in line
+BUSY_RUNS = 8               # in-test script runs at once beyond which optional work is shed
+MAX_OPTIONAL_RUNS = 4       # dashboard and analytics runs allowed at once
+BENCH_SECONDS = 6           # length of the load test
+
+class AdmissionController:
+    """Caps the attempts a process runs at once, lines up the rest first come first served,
+    and sheds optional work before it slows down anyone mid-test
+
+    Every run of a candidate's page calls request() with the candidate's
+    ticket and the test's duration until it admits them, which reports their
+    place in line and an estimated wait meanwhile. Runs mid-test call
+    heartbeat() to keep the slot, and readmit() when it has lapsed anyway;
+    release() frees it on submission.
+    """
+    def __init__(self, max_active=MAX_ACTIVE_ATTEMPTS, max_waiting=MAX_WAITING, attempt_seconds=ATTEMPT_SECONDS):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._active = {}          # ticket -> [admitted at, last seen, claimed, seconds unseen before abandoned]
+        self._waiting = {}         # ticket -> [sequence, last seen, seconds unseen before abandoned once admitted]
+        self._line = []            # sequences of waiting tickets, ascending, so a place in line is a bisect
+        self._by_sequence = {}     # sequence -> ticket
+        self._sequence = itertools.count()
+        self._hold_seconds = attempt_seconds
+        self._last_expiry = 0.0
+        self._running = {"in_test": 0, "optional": 0}
+        self._counters = {"admitted": 0, "readmitted": 0, "refused": 0, "abandoned": 0, "shed": 0}
+
+    def request(self, ticket, duration, now=None):
+        """(admitted, position, eta seconds); position counts from 1, and is None when the line is full
+
+        duration is the test's length in seconds: a candidate can sit on one
+        question for most of it, so only an attempt unseen for longer is abandoned.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            slot = self._active.get(ticket)
+            if slot is None:
+                entry = self._waiting.get(ticket)
+                if entry is None:
+                    if len(self._waiting) >= self.max_waiting:
+                        self._counters["refused"] += 1
+                        return False, None, None
+                    entry = [next(self._sequence), now, duration + ACTIVE_GRACE]
+                    self._waiting[ticket] = entry
+                    self._line.append(entry[0])
+                    self._by_sequence[entry[0]] = ticket
+                entry[1] = now
+                self._fill(now)
+                slot = self._active.get(ticket)
+                if slot is None:
+                    position = bisect.bisect_left(self._line, entry[0]) + 1
+                    # One slot frees up every hold time / max_active seconds on average
+                    return False, position, position * self._hold_seconds / self.max_active
+            slot[1] = now
+            slot[2] = True
+            return True, 0, 0.0
+
+    def heartbeat(self, ticket, now=None):
+        """Keep an admitted candidate's slot alive; False if they hold none"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._active.get(ticket)
+            if slot is not None:
+                slot[1] = now
+                slot[2] = True
+            return slot is not None
+
+    def readmit(self, ticket, duration, now=None):
+        """Give a candidate mid-test whose slot lapsed a slot again, at once
+
+        Their test is already under way, so they go ahead of the line even if
+        that briefly runs more than max_active attempts.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if ticket in self._active:
+                slot = self._active[ticket]
+            else:
+                if ticket in self._waiting:
+                    self._leave_line(ticket)
+                slot = self._active[ticket] = [now, now, True, duration + ACTIVE_GRACE]
+                self._counters["readmitted"] += 1
+            slot[1] = now
+            slot[2] = True
+
+    def release(self, ticket, now=None):
+        """Free a submitted attempt's slot, or give up a place in line"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._active.pop(ticket, None)
+            if slot is not None:
+                self._hold_seconds += HOLD_SMOOTHING * (now - slot[0] - self._hold_seconds)
+                self._fill(now)
+            elif ticket in self._waiting:
+                self._leave_line(ticket)
+
+    def _fill(self, now):
+        """Admit from the front of the line while slots are free"""
+        while self._line and len(self._active) < self.max_active:
+            sequence = self._line.pop(0)
+            ticket = self._by_sequence.pop(sequence)
+            ttl = self._waiting.pop(ticket)[2]
+            self._active[ticket] = [now, now, False, ttl]
+            self._counters["admitted"] += 1
+
+    def _leave_line(self, ticket):
+        sequence = self._waiting.pop(ticket)[0]
+        del self._line[bisect.bisect_left(self._line, sequence)]
+        del self._by_sequence[sequence]
+
+    def _expire(self, now):
+        """Free slots and places in line whose pages have gone away"""
+        if now - self._last_expiry < EXPIRY_INTERVAL:
+            return
+        self._last_expiry = now
+        abandoned = [ticket for ticket, (_, seen, claimed, ttl) in self._active.items()
+                     if now - seen > (ttl if claimed else CLAIM_SECONDS)]
+        for ticket in abandoned:
+            del self._active[ticket]
+        self._counters["abandoned"] += len(abandoned)
+        for ticket in [ticket for ticket, (_, seen, _) in self._waiting.items() if now - seen > WAIT_TTL]:
+            self._leave_line(ticket)
+        self._fill(now)
+
+    @contextmanager
+    def in_test(self):
+        """Count a script run for a candidate mid-test; such runs are never shed"""
+        with self._lock:
+            self._running["in_test"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running["in_test"] -= 1
+
+    @contextmanager
+    def optional(self):
+        """Yield whether optional work, such as dashboards and analytics, may run now
+
+        It is shed while candidates are waiting for a slot, while in-test runs
+        are busy, or while MAX_OPTIONAL_RUNS optional runs are already going.
+        """
+        with self._lock:
+            allowed = (not self._line and self._running["in_test"] < BUSY_RUNS
+                       and self._running["optional"] < MAX_OPTIONAL_RUNS)
+            if allowed:
+                self._running["optional"] += 1
+            else:
+                self._counters["shed"] += 1
+        try:
+            yield allowed
+        finally:
+            if allowed:
+                with self._lock:
+                    self._running["optional"] -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, active=len(self._active), waiting=len(self._waiting),
+                        hold_seconds=self._hold_seconds, **self._running)
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_controller():
+    """The process-wide controller shared by every session"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
+
+def _work(iterations):
+    """Interpreter-bound work that, like a script run, holds the GIL"""
+    total = 0
+    for i in range(iterations):
+        total += i
+    return total
+
+def _iterations_per_ms():
+    started = time.perf_counter()
+    _work(200000)
+    return int(200000 / ((time.perf_counter() - started) * 1000))
+
+def load_test(controlled, seconds=BENCH_SECONDS, start_rate=150, dashboard_rate=60, clicks=10, think=0.2,
+              click_ms=0.5, dashboard_ms=15, poll=0.25, max_active=50, threads=64):
+    """Open-loop overload: Start clicks, in-test clicks and dashboard runs served by a thread pool
+
+    Each admitted candidate clicks every think seconds for clicks clicks and
+    then submits; waiting candidates ask again every poll seconds. Returns
+    latency in ms of every in-test click and the counts for the run.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    per_ms = _iterations_per_ms()
+    controller = AdmissionController(max_active=max_active, attempt_seconds=clicks * think)
+    events = []   # (due, sequence, kind, candidate, clicks left)
+    sequence = itertools.count()
+    for n in range(int(seconds * start_rate)):
+        heapq.heappush(events, (n / start_rate, next(sequence), "start", n, clicks))
+    for n in range(int(seconds * dashboard_rate)):
+        heapq.heappush(events, (n / dashboard_rate, next(sequence), "dashboard", None, 0))
+    pending, lock = [], threading.Lock()
+    click_ms_seen, waits, arrival_order, admitted_order = [], {}, [], []
+    counts = {"clicks": 0, "dashboards": 0, "shed": 0, "longest_line": 0, "outstanding": 0}
+    origin = time.perf_counter() + 0.05
+
+    def follow_up(due, kind, candidate, left):
+        with lock:
+            pending.append((due, next(sequence), kind, candidate, left))
+
+    def count(name, value=1):
+        with lock:
+            counts[name] += value
+
+    def serve(due, kind, candidate, left):
+        try:
+            now = time.perf_counter() - origin
+            if kind == "dashboard":
+                if controlled:
+                    with controller.optional() as allowed:
+                        if allowed:
+                            _work(int(dashboard_ms * per_ms))
+                    count("dashboards" if allowed else "shed")
+                else:
+                    _work(int(dashboard_ms * per_ms))
+                    count("dashboards")
+            elif kind in ("start", "poll"):
+                # Recorded under the lock so admission order can be checked against the order of arrival
+                with lock:
+                    admitted, position, eta = controller.request(candidate, clicks * think, now) if controlled else (True, 0, 0)
+                    if kind == "start":
+                        arrival_order.append(candidate)
+                    if admitted:
+                        admitted_order.append(candidate)
+                        waits[candidate] = now - waits.get(candidate, now)
+                    elif position is not None:
+                        waits.setdefault(candidate, now)
+                        counts["longest_line"] = max(counts["longest_line"], position)
+                _work(int(0.2 * per_ms))
+                if admitted:
+                    follow_up(now + think, "click", candidate, left)
+                elif position is not None:
+                    follow_up(now + poll, "poll", candidate, left)
+            else:
+                if controlled:
+                    with controller.in_test():
+                        if not controller.heartbeat(candidate, now):
+                            controller.readmit(candidate, clicks * think, now)
+                        _work(int(click_ms * per_ms))
+                else:
+                    _work(int(click_ms * per_ms))
+                click_ms_seen.append((time.perf_counter() - origin - due) * 1000)
+                count("clicks")
+                if left > 1:
+                    follow_up(due + think, "click", candidate, left - 1)
+                elif controlled:
+                    controller.release(candidate, time.perf_counter() - origin)
+        finally:
+            count("outstanding", -1)
+
+    with ThreadPoolExecutor(threads) as pool:
+        while True:
+            with lock:
+                for event in pending:
+                    heapq.heappush(events, event)
+                pending.clear()
+                if not events and not counts["outstanding"]:
+                    break
+            delay = origin + events[0][0] - time.perf_counter() if events else 0.005
+            if delay > 0:
+                time.sleep(min(delay, 0.005))
+                continue
+            due, _, kind, candidate, left = heapq.heappop(events)
+            count("outstanding")
+            pool.submit(serve, due, kind, candidate, left)
+    click_ms_seen.sort()
+    counts["admitted_in_order"] = admitted_order == arrival_order
+    counts["max_wait_s"] = max(waits.values(), default=0)
+    return click_ms_seen, counts
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else BENCH_SECONDS
+    for controlled in (False, True):
+        timings, counts = load_test(controlled, seconds)
+        print(f"{'with admission control' if controlled else 'uncontrolled':>22}: {counts['clicks']} in-test clicks, "
+              f"median {timings[len(timings) // 2]:.1f} ms, p99 {timings[int(len(timings) * 0.99)]:.1f} ms; "
+              f"{counts['dashboards']} dashboards run, {counts['shed']} shed")
+        if controlled:
+            print(f"{'':>22}  longest line {counts['longest_line']}, longest wait {counts['max_wait_s']:.1f}s, "
+                  f"admitted in arrival order: {counts['admitted_in_order']}")
@@ -1,8 +1,16 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime, timedelta
 import time
+import uuid
+from countdown_timer import countdown_timer
+from attempt_state import AttemptState
+import admission
+import grading
+import practice
+import question_bank
+import rank_index
+import results_db
+import submission_queue
 
 # Initialize session state variables
 def initialize_session_state():
@@ -25,35 +33,24 @@ def initialize_session_state():
 QUESTION_TIME_LIMIT = 45  # seconds per question
 TOTAL_TIME_LIMIT = 300   # 5 minutes for entire test
 TIME_WARNING = 60        # seconds remaining when to show warning
+TIMER_THRESHOLDS = {'critical': TIME_WARNING / 3, 'caution': TIME_WARNING}  # red blinking / orange
 CORRECT_MARKS = 2        # marks for correct answer
 WRONG_MARKS = -0.5       # negative marking for wrong answer
+MARKING_SCHEME = grading.MarkingScheme(correct=CORRECT_MARKS, wrong=WRONG_MARKS)
+EXAM = "ICET"            # catalogue exam whose tests this series lists
 
-# Sample questions (you can load this from a database or file)
-questions = [
-    {
-        "question": """Directions: Study the following digit-letter-symbol sequence carefully:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        How many such symbols are there in the above sequence, each of which is immediately preceded by a consonant and immediately followed by a number?""",
-        "options": ["None", "One", "Two", "Four", "None of these"],
-        "correct_answer": "Two"
-    },
-    # ... other questions ...
-]
+# Tests are loaded from the question bank when a candidate first opens them; the most
+# attempted ones are warmed in the background once per process
+question_bank.prefetch(lambda: results_db.popular_tests(question_bank.PREFETCH_COUNT))
+admission_control = admission.get_controller()
+
+def current_questions():
+    """Questions of the test the candidate opened"""
+    return question_bank.load_test(st.session_state.selected_test).questions
 
 def save_user_data(user_data):
-    """Save user data to a JSON file"""
-    filename = "user_data.json"
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            existing_data = json.load(f)
-    else:
-        existing_data = []
-    
-    existing_data.append(user_data)
-    
-    with open(filename, "w") as f:
-        json.dump(existing_data, f, indent=4)
+    """Queue user data for the background results writer"""
+    submission_queue.submit(user_data)
 
 def format_time(seconds):
     """Format seconds into minutes:seconds"""
@@ -63,14 +60,6 @@ def format_time(seconds):
     seconds = int(seconds % 60)
     return f"{minutes:02d}:{seconds:02d}"
 
-def get_timer_color(remaining_time):
-    """Return color based on remaining time"""
-    if remaining_time <= TIME_WARNING/3:
-        return "red"
-    elif remaining_time <= TIME_WARNING:
-        return "orange"
-    return "green"
-
 def create_dashboard():
     """Create the main dashboard interface"""
     st.set_page_config(page_title="Adari Institute - ICET Test Series", layout="wide")
@@ -89,9 +78,11 @@ def create_dashboard():
     with st.sidebar:
         st.header("LEARN")
         st.button("📚 Study Material")
-        st.button("🎓 Mock Tests")
+        if st.button("🎓 Mock Tests"):
+            st.session_state.quick_practice = False
         st.button("📝 Previous Papers")
-        st.button("⚡ Quick Practice")
+        if st.button("⚡ Quick Practice"):
+            st.session_state.quick_practice = True
         
         st.header("TEST SERIES")
         selected_section = st.radio(
@@ -106,6 +97,21 @@ def create_dashboard():
         - 📊 Detailed Analytics
         - 🏆 All India Rank
         """)
+        
+        # Rank of the candidate's latest attempt, answered from the rank index; left out under load
+        with admission_control.optional() as allowed:
+            if allowed and st.session_state.get('user_email'):
+                latest = results_db.attempts_for_email(st.session_state.user_email, limit=1)
+                if latest:
+                    attempt = latest[0]
+                    rank, percentile = rank_index.get_rank(attempt['test_id'], attempt['score'], attempt['completion_time'])
+                    st.metric("🏆 All India Rank", rank, f"{percentile:.1f} percentile", delta_color="off")
+    
+    # Quick Practice replaces the test listing until Mock Tests is chosen again
+    if st.session_state.get('quick_practice'):
+        st.header("⚡ Quick Practice")
+        practice.practice_panel(key="quick_practice")
+        return
     
     # Main content area
     tab1, tab2, tab3 = st.tabs(["Mock Tests", "Analytics", "Performance"])
@@ -117,74 +123,165 @@ def create_dashboard():
         # Filter options
         col1, col2 = st.columns(2)
         with col1:
-            st.selectbox("Select Subject", ["All Subjects", "Quantitative Aptitude", "Verbal Ability", "Logical Reasoning"])
+            selected_subject = st.selectbox("Select Subject", ["All Subjects", "Quantitative Aptitude", "Verbal Ability", "Logical Reasoning"])
         with col2:
-            st.selectbox("Language", ["English", "Telugu"])
+            selected_language = st.selectbox("Language", ["English", "Telugu"])
             
-        # Test Cards
-        for i in range(3):
+        # Test Cards, filtered through the catalogue's inverted indexes without opening any test
+        tests = question_bank.catalog_index().select(
+            exam=EXAM,
+            section=selected_section,
+            subject=None if selected_subject == "All Subjects" else selected_subject,
+            language=selected_language
+        )
+        if not tests:
+            st.info(f"No {selected_section} tests in {selected_language} yet")
+        for i, info in enumerate(tests):
             with st.container():
                 st.markdown("---")
                 col1, col2 = st.columns([3,1])
                 with col1:
                     if i == 0:
-                        st.markdown("### 🆓 Introduction to ICET")
+                        st.markdown(f"### 🆓 {info.title}")
                     else:
-                        st.markdown(f"### Test {i+1}: Advanced Concepts")
-                    st.write(f"👥 {1000 + i*500} Users")
-                    st.write(f"⏱️ 30 Questions | 30 Minutes | 30 Marks")
-                    st.write("Available in: English, Telugu")
+                        st.markdown(f"### Test {i+1}: {info.title}")
+                    st.write(f"⏱️ {info.questions} Questions | {TOTAL_TIME_LIMIT // 60} Minutes | {info.questions * CORRECT_MARKS} Marks")
+                    st.write(f"Available in: {', '.join(info.languages)}")
                 with col2:
-                    if st.button("Start Now", key=f"start_{i}"):
-                        st.session_state.selected_test = i
-                        st.session_state.test_started = True
-                        st.experimental_rerun()
+                    if st.button("Start Now", key=f"start_{info.test_id}"):
+                        st.session_state.ticket = uuid.uuid4().hex
+                        st.session_state.waiting = info
+                        begin_test()
+                        st.rerun()
+
+def begin_test():
+    """Open the chosen test once the admission controller has a slot for this candidate"""
+    admitted, position, eta = admission_control.request(st.session_state.ticket, TOTAL_TIME_LIMIT)
+    if admitted:
+        info = st.session_state.pop('waiting')
+        st.session_state.selected_test = info.test_id
+        st.session_state.attempt = AttemptState(info.questions)
+        st.session_state.test_started = True
+        st.session_state.question_start_time = time.time()
+    return admitted, position, eta
+
+@st.fragment(run_every=admission.WAIT_POLL_SECONDS)
+def waiting_room():
+    """Hold the candidate's place in line, asking again every few seconds"""
+    st.title(st.session_state.waiting.title)
+    admitted, position, eta = begin_test()
+    if admitted:
+        st.rerun()
+    if position is None:
+        st.error("Too many candidates are waiting right now. This page will keep trying.")
+    else:
+        st.info(f"All test slots are taken right now. You are number {position} in line, "
+                f"about {format_time(eta)} to go. Your test will start automatically.")
+    if st.button("Back to Dashboard"):
+        admission_control.release(st.session_state.ticket)
+        del st.session_state.waiting
+        st.rerun()
 
 def test_interface():
     """Handle the test taking interface"""
     st.title("Test Interface")
     
+    # The timer and the question pane are fragments: a click inside them reruns only
+    # that fragment instead of the CSS, sidebar and header of the whole script.
+    # Each counts itself as an in-test run, which is never shed
+    timer_pane()
+    question_pane()
+    
+    # Submit test button
+    if st.button("Submit Test"):
+        submit_test()
+        st.rerun()
+
+@st.fragment
+def timer_pane():
+    """Countdown timer; its expiry event reruns only this fragment"""
+    with admission_control.in_test():
+        update_timer()
+
+def update_timer():
     # Update timer
     current_time = time.time()
     if st.session_state.question_start_time:
         time_elapsed = current_time - st.session_state.question_start_time
         st.session_state.remaining_time = max(0, TOTAL_TIME_LIMIT - time_elapsed)
     
-    # Display timer with color coding
-    timer_color = get_timer_color(st.session_state.remaining_time)
-    timer_html = f"""
-        <div style='text-align: center; color: {timer_color}; 
-            {"animation: blink 1s linear infinite" if timer_color == "red" else ""}'>
-            <h2>⏱️ Time Remaining: {format_time(st.session_state.remaining_time)}</h2>
-        </div>
-    """
-    st.markdown(timer_html, unsafe_allow_html=True)
-    
+    # Display timer with color coding; it ticks in the browser and reruns only at expiry
+    if st.session_state.question_start_time:
+        timer_expired = countdown_timer(
+            st.session_state.question_start_time + TOTAL_TIME_LIMIT, TIMER_THRESHOLDS, key="test_timer"
+        )
+        if timer_expired or st.session_state.remaining_time <= 0:
+            submit_test()
+            st.rerun()
+
+def go_to_question(step):
+    """Move between questions before the question pane is redrawn"""
+    st.session_state.current_question = min(max(0, st.session_state.current_question + step), len(current_questions()) - 1)
+
+@st.fragment
+def question_pane():
+    """Current question, answer options and navigation buttons"""
+    with admission_control.in_test():
+        if not admission_control.heartbeat(st.session_state.ticket):
+            # The slot lapsed while the browser was idle; the test is under way, so it gets one back
+            admission_control.readmit(st.session_state.ticket, TOTAL_TIME_LIMIT)
+        show_question()
+
+def show_question():
     # Display current question
-    current_q = questions[st.session_state.current_question]
-    st.subheader(f"Question {st.session_state.current_question + 1} of {len(questions)}")
-    st.markdown(f"<div class='question-text'>{current_q['question']}</div>", unsafe_allow_html=True)
+    questions = current_questions()
+    number = st.session_state.current_question
+    current_q = questions[number]
+    attempt = st.session_state.attempt
+    attempt.visit(number)
+    st.subheader(f"Question {number + 1} of {len(questions)}")
+    st.markdown(f"<div class='question-text'>{current_q.text}</div>", unsafe_allow_html=True)
     
-    # Answer options
-    answer = st.radio("Select your answer:", current_q["options"], key=f"q_{st.session_state.current_question}")
+    # Answer options; the radio returns the chosen option index, None until one is chosen. It starts
+    # from the stored response, since Streamlit forgets a widget's state once the pane moves on
+    answer = st.radio("Select your answer:", range(len(current_q.options)), format_func=current_q.options.__getitem__,
+                      index=attempt.response(number), key=f"q_{number}")
+    if answer != attempt.response(number):
+        attempt.answer(number, answer)
+    if attempt.is_marked(number):
+        st.caption("🔖 Marked for review")
     
     # Navigation buttons
     col1, col2, col3 = st.columns(3)
     with col1:
-        if st.button("Previous"):
-            st.session_state.current_question = max(0, st.session_state.current_question - 1)
+        st.button("Previous", on_click=go_to_question, args=(-1,))
     with col2:
-        if st.button("Mark for Review"):
-            pass  # Implement marking logic
+        st.button("Mark for Review", on_click=attempt.mark, args=(number, not attempt.is_marked(number)))
     with col3:
-        if st.button("Next"):
-            if st.session_state.current_question < len(questions) - 1:
-                st.session_state.current_question += 1
+        st.button("Next", on_click=go_to_question, args=(1,))
+
+def submit_test():
+    """Handle test submission"""
+    st.session_state.test_complete = True
+    admission_control.release(st.session_state.ticket)
+    final_time = time.time() - st.session_state.question_start_time if st.session_state.question_start_time else 0
+    attempt = st.session_state.attempt
+    st.session_state.score = grading.grade_one(attempt.responses, grading.answer_key(current_questions()),
+                                               MARKING_SCHEME)["score"]
     
-    # Submit test button
-    if st.button("Submit Test"):
-        st.session_state.test_complete = True
-        st.experimental_rerun()
+    # Save user data
+    user_data = {
+        "test_id": st.session_state.selected_test,
+        "name": st.session_state.get('user_name'),
+        "email": st.session_state.get('user_email'),
+        "score": st.session_state.score,
+        "total_questions": len(current_questions()),
+        "completion_time": format_time(min(final_time, TOTAL_TIME_LIMIT)),
+        "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "responses": attempt.responses.tolist()
+    }
+    st.session_state.rank = rank_index.record_attempt(user_data["test_id"], user_data["score"], user_data["completion_time"])
+    save_user_data(user_data)
 
 def main():
     # Initialize session state
@@ -221,7 +318,11 @@ def main():
     """, unsafe_allow_html=True)
     
     # Main application flow
-    if not st.session_state.test_started:
+    if 'waiting' in st.session_state:
+        # Waiting for a test slot; the dashboard is not drawn meanwhile
+        waiting_room()
+    
+    elif not st.session_state.test_started:
         # Show dashboard
         create_dashboard()
         
@@ -238,13 +339,17 @@ def main():
     else:
         # Show results
         st.success("Test Complete! 🎉")
-        st.markdown(f"<p class='score-display'>Final Score: {st.session_state.score}/{len(questions)*CORRECT_MARKS}</p>", 
+        st.markdown(f"<p class='score-display'>Final Score: {st.session_state.score}/{len(current_questions())*CORRECT_MARKS}</p>", 
                    unsafe_allow_html=True)
+        if 'rank' in st.session_state:
+            rank, percentile = st.session_state.rank
+            st.markdown(f"<p class='score-display'>🏆 All India Rank: {rank} (Percentile: {percentile:.1f})</p>", 
+                       unsafe_allow_html=True)
         
         if st.button("Return to Dashboard"):
             for key in st.session_state.keys():
                 del st.session_state[key]
-            st.experimental_rerun()
+            st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
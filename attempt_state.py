@@ -0,0 +1,162 @@
+import struct
+import sys
+import time
+from array import array
+
+import grading
+from facet_index import row_numbers
+
+# Attempt state configuration
+MAX_DWELL_SECONDS = 65535   # dwell times saturate at the array('H') maximum, a little over 18 hours
+BENCH_QUESTIONS = 100       # questions in the benchmarked mock test
+
+# Serialised header: question count, current question (-1 for none), entered_at, started_at
+_HEADER = struct.Struct("<Iidd")
+
+class AttemptState:
+    """One candidate's answers, review marks, visits and time per question, packed
+
+    Questions are numbered from 0. Responses are option indices as the
+    interface shows them, with grading.UNATTEMPTED for unanswered questions,
+    so the responses array can be graded and stored as it is. version is the
+    state backend version this copy was read or last stored at, None until it
+    is first stored; it is not part of the serialised form.
+    """
+    __slots__ = ("responses", "marked", "visited", "dwell", "current", "entered_at", "started_at", "version")
+
+    def __init__(self, questions, started_at=None):
+        self.responses = array("b", [grading.UNATTEMPTED]) * questions
+        self.marked = 0                     # bitset of questions marked for review
+        self.visited = 0                    # bitset of questions opened at least once
+        self.dwell = array("H", [0]) * questions
+        self.current = None                 # question on screen since entered_at
+        self.entered_at = None
+        self.started_at = time.time() if started_at is None else started_at
+        self.version = None
+
+    def __len__(self):
+        return len(self.responses)
+
+    def answer(self, number, option):
+        """Record an option index, or clear the response with None"""
+        self.responses[number] = grading.UNATTEMPTED if option is None else option
+
+    def response(self, number):
+        """The chosen option index, or None when the question is unanswered"""
+        option = self.responses[number]
+        return None if option == grading.UNATTEMPTED else option
+
+    def mark(self, number, marked=True):
+        if marked:
+            self.marked |= 1 << number
+        else:
+            self.marked &= ~(1 << number)
+
+    def is_marked(self, number):
+        return bool(self.marked >> number & 1)
+
+    def visit(self, number, now=None):
+        """Note that a question is on screen, crediting the time since the last call to the previous one
+
+        Call it on every render; repeated calls for the same question keep adding to its dwell time.
+        """
+        now = time.time() if now is None else now
+        if self.current is not None:
+            elapsed = self.dwell[self.current] + int(now - self.entered_at)
+            self.dwell[self.current] = min(elapsed, MAX_DWELL_SECONDS)
+            # Keep the fraction of a second for the next call instead of losing it
+            now -= (now - self.entered_at) % 1
+        self.visited |= 1 << number
+        self.current = number
+        self.entered_at = now
+
+    def is_visited(self, number):
+        return bool(self.visited >> number & 1)
+
+    def marked_questions(self):
+        return row_numbers(self.marked)
+
+    def summary(self):
+        """Question counts for a palette: answered, marked for review, not visited"""
+        answered = sum(1 for option in self.responses if option != grading.UNATTEMPTED)
+        return {
+            "answered": answered,
+            "unanswered": len(self.responses) - answered,
+            "marked": self.marked.bit_count(),
+            "not_visited": len(self.responses) - self.visited.bit_count()
+        }
+
+    def to_bytes(self):
+        """Little-endian snapshot for storing an idle attempt outside memory"""
+        questions = len(self.responses)
+        bitset_bytes = (questions + 7) // 8
+        dwell = array("H", self.dwell)
+        if sys.byteorder == "big":
+            dwell.byteswap()
+        return b"".join([
+            _HEADER.pack(questions, -1 if self.current is None else self.current,
+                         self.entered_at or 0.0, self.started_at),
+            self.responses.tobytes(),
+            self.marked.to_bytes(bitset_bytes, "little"),
+            self.visited.to_bytes(bitset_bytes, "little"),
+            dwell.tobytes()
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        questions, current, entered_at, started_at = _HEADER.unpack_from(data)
+        bitset_bytes = (questions + 7) // 8
+        state = cls(questions, started_at)
+        offset = _HEADER.size
+        state.responses = array("b", data[offset:offset + questions])
+        offset += questions
+        state.marked = int.from_bytes(data[offset:offset + bitset_bytes], "little")
+        offset += bitset_bytes
+        state.visited = int.from_bytes(data[offset:offset + bitset_bytes], "little")
+        offset += bitset_bytes
+        state.dwell = array("H", data[offset:offset + 2 * questions])
+        if sys.byteorder == "big":
+            state.dwell.byteswap()
+        if current >= 0:
+            state.current, state.entered_at = current, entered_at
+        return state
+
+    def nbytes(self):
+        """Memory held by this attempt"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.responses) + sys.getsizeof(self.marked)
+                + sys.getsizeof(self.visited) + sys.getsizeof(self.dwell))
+
+def _deep_size(value, seen=None):
+    """Bytes of a container and everything it holds, counting shared objects once"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key, seen) + _deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item, seen) for item in value)
+    return size
+
+def benchmark(questions=BENCH_QUESTIONS):
+    """Bytes per session for a fully answered, partly marked attempt: per-question dicts versus AttemptState"""
+    # Large numbers so small-int caching doesn't hide the per-session cost of the dict values
+    dicts = {number: {'selected_option': number % 4, 'correct_answer': (number * 7) % 4,
+                      'marked_for_review': number % 5 == 0, 'time_spent': 1000 + number}
+             for number in range(1, questions + 1)}
+    state = AttemptState(questions)
+    now = 0.0
+    for number in range(questions):
+        state.visit(number, now)
+        state.answer(number, number % 4)
+        state.mark(number, number % 5 == 0)
+        now += 37.5
+    state.visit(0, now)
+    return _deep_size(dicts), state.nbytes()
+
+if __name__ == "__main__":
+    for questions in ([int(sys.argv[1])] if len(sys.argv) > 1 else [30, BENCH_QUESTIONS, 200]):
+        dicts, packed = benchmark(questions)
+        print(f"{questions:>4} questions: dicts {dicts:>6} bytes/session, AttemptState {packed:>5} bytes/session "
+              f"({dicts / packed:.0f}x smaller)")
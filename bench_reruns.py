@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+import websockets
+
+# Benchmark configuration
+CLICKS = 50               # timed clicks per run
+START_TIMEOUT = 30        # seconds to wait for the server to come up
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def process_cpu_seconds(pid):
+    """User + system CPU time of a process, read from /proc"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+class Session:
+    """One browser session talking the Streamlit websocket protocol"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.buttons = {}   # label -> (widget id, fragment id)
+
+    async def run(self, widget_id=None, fragment_id=""):
+        """Trigger a rerun (optionally clicking a button) and return the bytes received"""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = ""
+        if widget_id is not None:
+            widget = message.rerun_script.widget_states.widgets.add()
+            widget.id = widget_id
+            widget.trigger_value = True
+        message.rerun_script.fragment_id = fragment_id
+        await self.connection.send(message.SerializeToString())
+
+        received = 0
+        while True:
+            raw = await self.connection.recv()
+            received += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                if element.WhichOneof("type") == "button":
+                    self.buttons[element.button.label] = (element.button.id, forward.delta.fragment_id)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return received
+
+    async def click(self, label):
+        widget_id, fragment_id = self.buttons[label]
+        return await self.run(widget_id, fragment_id)
+
+async def measure(port, pid, setup_clicks, click_label, clicks):
+    async with websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream", max_size=None) as connection:
+        session = Session(connection)
+        await session.run()
+        for label in setup_clicks:
+            await session.click(label)
+            # Navigation buttons call st.rerun(); wait for the follow-up run to settle
+            await session.run()
+
+        cpu_before = process_cpu_seconds(pid)
+        started = time.perf_counter()
+        total_bytes = 0
+        for _ in range(clicks):
+            total_bytes += await session.click(click_label)
+        elapsed = time.perf_counter() - started
+        cpu = process_cpu_seconds(pid) - cpu_before
+    return cpu / clicks * 1000, total_bytes / clicks, elapsed / clicks * 1000
+
+def bench(script, setup_clicks, click_label, clicks):
+    """Start a headless server for script and time clicks on one button"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", script, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false",
+         # The polling file watcher burns CPU on its own and would swamp the per-click numbers
+         "--server.fileWatcherType", "none"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + START_TIMEOUT
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"{script} did not start")
+                time.sleep(0.2)
+        return asyncio.run(measure(port, server.pid, setup_clicks, click_label, clicks))
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-click server CPU time and payload bytes of a Streamlit script")
+    parser.add_argument("scripts", nargs="+", help="scripts to compare, e.g. a before and an after version")
+    parser.add_argument("--setup", action="append", default=[], help="button labels clicked before timing")
+    parser.add_argument("--click", default="Next", help="button label clicked repeatedly")
+    parser.add_argument("--clicks", type=int, default=CLICKS)
+    args = parser.parse_args()
+
+    print(f"{'script':<30} {'cpu ms/click':>14} {'bytes/click':>12} {'wall ms/click':>14}")
+    for script in args.scripts:
+        cpu_ms, payload, wall_ms = bench(script, args.setup, args.click, args.clicks)
+        print(f"{script:<30} {cpu_ms:>14.2f} {payload:>12.0f} {wall_ms:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import os
+import time
+
+import streamlit.components.v1 as components
+
+# Countdown timer configuration
+DEADLINE_TOLERANCE = 1e-3   # seconds; an expiry event for a deadline this close is for this deadline
+
+_component = components.declare_component(
+    "countdown_timer",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "countdown_frontend")
+)
+
+def countdown_timer(deadline, thresholds, messages=None, key=None):
+    """Count down to an absolute deadline (epoch seconds) in the browser; True once it has passed"""
+    # thresholds are seconds remaining per level: 'critical' red blinking, 'warning' red,
+    # 'caution' orange. The browser ticks on its own and reruns the script only at expiry.
+    expired_deadline = _component(
+        deadline=deadline,
+        server_now=time.time(),
+        thresholds=thresholds,
+        messages=messages or {},
+        key=key,
+        default=None
+    )
+    # Compared with a tolerance: an older frontend echoes the deadline back through milliseconds
+    return expired_deadline is not None and abs(expired_deadline - deadline) < DEADLINE_TOLERANCE
@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+class DeadlineScheduler:
+    """Min-heap of deadlines serviced by a single timer thread"""
+    def __init__(self):
+        self._heap = []                  # [deadline, sequence, key, callback] entries
+        self._entries = {}               # key -> live heap entry
+        self._cancelled = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, key, deadline, callback):
+        """Run callback on the timer thread at deadline (epoch seconds), replacing any earlier entry for key"""
+        with self._condition:
+            self._cancel(key)
+            entry = [deadline, next(self._sequence), key, callback]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+                self._thread.start()
+            # Only a new earliest deadline needs to wake the timer thread early
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def cancel(self, key):
+        """Forget the deadline for key, if any"""
+        with self._condition:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        # Lazy deletion: the entry stays in the heap with no callback and is skipped
+        entry[3] = None
+        self._cancelled += 1
+        if self._cancelled > 1024 and self._cancelled > len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e[3] is not None]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def pending(self):
+        """Number of live deadlines"""
+        with self._condition:
+            return len(self._entries)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    while self._heap and self._heap[0][3] is None:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                _, _, key, callback = heapq.heappop(self._heap)
+                del self._entries[key]
+
+            # Callbacks run outside the lock so they may schedule or cancel deadlines
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Process-wide scheduler shared by every session"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DeadlineScheduler()
+        return _scheduler
@@ -0,0 +1,228 @@
+import re
+import sys
+import time
+import unicodedata
+
+import numpy as np
+
+# Near-duplicate detection configuration
+BANDS = 16                # LSH bands; BANDS * ROWS hash functions in each signature
+ROWS = 8                  # rows per band: pairs above ~(1/BANDS)**(1/ROWS) = 0.71 similarity usually collide
+THRESHOLD = 0.8           # Jaccard similarity of word bigrams at which two questions count as duplicates
+BENCH_QUESTIONS = 100000  # bank size used by the benchmark
+
+_rng = np.random.default_rng(20240901)
+# Multiply-shift hashing: odd 64-bit multipliers, uint64 arithmetic wraps mod 2**64
+_A = _rng.integers(0, 2**63, size=BANDS * ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2**63, size=BANDS * ROWS, dtype=np.uint64)
+_BAND_MIX = _rng.integers(0, 2**63, size=ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_CHUNK = 20000            # texts hashed per batch, bounding temporary arrays
+_END = ""                 # closes every text so one-word texts still have a bigram
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+def normalize(text):
+    """Case, width, punctuation and whitespace differences don't make a question new"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _NON_WORD.sub(" ", text).strip()
+
+def question_text(question):
+    """Text compared for duplicates: stem and options in any order"""
+    return row_text(question.stem, question.options)
+
+def row_text(stem, options):
+    """question_text for a question not compiled yet, as the importer holds them"""
+    return normalize(" ".join([stem, *sorted(map(str, options))]))
+
+def question_context(question):
+    """Questions only duplicate each other when they also share the passage they ask about"""
+    return normalize(question.passage.text) if question.passage else ""
+
+def shingles(text):
+    """Word bigrams of a normalised text"""
+    words = text.split() + [_END]
+    return set(zip(words, words[1:])) if len(words) > 1 else {(_END, _END)}
+
+def signatures(texts, vocabulary=None):
+    """MinHash signatures over word bigrams, one row of BANDS * ROWS minimum hashes per text
+
+    Signatures are comparable only within one vocabulary; pass the same dict
+    (starting as {_END: 0}) to compare texts signed in separate calls.
+    """
+    result = np.empty((len(texts), BANDS * ROWS), dtype=np.uint64)
+    vocabulary = {_END: 0} if vocabulary is None else vocabulary
+    for first in range(0, len(texts), _CHUNK):
+        chunk = texts[first:first + _CHUNK]
+        words, lengths = [], []
+        for text in chunk:
+            ids = [vocabulary.setdefault(word, len(vocabulary)) for word in text.split()]
+            words.extend(ids)
+            words.append(0)
+            lengths.append(len(ids) + 1)
+        words = np.array(words, dtype=np.uint64)
+        lengths = np.array(lengths, dtype=np.int64)
+        # A bigram packs two word ids into one integer; the pair spanning two texts is skipped
+        codes = (words[:-1] << np.uint64(32)) | words[1:]
+        counts = np.maximum(lengths - 1, 1)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        positions = np.minimum(np.arange(counts.sum()) + np.repeat(starts - offsets, counts), len(codes) - 1)
+        codes = codes[positions] if len(codes) else np.zeros(len(chunk), dtype=np.uint64)
+        for k in range(BANDS * ROWS):
+            hashes = (codes * _A[k] + _B[k]) >> np.uint64(32)
+            result[first:first + len(chunk), k] = np.minimum.reduceat(hashes, offsets)
+    return result
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def find_duplicates(texts, contexts=None, threshold=THRESHOLD):
+    """Groups of indices whose texts are near-duplicates, each group in input order
+
+    Only texts sharing an LSH bucket (and an equal context, when given) are
+    compared, so the cost grows with the number of texts rather than pairs.
+    """
+    parents = list(range(len(texts)))
+    shingle_sets = {}
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def similar(i, j):
+        # Candidates are verified on exact shingle sets, built only for texts that collide
+        for k in (i, j):
+            if k not in shingle_sets:
+                shingle_sets[k] = shingles(texts[k])
+        return jaccard(shingle_sets[i], shingle_sets[j]) >= threshold
+
+    if not texts:
+        return []
+    # One key per band; folding in the context keeps different passages in different buckets
+    keys = (signatures(texts).reshape(len(texts), BANDS, ROWS) * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+    if contexts is not None:
+        context_ids = {}
+        salt = np.array([context_ids.setdefault(context, len(context_ids)) for context in contexts], dtype=np.uint64)
+        keys ^= (salt * np.uint64(0x9E3779B97F4A7C15))[:, None]
+    for band in range(BANDS):
+        order = np.argsort(keys[:, band], kind="stable")
+        ordered = keys[order, band]
+        run_starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+        run_ends = np.append(run_starts[1:], len(order))
+        for start, end in zip(run_starts[run_ends - run_starts > 1], run_ends[run_ends - run_starts > 1]):
+            members = order[start:end].tolist()
+            for j in members[1:]:
+                if root(j) != root(members[0]) and similar(members[0], j):
+                    parents[root(j)] = root(members[0])
+
+    groups = {}
+    for i in range(len(texts)):
+        groups.setdefault(root(i), []).append(i)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
+
+class DuplicateIndex:
+    """Near-duplicate lookup that grows a batch at a time, for appending to an existing test
+
+    Keeps each added text and its LSH band keys rather than the questions
+    themselves, so a caller can stream candidates through it.
+    """
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self._texts = []
+        self._buckets = {}       # (band, key, context id) -> indices of added texts
+        self._contexts = {}      # context -> id; only texts with the same context are compared
+        self._vocabulary = {_END: 0}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, texts, contexts):
+        """For each text in order: the index of an earlier near-duplicate, or None once it is added"""
+        if not texts:
+            return []
+        keys = (signatures(texts, self._vocabulary).reshape(len(texts), BANDS, ROWS) * _BAND_MIX).sum(
+            axis=2, dtype=np.uint64).tolist()
+        matches = []
+        for text, context, row in zip(texts, contexts, keys):
+            context_id = self._contexts.setdefault(context, len(self._contexts))
+            buckets = [(band, key, context_id) for band, key in enumerate(row)]
+            candidates = sorted({i for bucket in buckets for i in self._buckets.get(bucket, ())})
+            text_shingles = shingles(text)
+            match = next((i for i in candidates
+                          if jaccard(shingles(self._texts[i]), text_shingles) >= self.threshold), None)
+            if match is None:
+                for bucket in buckets:
+                    self._buckets.setdefault(bucket, []).append(len(self._texts))
+                self._texts.append(text)
+            matches.append(match)
+        return matches
+
+def dedupe(questions, threshold=THRESHOLD):
+    """Keep the first of every group of near-duplicate questions
+
+    Returns the kept questions and a {dropped index: kept index} map for reporting.
+    """
+    dropped = {}
+    texts = [question_text(q) for q in questions]
+    for group in find_duplicates(texts, [question_context(q) for q in questions], threshold):
+        for index in group[1:]:
+            dropped[index] = group[0]
+    return [q for i, q in enumerate(questions) if i not in dropped], dropped
+
+def scan_bank():
+    """Near-duplicate groups across every test in the bank, as lists of (test_id, question number)"""
+    import question_bank
+    refs, texts, contexts = [], [], []
+    for info in question_bank.catalog():
+        for number, question in enumerate(question_bank.read_test(info.test_id).questions, 1):
+            refs.append((info.test_id, number))
+            texts.append(question_text(question))
+            contexts.append(question_context(question))
+    return [[refs[i] for i in group] for group in find_duplicates(texts, contexts)]
+
+def _bench_texts(count, duplicate_rate=0.05, seed=0):
+    """Synthetic question texts, a share of them lightly edited copies of earlier ones"""
+    rng = np.random.default_rng(seed)
+    words = ["train", "speed", "pole", "average", "number", "series", "sequence", "symbol", "consonant",
+             "vowel", "profit", "loss", "ratio", "interest", "percentage", "work", "days", "pipe", "tank",
+             "boat", "stream", "age", "father", "son", "circle", "area", "perimeter", "angle", "code"]
+    texts, originals = [], {}
+    for n in range(count):
+        if n > 10 and rng.random() < duplicate_rate:
+            source = int(rng.integers(0, n))
+            tokens = texts[source].split()
+            # Copy-paste drift: change case or swap one word
+            tokens[int(rng.integers(0, len(tokens)))] = str(rng.choice(words)).upper()
+            texts.append(" ".join(tokens))
+            originals[n] = source
+        else:
+            tokens = list(rng.choice(words, size=int(rng.integers(20, 40))))
+            tokens += [str(value) for value in rng.integers(0, 1000, size=4)]
+            texts.append(" ".join(tokens))
+    return [normalize(text) for text in texts], originals
+
+def benchmark(count=BENCH_QUESTIONS):
+    """Time and recall of find_duplicates on a synthetic bank with planted duplicates"""
+    texts, originals = _bench_texts(count)
+    started = time.perf_counter()
+    groups = find_duplicates(texts)
+    elapsed = time.perf_counter() - started
+    group_of = {i: g for g, group in enumerate(groups) for i in group}
+    planted = [(copy, source) for copy, source in originals.items()
+               if jaccard(shingles(texts[copy]), shingles(texts[source])) >= THRESHOLD]
+    found = sum(1 for copy, source in planted if copy in group_of and group_of[copy] == group_of.get(source))
+    return elapsed, len(planted), found, len(groups)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        for count in ([int(sys.argv[2])] if len(sys.argv) > 2 else [BENCH_QUESTIONS // 4, BENCH_QUESTIONS // 2, BENCH_QUESTIONS]):
+            elapsed, planted, found, groups = benchmark(count)
+            print(f"{count:>7} questions: {elapsed:6.2f}s, found {found}/{planted} planted near-duplicates, {groups} groups")
+    else:
+        groups = scan_bank()
+        for group in groups:
+            print("Near-duplicates: " + ", ".join(f"{test_id} Q{number}" for test_id, number in group))
+        print(f"{len(groups)} near-duplicate groups in the bank")
+        sys.exit(1 if groups else 0)
@@ -0,0 +1,139 @@
+import random
+import sys
+import time
+from collections import namedtuple
+
+# Benchmark configuration
+BENCH_ROWS = 100000      # catalogue size used by the benchmark
+BENCH_QUERIES = 1000     # timed queries per filter combination
+
+class FacetIndex:
+    """Inverted indexes from facet values to bitsets of row numbers"""
+    def __init__(self, rows, facets):
+        # facets maps a facet name to the row attribute holding its value, or a list of values
+        self.rows = tuple(rows)
+        self.facets = dict(facets)
+        self._all = (1 << len(self.rows)) - 1
+        numbers = {facet: {} for facet in self.facets}
+        for number, row in enumerate(self.rows):
+            for facet, attribute in self.facets.items():
+                values = getattr(row, attribute)
+                if isinstance(values, (str, int)) or values is None:
+                    values = (values,)
+                for value in values:
+                    numbers[facet].setdefault(value, []).append(number)
+        self._postings = {
+            facet: {value: _bitset(members, len(self.rows)) for value, members in postings.items()}
+            for facet, postings in numbers.items()
+        }
+
+    def values(self, facet):
+        """Distinct values of a facet, for building filter widgets"""
+        return sorted(value for value in self._postings[facet] if value is not None)
+
+    def match(self, **filters):
+        """Bitset of rows matching every filter; None means any value, a list means any of them"""
+        bits = self._all
+        # Narrowest posting first so the running intersection shrinks fastest
+        for postings in sorted(self._filter_postings(filters), key=int.bit_count):
+            bits &= postings
+            if not bits:
+                break
+        return bits
+
+    def _filter_postings(self, filters):
+        for facet, wanted in filters.items():
+            if wanted is None:
+                continue
+            postings = self._postings[facet]
+            if isinstance(wanted, (list, tuple, set)):
+                union = 0
+                for value in wanted:
+                    union |= postings.get(value, 0)
+                yield union
+            else:
+                yield postings.get(wanted, 0)
+
+    def count(self, **filters):
+        return self.match(**filters).bit_count()
+
+    def select(self, limit=None, **filters):
+        """Rows matching every filter, in catalogue order"""
+        return [self.rows[number] for number in row_numbers(self.match(**filters), limit)]
+
+def _bitset(numbers, size):
+    """Build a bitset in one pass; or-ing bits into a growing int would be quadratic"""
+    buffer = bytearray((size + 7) // 8)
+    for number in numbers:
+        buffer[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(buffer, "little")
+
+def row_numbers(bits, limit=None):
+    """Set bit positions of a bitset, lowest first"""
+    digits = bin(bits)[:1:-1]   # least significant bit first
+    numbers = []
+    position = digits.find("1")
+    while position != -1 and (limit is None or len(numbers) < limit):
+        numbers.append(position)
+        position = digits.find("1", position + 1)
+    return numbers
+
+BenchRow = namedtuple("BenchRow", ["subject", "section", "languages", "difficulty", "test_type"])
+
+def benchmark(rows=BENCH_ROWS, queries=BENCH_QUERIES):
+    """Mean milliseconds per combined filter over a synthetic question catalogue"""
+    rng = random.Random(0)
+    sections = {
+        "Quantitative Aptitude": ["Arithmetic", "Algebra", "Geometry", "Statistics"],
+        "Logical Reasoning": ["Series", "Coding-Decoding", "Data Sufficiency", "Puzzles"],
+        "Verbal Ability": ["Vocabulary", "Grammar", "Comprehension"],
+        "Data Analysis": ["Tables", "Charts"]
+    }
+    catalogue = []
+    for _ in range(rows):
+        subject = rng.choice(list(sections))
+        catalogue.append(BenchRow(
+            subject=subject,
+            section=rng.choice(sections[subject]),
+            languages=rng.choice([("English",), ("English", "Telugu")]),
+            difficulty=rng.choice(["Easy", "Medium", "Hard"]),
+            test_type=rng.choice(["Full Length", "Sectional", "Topic Wise"])
+        ))
+    started = time.perf_counter()
+    index = FacetIndex(catalogue, {"subject": "subject", "section": "section", "language": "languages",
+                                   "difficulty": "difficulty", "test_type": "test_type"})
+    build_ms = (time.perf_counter() - started) * 1000
+
+    combinations = {
+        "language": {"language": "Telugu"},
+        "subject + language": {"subject": "Logical Reasoning", "language": "Telugu"},
+        "all five facets": {"subject": "Quantitative Aptitude", "section": "Algebra", "language": "Telugu",
+                            "difficulty": "Hard", "test_type": "Sectional"},
+        "five facets + first page": {"subject": "Quantitative Aptitude", "section": "Algebra",
+                                     "language": "Telugu", "difficulty": "Hard", "test_type": "Sectional",
+                                     "limit": 20}
+    }
+    results = []
+    for label, filters in combinations.items():
+        limit = filters.pop("limit", None)
+        expected = [row for row in catalogue
+                    if all(value in (row.languages if facet == "language" else (getattr(row, facet),))
+                           for facet, value in filters.items())]
+        started = time.perf_counter()
+        for _ in range(queries):
+            if limit is None:
+                matched = index.count(**filters)
+            else:
+                matched = len(index.select(limit, **filters))
+        elapsed_ms = (time.perf_counter() - started) * 1000 / queries
+        assert matched == (len(expected) if limit is None else min(limit, len(expected)))
+        assert index.select(limit, **filters) == expected[:limit]
+        results.append((label, matched, elapsed_ms))
+    return build_ms, results
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else BENCH_ROWS
+    build_ms, results = benchmark(rows)
+    print(f"Indexed {rows} questions in {build_ms:.0f} ms")
+    for label, matched, elapsed_ms in results:
+        print(f"{label:<26} {matched:>7} rows {elapsed_ms:>8.4f} ms/query")
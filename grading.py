@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Response encoding: option index per question, UNATTEMPTED where nothing was chosen
+UNATTEMPTED = -1
+
+MarkingScheme = namedtuple("MarkingScheme", ["correct", "wrong", "unattempted"], defaults=[0])
+
+ICET_SCHEME = MarkingScheme(correct=4, wrong=-1)           # icet_app3 / icet_app5
+APTITUDE_SCHEME = MarkingScheme(correct=2, wrong=-0.5)     # trivia / trivia3
+PLAIN_SCHEME = MarkingScheme(correct=1, wrong=0)           # onlinetest / AdariInstituteApp
+
+def answer_key(questions):
+    """Answer key for a list of question_bank Questions"""
+    return [q.answer for q in questions]
+
+def grade(responses, answer_key, scheme, attempted=None):
+    """Grade a cohort at once from a candidates x questions matrix of option indices"""
+    # Skipped questions are UNATTEMPTED unless an explicit attempted mask is given,
+    # which lets value-graded tests (numeric answers) use any response values
+    responses = np.atleast_2d(np.asarray(responses))
+    answer_key = np.asarray(answer_key)
+    if attempted is None:
+        attempted = responses != UNATTEMPTED
+    else:
+        attempted = np.atleast_2d(np.asarray(attempted, dtype=bool))
+
+    correct = (attempted & (responses == answer_key)).sum(axis=1)
+    attempted_count = attempted.sum(axis=1)
+    incorrect = attempted_count - correct
+    unattempted = responses.shape[1] - attempted_count
+    score = correct * scheme.correct + incorrect * scheme.wrong + unattempted * scheme.unattempted
+    accuracy = np.divide(correct * 100.0, attempted_count,
+                         out=np.zeros(len(correct)), where=attempted_count > 0)
+    return {
+        'correct': correct,
+        'incorrect': incorrect,
+        'unattempted': unattempted,
+        'score': score,
+        'accuracy': accuracy
+    }
+
+def grade_one(responses, answer_key, scheme, attempted=None):
+    """Grade a single candidate and return plain Python numbers"""
+    if attempted is not None:
+        attempted = [attempted]
+    results = grade([responses], answer_key, scheme, attempted)
+    return {name: values[0].item() for name, values in results.items()}
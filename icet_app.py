@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
+import question_bank
+from attempt_state import AttemptState
+
+# Test configuration
+SAMPLE_QUESTION_COUNT = 30   # questions in the sample test interface
 
 def create_test_app():
     st.set_page_config(page_title="Adari Institute - ICET Test Series", layout="wide")
@@ -39,25 +44,32 @@ def create_test_app():
         # Filter options
         col1, col2 = st.columns(2)
         with col1:
-            st.selectbox("Select Subject", ["All Subjects", "Quantitative Aptitude", "Verbal Ability", "Logical Reasoning"])
+            selected_subject = st.selectbox("Select Subject", ["All Subjects", "Quantitative Aptitude", "Verbal Ability", "Logical Reasoning"])
         with col2:
-            st.selectbox("Language", ["English", "Telugu"])
+            selected_language = st.selectbox("Language", ["English", "Telugu"])
             
-        # Test Cards
-        for i in range(3):
+        # Test Cards, filtered through the catalogue's inverted indexes
+        tests = question_bank.catalog_index().select(
+            exam="ICET",
+            section=selected_section,
+            subject=None if selected_subject == "All Subjects" else selected_subject,
+            language=selected_language
+        )
+        if not tests:
+            st.info(f"No {selected_section} tests in {selected_language} yet")
+        for i, info in enumerate(tests):
             with st.container():
                 st.markdown("---")
                 col1, col2 = st.columns([3,1])
                 with col1:
                     if i == 0:
-                        st.markdown("### 🆓 Introduction to ICET")
+                        st.markdown(f"### 🆓 {info.title}")
                     else:
-                        st.markdown(f"### Test {i+1}: Advanced Concepts")
-                    st.write(f"👥 {1000 + i*500} Users")
-                    st.write(f"⏱️ 30 Questions | 30 Minutes | 30 Marks")
-                    st.write("Available in: English, Telugu")
+                        st.markdown(f"### Test {i+1}: {info.title}")
+                    st.write(f"⏱️ {info.questions} Questions | 30 Minutes | {info.questions} Marks")
+                    st.write(f"Available in: {', '.join(info.languages)}")
                 with col2:
-                    st.button("Start Now", key=f"start_{i}")
+                    st.button("Start Now", key=f"start_{info.test_id}")
                     
         # Why Take This Series section
         st.sidebar.markdown("## Why Take this Series?")
@@ -71,8 +83,8 @@ def create_test_app():
 def initialize_session_state():
     if 'current_question' not in st.session_state:
         st.session_state.current_question = 1
-    if 'answers' not in st.session_state:
-        st.session_state.answers = {}
+    if 'attempt' not in st.session_state:
+        st.session_state.attempt = AttemptState(SAMPLE_QUESTION_COUNT)
     if 'timer' not in st.session_state:
         st.session_state.timer = datetime.now() + timedelta(minutes=30)
 
@@ -91,6 +103,7 @@ def test_interface():
     # Options
     options = ['Option A', 'Option B', 'Option C', 'Option D']
     selected_option = st.radio("Select your answer:", options, key=f"q_{st.session_state.current_question}")
+    st.session_state.attempt.visit(st.session_state.current_question - 1)
     
     # Navigation buttons
     col1, col2, col3 = st.columns(3)
@@ -99,10 +112,11 @@ def test_interface():
             st.session_state.current_question = max(1, st.session_state.current_question - 1)
     with col2:
         if st.button("Mark for Review"):
-            st.session_state.answers[st.session_state.current_question] = {'answer': selected_option, 'marked': True}
+            st.session_state.attempt.answer(st.session_state.current_question - 1, options.index(selected_option))
+            st.session_state.attempt.mark(st.session_state.current_question - 1)
     with col3:
         if st.button("Next"):
-            st.session_state.current_question = min(30, st.session_state.current_question + 1)
+            st.session_state.current_question = min(SAMPLE_QUESTION_COUNT, st.session_state.current_question + 1)
 
 def main():
     initialize_session_state()
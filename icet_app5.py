@@ -3,38 +3,27 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import plotly.express as px
+import secrets
+import grading
+import papers
+from attempt_state import AttemptState
+import question_bank
 
-# Sample questions data
-SAMPLE_QUESTIONS = {
-    1: {
-        "question": "If A can do a work in 15 days and B in 20 days, in how many days can they do it together?",
-        "options": ["8.57 days", "9.57 days", "10.57 days", "11.57 days"],
-        "correct_answer": 0,
-        "explanation": "Using the formula: (a×b)/(a+b) = (15×20)/(15+20) = 300/35 = 8.57 days"
-    },
-    2: {
-        "question": "The average of first 50 natural numbers is:",
-        "options": ["25.30", "25.40", "25.50", "25.60"],
-        "correct_answer": 2,
-        "explanation": "Sum of first n natural numbers = n(n+1)/2. Here n=50, so average = 50×51/(2×50) = 25.50"
-    },
-    3: {
-        "question": "A train running at the speed of 60 km/hr crosses a pole in 9 seconds. What is the length of the train?",
-        "options": ["120 meters", "140 meters", "150 meters", "160 meters"],
-        "correct_answer": 2,
-        "explanation": "Speed = 60 km/hr = 16.67 m/s. Length = Speed × Time = 16.67 × 9 = 150 meters"
-    },
-}
+# Sample questions data, keyed by question number, from the question bank cache
+SAMPLE_QUESTIONS = question_bank.load_test("icet-sample").numbered
 
 def initialize_session_state():
     if 'current_question' not in st.session_state:
         st.session_state.current_question = 1
-    if 'answers' not in st.session_state:
-        st.session_state.answers = {}
+    if 'attempt' not in st.session_state:
+        st.session_state.attempt = AttemptState(len(SAMPLE_QUESTIONS))
     if 'start_time' not in st.session_state:
         st.session_state.start_time = datetime.now()
     if 'end_time' not in st.session_state:
         st.session_state.end_time = st.session_state.start_time + timedelta(minutes=30)
+    if 'option_ranks' not in st.session_state:
+        # One 2-byte option order rank per question instead of shuffled option lists
+        st.session_state.option_ranks = papers.option_ranks(secrets.token_hex(8), SAMPLE_QUESTIONS.values())
 
 def test_interface():
     initialize_session_state()
@@ -50,18 +39,21 @@ def test_interface():
 
     with st.container():
         st.markdown(f"### Question {st.session_state.current_question}")
-        st.write(question_data["question"])
+        st.write(question_data.text)
+        # Options appear in this attempt's shuffled order; answers are kept as shown positions
+        number = st.session_state.current_question - 1
+        st.session_state.attempt.visit(number)
+        rank = st.session_state.option_ranks[number]
+        options = papers.shuffled(question_data.options, rank)
         selected_option = st.radio(
             "Select your answer:",
-            question_data["options"],
+            range(len(options)),
+            format_func=options.__getitem__,
             key=f"q_{st.session_state.current_question}"
         )
 
-        if selected_option:
-            st.session_state.answers[st.session_state.current_question] = {
-                'selected_option': question_data["options"].index(selected_option),
-                'correct_answer': question_data["correct_answer"]
-            }
+        if selected_option is not None:
+            st.session_state.attempt.answer(number, selected_option)
 
     col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
 
@@ -72,10 +64,7 @@ def test_interface():
 
     with col2:
         if st.button("Mark for Review"):
-            if st.session_state.current_question not in st.session_state.answers:
-                st.session_state.answers[st.session_state.current_question] = {
-                    'marked_for_review': True
-                }
+            st.session_state.attempt.mark(st.session_state.current_question - 1)
 
     with col3:
         if st.button("Next") and st.session_state.current_question < len(SAMPLE_QUESTIONS):
@@ -86,28 +75,20 @@ def test_interface():
         if st.button("Submit Test"):
             show_results()
 
+def original_answer(q_num):
+    """The bank option index chosen for a question, undoing this attempt's option shuffle"""
+    selected = st.session_state.attempt.response(q_num - 1)
+    if selected is None:
+        return grading.UNATTEMPTED
+    rank = st.session_state.option_ranks[q_num - 1]
+    return papers.to_original(rank, len(SAMPLE_QUESTIONS[q_num].options), selected)
+
 def calculate_results():
-    correct = 0
-    incorrect = 0
-    unattempted = 0
-
-    for q_num in range(1, len(SAMPLE_QUESTIONS) + 1):
-        if q_num in st.session_state.answers:
-            if 'selected_option' in st.session_state.answers[q_num]:
-                if st.session_state.answers[q_num]['selected_option'] == SAMPLE_QUESTIONS[q_num]['correct_answer']:
-                    correct += 1
-                else:
-                    incorrect += 1
-        else:
-            unattempted += 1
-
-    return {
-        'correct': correct,
-        'incorrect': incorrect,
-        'unattempted': unattempted,
-        'score': correct * 4 - incorrect,  # 4 marks for correct, -1 for incorrect
-        'accuracy': (correct / (correct + incorrect)) * 100 if (correct + incorrect) > 0 else 0
-    }
+    # Encode this session as one row of the answer matrix and grade it with the shared engine
+    question_numbers = range(1, len(SAMPLE_QUESTIONS) + 1)
+    responses = [original_answer(q_num) for q_num in question_numbers]
+    answer_key = [SAMPLE_QUESTIONS[q_num].answer for q_num in question_numbers]
+    return grading.grade_one(responses, answer_key, grading.ICET_SCHEME)  # 4 marks for correct, -1 for incorrect
 
 def show_results():
     st.session_state.test_completed = True
@@ -126,18 +107,18 @@ def show_results():
 
     for q_num, q_data in SAMPLE_QUESTIONS.items():
         with st.expander(f"Question {q_num}"):
-            st.write(q_data["question"])
-            st.write("Correct Answer:", q_data["options"][q_data["correct_answer"]])
-            if q_num in st.session_state.answers and 'selected_option' in st.session_state.answers[q_num]:
-                selected = st.session_state.answers[q_num]['selected_option']
-                st.write("Your Answer:", q_data["options"][selected])
-                if selected == q_data["correct_answer"]:
+            st.write(q_data.text)
+            st.write("Correct Answer:", q_data.correct_option)
+            if st.session_state.attempt.response(q_num - 1) is not None:
+                selected = original_answer(q_num)
+                st.write("Your Answer:", q_data.options[selected])
+                if selected == q_data.answer:
                     st.success("Correct! +4 marks")
                 else:
                     st.error("Incorrect! -1 mark")
             else:
                 st.warning("Not attempted")
-            st.write("Explanation:", q_data["explanation"])
+            st.write("Explanation:", q_data.solution)
 
     chart_data = pd.DataFrame({
         'Category': ['Correct', 'Incorrect', 'Unattempted'],
@@ -156,7 +137,7 @@ def main():
     else:
         show_results()
         if st.button("Start New Test"):
-            for key in ['current_question', 'answers', 'start_time', 'end_time', 'test_completed']:
+            for key in ['current_question', 'attempt', 'start_time', 'end_time', 'option_ranks', 'test_completed']:
                 if key in st.session_state:
                     del st.session_state[key]
             st.experimental_rerun()
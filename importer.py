@@ -0,0 +1,316 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import dedup
+import question_bank
+
+# Importer configuration
+CHUNK_ROWS = 2000         # rows validated per worker task
+MIN_OPTIONS = 2
+MAX_OPTIONS = 6
+MAX_TEXT_LENGTH = 5000    # characters in a question, option or solution
+BENCH_ROWS = 100000       # rows in the generated benchmark file
+
+_TEST_ID = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+def _clean_text(value, field):
+    """NFC-normalised, stripped text, rejecting mis-decoded or control characters"""
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be text")
+    value = unicodedata.normalize("NFC", value).strip()
+    if not value:
+        raise ValueError(f"{field} is empty")
+    if "�" in value:
+        raise ValueError(f"{field} is not valid UTF-8")
+    if _CONTROL.search(value):
+        raise ValueError(f"{field} contains control characters")
+    if len(value) > MAX_TEXT_LENGTH:
+        raise ValueError(f"{field} is longer than {MAX_TEXT_LENGTH} characters")
+    return value
+
+def _row_options(row):
+    """Options from a JSON list or from option_1, option_2, ... CSV columns"""
+    options = row.get("options")
+    if options is None:
+        numbered = sorted((int(key[len("option_"):]), value) for key, value in row.items()
+                          if key and key.startswith("option_") and key[len("option_"):].isdigit())
+        options = [value for _, value in numbered if value not in (None, "")]
+    if not isinstance(options, list):
+        raise ValueError("options must be a list")
+    return options
+
+def validate_row(row):
+    """Turn one imported row into (test_id, bank question), or raise ValueError"""
+    # Rows that failed to parse (bad JSON) carry the reason along
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    test_id = (row.get("test_id") or "").strip()
+    if not _TEST_ID.match(test_id):
+        raise ValueError(f"test_id {test_id!r} must be lowercase letters, digits and hyphens")
+    question = {"question": _clean_text(row.get("question"), "question")}
+
+    options = [_clean_text(option, f"option {n}") for n, option in enumerate(_row_options(row), 1)]
+    if options:
+        if not MIN_OPTIONS <= len(options) <= MAX_OPTIONS:
+            raise ValueError(f"{len(options)} options, expected {MIN_OPTIONS} to {MAX_OPTIONS}")
+        if len(set(options)) != len(options):
+            raise ValueError("options are not unique")
+        answer = row.get("correct_answer")
+        # String form (trivia.py) names the option; index form (icet_app3.py) counts from 0
+        if isinstance(answer, str) and unicodedata.normalize("NFC", answer).strip() in options:
+            answer = options.index(unicodedata.normalize("NFC", answer).strip())
+        elif isinstance(answer, int) or (isinstance(answer, str) and answer.strip().isdigit()):
+            answer = int(answer)
+            if not 0 <= answer < len(options):
+                raise ValueError(f"correct_answer index {answer} is out of range for {len(options)} options")
+        else:
+            raise ValueError(f"correct_answer {answer!r} is not one of the options")
+        question["options"] = options
+        question["correct_answer"] = answer
+    else:
+        # Open-answer questions (onlinetest.py) are graded by value
+        answer = row.get("answer")
+        try:
+            question["answer"] = answer if isinstance(answer, (int, float)) else float(answer)
+        except (TypeError, ValueError):
+            raise ValueError("a question without options needs a numeric answer")
+        if float(question["answer"]).is_integer():
+            question["answer"] = int(question["answer"])
+
+    for field in ("passage", "solution", "section", "difficulty"):
+        if row.get(field) not in (None, ""):
+            question[field] = _clean_text(row[field], field)
+    return test_id, question
+
+def _validate_chunk(chunk):
+    """Worker task: validate (line, row) pairs, returning (line, test_id, question, error)"""
+    results = []
+    for line, row in chunk:
+        try:
+            test_id, question = validate_row(row)
+            results.append((line, test_id, question, None))
+        except (ValueError, AttributeError) as error:
+            results.append((line, None, None, str(error)))
+    return results
+
+def read_rows(path):
+    """Stream (line number, row dict) pairs from a CSV or JSON-lines file"""
+    # Undecodable bytes become U+FFFD so the row is rejected instead of the whole file
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as error:
+                    row = {"_error": f"invalid JSON: {error}"}
+                yield line, row if isinstance(row, dict) else {"_error": "row is not a JSON object"}
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _validated(paths, workers):
+    """Validation results in file order, with a bounded number of chunks in flight"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            for chunk in _chunks(read_rows(path), CHUNK_ROWS):
+                pending.append((path, pool.submit(_validate_chunk, chunk)))
+                if len(pending) >= 2 * workers:
+                    done_path, future = pending.popleft()
+                    yield done_path, future.result()
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+def _dump_shard(data, question_lines, f):
+    """Indented header with one compact question per line: readable, and far faster than indent=4"""
+    f.write("{\n")
+    for key, value in data.items():
+        f.write(f"    {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+    f.write('    "questions": [')
+    separator = "\n"
+    for line in question_lines:
+        f.write(separator + "        " + line)
+        separator = ",\n"
+    f.write("\n    ]\n}\n")
+
+def _write_shard(test_id, spool_path, header):
+    """Append the spooled rows to a test's shard, dropping near-duplicates of questions already there
+
+    Existing questions keep their numbers, since stored responses are graded by
+    position. Spooled rows are checked CHUNK_ROWS at a time and streamed to a
+    temporary file, so memory follows the shard being appended to rather than
+    the size of the import.
+    """
+    path = question_bank.test_path(test_id)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        data = dict(header, test_id=test_id, title=header.get("title") or test_id, questions=[])
+    existing = data.pop("questions")
+    passages = data.pop("passages", {})
+    passage_ids = {text: passage_id for passage_id, text in passages.items()}
+
+    index = dedup.DuplicateIndex()
+    # Questions already in the shard are never dropped, even if they duplicate each other
+    index.add([dedup.row_text(q["question"], q.get("options", ())) for q in existing],
+              [dedup.normalize(passages.get(q.get("passage"), "")) for q in existing])
+    added = dropped = 0
+    kept_path = spool_path + ".kept"
+    with open(spool_path, "r", encoding="utf-8") as spool, open(kept_path, "w", encoding="utf-8") as kept:
+        for chunk in _chunks((json.loads(line) for line in spool), CHUNK_ROWS):
+            matches = index.add([dedup.row_text(q["question"], q.get("options", ())) for q in chunk],
+                                [dedup.normalize(q.get("passage", "")) for q in chunk])
+            for question, match in zip(chunk, matches):
+                if match is not None:
+                    dropped += 1
+                    continue
+                # Rows carry passage text; the shard stores each passage once and refers to it by id
+                text = question.pop("passage", None)
+                if text is not None:
+                    if text not in passage_ids:
+                        passage_ids[text] = f"p{len(passage_ids) + 1}"
+                        passages[passage_ids[text]] = text
+                    question["passage"] = passage_ids[text]
+                kept.write(json.dumps(question, ensure_ascii=False) + "\n")
+                added += 1
+    if passages:
+        data["passages"] = passages
+
+    with open(kept_path, "r", encoding="utf-8") as kept, open(path + ".tmp", "w", encoding="utf-8") as f:
+        lines = itertools.chain((json.dumps(q, ensure_ascii=False) for q in existing),
+                                (line.rstrip("\n") for line in kept))
+        _dump_shard(data, lines, f)
+    os.replace(path + ".tmp", path)
+    os.remove(kept_path)
+    return len(existing) + added, dropped
+
+def import_files(paths, header=None, errors=None, workers=None):
+    """Import question files into the bank and return (imported, rejected, duplicates) counts"""
+    header = header or {}
+    imported = rejected = 0
+    spool_dir = tempfile.mkdtemp(prefix="question-import-")
+    writer = csv.writer(errors) if errors is not None else None
+    if writer is not None:
+        writer.writerow(["file", "line", "error"])
+    try:
+        spooled = set()
+        for path, results in _validated(paths, workers or os.cpu_count()):
+            # Accepted rows are spooled per test so memory stays flat however large the file
+            by_test = {}
+            for line, test_id, question, error in results:
+                if error is not None:
+                    rejected += 1
+                    if writer is not None:
+                        writer.writerow([path, line, error])
+                else:
+                    by_test.setdefault(test_id, []).append(json.dumps(question, ensure_ascii=False))
+            for test_id, lines in by_test.items():
+                with open(os.path.join(spool_dir, f"{test_id}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                spooled.add(test_id)
+                imported += len(lines)
+
+        duplicates = 0
+        for test_id in sorted(spooled):
+            _, dropped = _write_shard(test_id, os.path.join(spool_dir, f"{test_id}.jsonl"), header)
+            duplicates += dropped
+        if spooled:
+            question_bank.build_catalog()
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return imported - duplicates, rejected, duplicates
+
+def write_bench_file(path, rows=BENCH_ROWS, tests=100):
+    """Synthetic CSV with one malformed row in a hundred"""
+    import random
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["test_id", "question", "option_1", "option_2", "option_3", "option_4",
+                         "correct_answer", "solution"])
+        for n in range(rows):
+            a, b = rng.randint(1, 10**6), rng.randint(1, 10**6)
+            options = [str(a + b + delta) for delta in (0, 1, -1, 10)]
+            rng.shuffle(options)
+            answer = str(a + b) if n % 2 else options.index(str(a + b))
+            if n % 100 == 99:
+                answer = "not an option"
+            writer.writerow([f"bench-{n % tests}", f"Question {n}: what is {a} + {b}?", *options,
+                             answer, f"{a} + {b} = {a + b}"])
+
+def benchmark(rows=BENCH_ROWS):
+    """Import a generated CSV into a scratch bank and return (seconds, summary line)"""
+    import subprocess
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "questions.csv")
+        bank_dir = os.path.join(directory, "bank")
+        os.mkdir(bank_dir)
+        write_bench_file(source, rows)
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), source, "--errors", os.path.join(directory, "errors.csv")],
+            env=dict(os.environ, QUESTION_BANK_DIR=bank_dir), check=True, capture_output=True, text=True
+        ).stdout
+        return time.perf_counter() - started, output.strip()
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_ROWS
+        elapsed, summary = benchmark(rows)
+        print(f"{rows} rows end to end in {elapsed:.1f}s: {summary}")
+        return
+    parser = argparse.ArgumentParser(description="Import questions from CSV or JSON-lines files into the bank")
+    parser.add_argument("files", nargs="+", help="CSV (option_1.. columns) or .jsonl files")
+    parser.add_argument("--title", help="title for newly created tests")
+    parser.add_argument("--subject")
+    parser.add_argument("--exam", default="ICET")
+    parser.add_argument("--test-type", default="Sectional", choices=["Full Length", "Sectional", "Topic Wise"])
+    parser.add_argument("--difficulty", default="Medium")
+    parser.add_argument("--language", action="append", help="language of new tests (repeatable)")
+    parser.add_argument("--errors", help="CSV file for per-row errors (default: stderr)")
+    parser.add_argument("--workers", type=int, help="validation processes (default: CPU count)")
+    args = parser.parse_args()
+
+    header = {
+        "title": args.title, "subject": args.subject, "exam": args.exam, "test_type": args.test_type,
+        "difficulty": args.difficulty, "languages": args.language or ["English"]
+    }
+    errors = open(args.errors, "w", newline="", encoding="utf-8") if args.errors else sys.stderr
+    started = time.perf_counter()
+    try:
+        imported, rejected, duplicates = import_files(args.files, header, errors, args.workers)
+    finally:
+        if args.errors:
+            errors.close()
+    print(f"Imported {imported} questions into {question_bank.BANK_DIR} in {time.perf_counter() - started:.1f}s "
+          f"({rejected} rows rejected, {duplicates} near-duplicates dropped)")
+
+if __name__ == "__main__":
+    main()
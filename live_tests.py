@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import deadline_scheduler
+import grading
+import papers
+import question_bank
+import rank_index
+import results_db
+import session_store
+import submission_queue
+
+# Live test configuration
+SCHEDULE_FILE = "live_tests.json"   # [{"live_id", "test_id", "title", "starts_at": ISO local time, "minutes"}]
+PREWARM_LEAD = 120                  # seconds before T-0 that registration closes and every paper is assembled
+ADMISSION_RATE = 500                # candidates admitted per second from T-0...
+MAX_ADMISSION_WINDOW = 20           # ...spread over at most this many seconds
+BENCH_CANDIDATES = 2000             # registrants in the start spike benchmark
+BENCH_THREADS = 32                  # script runs the benchmark serves at once
+
+# Admission states for a candidate
+UNREGISTERED = "unregistered"
+WAITING = "waiting"                 # registered, not admitted yet
+OPEN = "open"                       # may start or continue until the common end
+ENDED = "ended"
+
+LiveTest = namedtuple("LiveTest", ["live_id", "test_id", "title", "starts_at", "ends_at"])
+
+def attempt_id(live_id, candidate):
+    """Session store key of a candidate's live attempt"""
+    return f"{candidate}:live:{live_id}"
+
+def _admission_fraction(live_id, candidate):
+    """Where in the admission window a candidate falls, fixed and evenly spread over candidates"""
+    digest = hashlib.blake2b(f"{live_id}\x00{candidate}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 64
+
+class LiveSchedule:
+    """Scheduled live tests: registration, a common start and end, pre-warming and staggered admission
+
+    Times are enforced here on the server, never by the browser. Each
+    candidate is admitted at a fixed offset after T-0 so a full registration
+    list arrives over the admission window instead of in the same second,
+    and every registrant's paper is assembled PREWARM_LEAD seconds early.
+    With a scheduler those steps and the close at the end run on time;
+    without one the caller runs prewarm() and close() itself.
+
+    Registrations live in the session store's backend beside the attempts, so
+    with a shared state server every worker sees the same registration list.
+    """
+    def __init__(self, path=SCHEDULE_FILE, store=None, scheduler=None, admission_rate=ADMISSION_RATE):
+        self.path = path
+        self.store = store if store is not None else session_store.get_store()
+        self.admission_rate = admission_rate
+        self._scheduler = scheduler
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._tests = {}
+        self._papers = {}     # live_id -> {candidate: Paper}, assembled by prewarm
+        self._windows = {}    # live_id -> admission window in seconds, fixed once registration closes
+        self.prewarm_seconds = {}
+
+    def tests(self):
+        """Scheduled live tests in start order, rereading the schedule file when it changes"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+            return sorted(self._tests.values(), key=lambda test: test.starts_at)
+
+    def _load(self, mtime):
+        tests = {}
+        if mtime is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for entry in json.load(f):
+                    starts_at = datetime.fromisoformat(entry["starts_at"]).timestamp()
+                    tests[entry["live_id"]] = LiveTest(
+                        live_id=entry["live_id"],
+                        test_id=entry["test_id"],
+                        title=entry.get("title", entry["test_id"]),
+                        starts_at=starts_at,
+                        ends_at=starts_at + entry["minutes"] * 60
+                    )
+        if self._scheduler is not None:
+            for live_id, test in tests.items():
+                if self._tests.get(live_id) != test:
+                    self._schedule(test)
+            for live_id in set(self._tests) - set(tests):
+                self._scheduler.cancel(f"live:{live_id}:prewarm")
+                self._scheduler.cancel(f"live:{live_id}:close")
+        for live_id in set(self._tests) - set(tests):
+            self._papers.pop(live_id, None)
+        self._tests, self._mtime = tests, mtime
+
+    def _schedule(self, test):
+        # Pre-warming and closing run on threads of their own to keep the timer thread free
+        def in_background(target, name):
+            return lambda: threading.Thread(target=target, args=(test.live_id,), name=name, daemon=True).start()
+        self._scheduler.schedule(f"live:{test.live_id}:prewarm", test.starts_at - PREWARM_LEAD,
+                                 in_background(self.prewarm, "live-prewarm"))
+        self._scheduler.schedule(f"live:{test.live_id}:close", test.ends_at,
+                                 in_background(self.close, "live-close"))
+
+    def get(self, live_id):
+        self.tests()
+        with self._lock:
+            return self._tests.get(live_id)
+
+    def registration_open(self, test, now=None):
+        now = time.time() if now is None else now
+        return now < test.starts_at - PREWARM_LEAD
+
+    def register(self, live_id, candidate, name=None, email=None, now=None):
+        """Add a candidate, with the name and email their result is filed under; False once registration has closed"""
+        now = time.time() if now is None else now
+        test = self.get(live_id)
+        if test is None or not self.registration_open(test, now):
+            return False
+        self.store.backend.register_live(live_id, candidate, now, name, email)
+        return True
+
+    def _window(self, test):
+        """Seconds over which registrants are admitted, from the size of the closed registration list"""
+        with self._lock:
+            window = self._windows.get(test.live_id)
+        if window is None:
+            registrants = len(self.store.backend.live_registrants(test.live_id))
+            window = min(MAX_ADMISSION_WINDOW, registrants / self.admission_rate)
+            with self._lock:
+                self._windows[test.live_id] = window
+        return window
+
+    def admission(self, live_id, candidate, now=None):
+        """(state, seconds): until admission while WAITING, until the common end while OPEN"""
+        now = time.time() if now is None else now
+        test = self.get(live_id)
+        if test is None or now >= test.ends_at:
+            return ENDED, 0
+        if self.store.backend.live_registration(live_id, candidate) is None:
+            return UNREGISTERED, max(0, test.starts_at - now)
+        if self.registration_open(test, now):
+            return WAITING, test.starts_at - now
+        admit_at = test.starts_at + _admission_fraction(live_id, candidate) * self._window(test)
+        if now < admit_at:
+            return WAITING, admit_at - now
+        return OPEN, test.ends_at - now
+
+    def prewarm(self, live_id):
+        """Load everything a first question needs before T-0: the test, catalogue, rank index and papers"""
+        started = time.perf_counter()
+        test = self.get(live_id)
+        if test is None:
+            return
+        bank_test = question_bank.load_test(test.test_id)
+        question_bank.catalog_index()
+        rank_index.get_index(live_id)
+        self._window(test)
+        assembled = {candidate: papers.build_paper(candidate, test.test_id, live_id, test=bank_test)
+                     for candidate in self.store.backend.live_registrants(live_id)}
+        with self._lock:
+            self._papers[live_id] = assembled
+            self.prewarm_seconds[live_id] = time.perf_counter() - started
+
+    def paper(self, live_id, candidate):
+        """The candidate's paper: pre-assembled, or built now if this process missed the pre-warm"""
+        with self._lock:
+            paper = self._papers.get(live_id, {}).get(candidate)
+        if paper is None:
+            paper = papers.get_paper(candidate, self.get(live_id).test_id, live_id)
+        return paper
+
+    def start(self, live_id, candidate):
+        """Open or resume the candidate's attempt once admitted; None while they wait or after the end"""
+        if self.admission(live_id, candidate)[0] != OPEN:
+            return None
+        return self.store.open(attempt_id(live_id, candidate), len(self.paper(live_id, candidate).questions))
+
+    def submit(self, live_id, candidate, name=None, email=None):
+        """Grade and record the candidate's attempt once; (score, maximum, rank) or None if already submitted
+
+        A name or email not given is the one the candidate registered with.
+        """
+        test = self.get(live_id)
+        key = attempt_id(live_id, candidate)
+        attempt = self.store.get(key)
+        if attempt is None or not self.store.finish(key):
+            return None
+        if name is None or email is None:
+            registered = self.store.backend.live_registration(live_id, candidate) or (None, None)
+            name, email = name or registered[0], email or registered[1]
+        paper = self.paper(live_id, candidate)
+        # Responses are positions as shown; grade and store them as bank option indices
+        responses = []
+        for number in range(len(attempt)):
+            shown = attempt.response(number)
+            responses.append(grading.UNATTEMPTED if shown is None else papers.original_option(paper, number, shown))
+        results = grading.grade_one(responses, grading.answer_key(paper.questions), grading.ICET_SCHEME)
+        elapsed = max(0, min(time.time(), test.ends_at) - max(attempt.started_at, test.starts_at))
+        completion_time = f"{int(elapsed // 60):02d}:{int(elapsed % 60):02d}"
+        submission_queue.submit({
+            "test_id": live_id,
+            "name": name,
+            "email": email,
+            "score": results['score'],
+            "total_questions": len(paper.questions),
+            "completion_time": completion_time,
+            "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "responses": responses
+        })
+        rank = rank_index.record_attempt(live_id, results['score'], completion_time)
+        return results['score'], len(paper.questions) * grading.ICET_SCHEME.correct, rank
+
+    def close(self, live_id):
+        """At the common end, submit every attempt still open, whether or not its tab is"""
+        for candidate, (name, email) in self.store.backend.live_registrants(live_id).items():
+            self.submit(live_id, candidate, name, email)
+        with self._lock:
+            self._papers.pop(live_id, None)
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+def get_schedule():
+    """The process-wide schedule; reading it once arms the pre-warm and close deadlines"""
+    global _schedule
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = LiveSchedule(scheduler=deadline_scheduler.get_scheduler())
+            _schedule.tests()
+        return _schedule
+
+def _first_question(schedule, live_id, candidate):
+    """What a candidate's first run after Start does: admission, the attempt, the paper and question 1"""
+    attempt = schedule.start(live_id, candidate)
+    paper = schedule.paper(live_id, candidate)
+    question_bank.load_test(paper.test_id)
+    attempt.visit(0)
+    papers.shown_options(paper, 0)
+    schedule.store.save(attempt_id(live_id, candidate), attempt)
+
+def _latencies(schedule, live_id, arrivals, threads):
+    """First-question latency in ms for candidates arriving at offsets (seconds) from now, queueing included"""
+    from concurrent.futures import ThreadPoolExecutor
+    origin = time.perf_counter() + 0.05
+
+    def serve(candidate, arrival):
+        delay = origin + arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        _first_question(schedule, live_id, candidate)
+        return (time.perf_counter() - origin - arrival) * 1000
+
+    with ThreadPoolExecutor(threads) as pool:
+        futures = [pool.submit(serve, candidate, arrival)
+                   for candidate, arrival in sorted(arrivals.items(), key=lambda item: item[1])]
+        return sorted(future.result() for future in futures)
+
+def benchmark(candidates=BENCH_CANDIDATES, threads=BENCH_THREADS, questions=100):
+    """First-question latency for a cold start spike, a pre-warmed staggered one, and a quiet period"""
+    import tempfile
+    import sequence_questions
+    import state_backend
+    with tempfile.TemporaryDirectory() as directory:
+        # Everything, bank included, lives in the temporary directory
+        question_bank.BANK_DIR = directory
+        results_db.DB_FILE = os.path.join(directory, results_db.DB_FILE)
+        with open(os.path.join(directory, "live-bench.json"), "w", encoding="utf-8") as f:
+            json.dump(sequence_questions.generate_test("live-bench", questions // 5), f)
+        question_bank.build_catalog()
+        store = session_store.SessionStore(state_backend.LocalBackend(os.path.join(directory, "sessions.db")))
+        schedule_path = os.path.join(directory, SCHEDULE_FILE)
+        starts_at = datetime.fromtimestamp(int(time.time()))
+        with open(schedule_path, "w", encoding="utf-8") as f:
+            json.dump([{"live_id": live_id, "test_id": "live-bench", "starts_at": starts_at.isoformat(),
+                        "minutes": 60} for live_id in ("cold", "warm", "quiet")], f)
+        roster = [f"candidate-{n}" for n in range(candidates)]
+        for live_id in ("cold", "warm", "quiet"):
+            for candidate in roster:
+                store.backend.register_live(live_id, candidate, 0)
+
+        # Cold: nothing loaded, everyone admitted at T-0
+        cold = LiveSchedule(schedule_path, store, admission_rate=float("inf"))
+        cold_ms = _latencies(cold, "cold", dict.fromkeys(roster, 0.0), threads)
+
+        # Pre-warmed, with candidates admitted at their offsets over the window
+        warm = LiveSchedule(schedule_path, store)
+        warm.prewarm("warm")
+        test = warm.get("warm")
+        window = warm._window(test)
+        warm_ms = _latencies(warm, "warm", {candidate: _admission_fraction("warm", candidate) * window
+                                             for candidate in roster}, threads)
+
+        # Quiet period: candidates arriving one at a time, 20 ms apart
+        quiet = LiveSchedule(schedule_path, store)
+        quiet.prewarm("quiet")
+        quiet_ms = _latencies(quiet, "quiet", {candidate: n * 0.02 for n, candidate in enumerate(roster[:200])},
+                              threads)
+        store.close()
+        return window, warm.prewarm_seconds["warm"], {"cold spike": cold_ms, "pre-warmed, staggered": warm_ms,
+                                                      "quiet period": quiet_ms}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if command == "schedule":
+        # live_tests.py schedule <live_id> <test_id> <starts_at ISO> <minutes> [title]
+        live_id, test_id, starts_at, minutes = sys.argv[2:6]
+        entries = []
+        if os.path.exists(SCHEDULE_FILE):
+            with open(SCHEDULE_FILE, "r", encoding="utf-8") as f:
+                entries = [entry for entry in json.load(f) if entry["live_id"] != live_id]
+        entries.append({"live_id": live_id, "test_id": test_id, "title": sys.argv[6] if len(sys.argv) > 6 else test_id,
+                        "starts_at": datetime.fromisoformat(starts_at).isoformat(), "minutes": int(minutes)})
+        with open(SCHEDULE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=4, ensure_ascii=False)
+            f.write("\n")
+        os.replace(SCHEDULE_FILE + ".tmp", SCHEDULE_FILE)
+        print(f"Scheduled {live_id} ({test_id}) at {starts_at} for {minutes} minutes")
+    else:
+        candidates = int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_CANDIDATES
+        window, prewarm_s, runs = benchmark(candidates)
+        print(f"{candidates} registrants; pre-warm took {prewarm_s:.2f}s, admission window {window:.1f}s")
+        for name, timings in runs.items():
+            print(f"{name:>22}: first question median {timings[len(timings) // 2]:.2f} ms, "
+                  f"p99 {timings[int(len(timings) * 0.99)]:.2f} ms")
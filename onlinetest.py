@@ -1,5 +1,7 @@
 import streamlit as st
 import time
+import grading
+import question_bank
 
 def main():
     st.sidebar.image("logo.png", width=100)
@@ -22,28 +24,22 @@ def login():
         st.session_state.name = name
         st.success(f"Welcome {name}!")
 
+# Question bank test behind each series in the sidebar
+TEST_SERIES = {
+    "Test Series 1": "online-test-series-1",
+    "Test Series 2": "online-test-series-2",
+    "Test Series 3": "online-test-series-3"
+}
+
 def display_test_series():
     st.sidebar.header("Available Test Series")
-    test_series = ["Test Series 1", "Test Series 2", "Test Series 3"]
+    test_series = list(TEST_SERIES)
     selected_series = st.sidebar.selectbox("Select a Test Series", test_series)
     if selected_series:
         start_test(selected_series)
 
 def start_test(test_name):
-    questions = {
-        "Test Series 1": [
-            {"question": "What is 2 + 2?", "answer": 4},
-            {"question": "What is 3 + 5?", "answer": 8}
-        ],
-        "Test Series 2": [
-            {"question": "What is 10 - 4?", "answer": 6},
-            {"question": "What is 7 + 2?", "answer": 9}
-        ],
-        "Test Series 3": [
-            {"question": "What is 5 * 3?", "answer": 15},
-            {"question": "What is 6 / 2?", "answer": 3}
-        ]
-    }
+    questions = question_bank.load_test(TEST_SERIES[test_name]).questions
     
     total_time = 30 * 60  # 30 minutes in seconds
     if f'{test_name}_start_time' not in st.session_state:
@@ -53,7 +49,7 @@ def start_test(test_name):
 
     if time_left <= 0:
         st.warning("Time's up! Submitting the test...")
-        calculate_score(test_name, questions[test_name])
+        calculate_score(test_name, questions)
         return
 
     st.subheader(f"{test_name}")
@@ -64,37 +60,39 @@ def start_test(test_name):
         st.session_state.current_question = 0
         st.session_state.answers = {}
 
-    current_q = questions[test_name][st.session_state.current_question]
+    current_q = questions[st.session_state.current_question]
 
-    st.write(current_q['question'])
+    st.write(current_q.text)
     user_answer = st.number_input("Your answer", step=1, format="%d")
 
     if st.button("Previous") and st.session_state.current_question > 0:
         st.session_state.current_question -= 1
 
-    if st.button("Next") and st.session_state.current_question < len(questions[test_name]) - 1:
+    if st.button("Next") and st.session_state.current_question < len(questions) - 1:
         st.session_state.answers[st.session_state.current_question] = user_answer
         st.session_state.current_question += 1
 
     if st.button("Submit Test"):
         st.session_state.answers[st.session_state.current_question] = user_answer
-        calculate_score(test_name, questions[test_name])
+        calculate_score(test_name, questions)
 
 def calculate_score(test_name, questions):
-    score = 0
-    correct = 0
-    incorrect = 0
     solutions = []
+    responses = []
+    attempted = []
 
     for idx, q in enumerate(questions):
-        correct_answer = q['answer']
+        correct_answer = q.answer
         user_answer = st.session_state.answers.get(idx, None)
-        solutions.append((q['question'], correct_answer, user_answer))
-        if user_answer == correct_answer:
-            score += 1
-            correct += 1
-        else:
-            incorrect += 1
+        solutions.append((q.text, correct_answer, user_answer))
+        responses.append(user_answer if user_answer is not None else 0)
+        attempted.append(user_answer is not None)
+
+    # Numeric answers are graded by value, with an explicit mask for unanswered questions
+    results = grading.grade_one(responses, grading.answer_key(questions), grading.PLAIN_SCHEME, attempted)
+    score = results['score']
+    correct = results['correct']
+    incorrect = results['incorrect'] + results['unattempted']
 
     st.success(f"Test Completed: {test_name}")
     st.info(f"Your Score: {score}/{len(questions)}")
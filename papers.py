@@ -0,0 +1,159 @@
+import hashlib
+import itertools
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+import question_bank
+
+# Paper assembly configuration
+PAPER_CACHE_SIZE = 4096   # assembled papers kept in memory; the least recently used is rebuilt on demand
+RANK_TYPECODE = "H"       # option order ranks are 2 bytes, enough for up to MAX_SHUFFLED_OPTIONS options
+MAX_SHUFFLED_OPTIONS = 8  # 8! = 40320 orders
+BENCH_CANDIDATES = 10000  # candidates in the benchmark
+
+# numbers are 1-based question numbers in the test; questions are the shared bank Questions,
+# and option_ranks[i] is the Lehmer rank of the order in which the i-th question's options are shown
+Paper = namedtuple("Paper", ["candidate", "test_id", "seed", "numbers", "questions", "option_ranks"])
+
+_lock = threading.Lock()
+_papers = OrderedDict()   # (candidate, test_id, seed, size) -> (Test, Paper), least recently used first
+_tables = {}              # option count -> (orders by rank, their inverses)
+
+def _draws(key):
+    """Endless 64-bit integers fixed by key alone, so papers rebuild identically on any Python or NumPy"""
+    block = 0
+    while True:
+        digest = hashlib.blake2b(key + block.to_bytes(8, "little"), digest_size=64).digest()
+        for offset in range(0, 64, 8):
+            yield int.from_bytes(digest[offset:offset + 8], "little")
+        block += 1
+
+def _shuffle(items, draws):
+    """Fisher-Yates shuffle driven by draws"""
+    items = list(items)
+    for i in range(len(items) - 1, 0, -1):
+        j = next(draws) % (i + 1)
+        items[i], items[j] = items[j], items[i]
+    return items
+
+def permutation_rank(order):
+    """Lehmer code of an order of range(n), read as a factorial-base number: its lexicographic rank"""
+    rank = 0
+    for i, value in enumerate(order):
+        smaller_later = sum(1 for later in order[i + 1:] if later < value)
+        rank += smaller_later * math.factorial(len(order) - 1 - i)
+    return rank
+
+def _permutation_table(count):
+    """Every order of count options by rank, with its inverse, built once per option count"""
+    table = _tables.get(count)
+    if table is None:
+        # itertools.permutations yields lexicographic order, which is rank order
+        orders = list(itertools.permutations(range(count)))
+        inverses = [tuple(sorted(range(count), key=order.__getitem__)) for order in orders]
+        table = _tables.setdefault(count, (orders, inverses))
+    return table
+
+def permutation(rank, count):
+    """The order of count options with the given rank: order[shown] is the original option index"""
+    return _permutation_table(count)[0][rank]
+
+def to_original(rank, count, shown):
+    """Original option index of the option displayed at position shown, in O(1)"""
+    return _permutation_table(count)[0][rank][shown]
+
+def to_shown(rank, count, original):
+    """Position at which an original option is displayed, in O(1)"""
+    return _permutation_table(count)[1][rank][original]
+
+def shuffled(options, rank):
+    """Options in the order a rank displays them"""
+    return [options[original] for original in permutation(rank, len(options))]
+
+def _ranks(questions, draws):
+    ranks = array(RANK_TYPECODE)
+    for question in questions:
+        count = len(question.options)
+        if count > MAX_SHUFFLED_OPTIONS:
+            raise ValueError(f"cannot shuffle {count} options, at most {MAX_SHUFFLED_OPTIONS}")
+        ranks.append(next(draws) % math.factorial(count))
+    return ranks
+
+def option_ranks(key, questions):
+    """Packed per-question option order ranks for an attempt, fixed by key"""
+    return _ranks(questions, _draws(str(key).encode()))
+
+def build_paper(candidate, test_id, seed, size=None, test=None):
+    """Assemble a candidate's paper: which questions (in bank order) and how their options are ordered"""
+    test = test or question_bank.load_test(test_id)
+    draws = _draws(f"{candidate}\x00{test_id}\x00{seed}".encode())
+    numbers = sorted(_shuffle(test.numbered, draws)[:size])
+    questions = tuple(test.numbered[number] for number in numbers)
+    return Paper(
+        candidate=candidate,
+        test_id=test_id,
+        seed=seed,
+        numbers=tuple(numbers),
+        questions=questions,
+        option_ranks=_ranks(questions, draws)
+    )
+
+def get_paper(candidate, test_id, seed, size=None):
+    """The candidate's paper, assembled on first use and cached until its test changes"""
+    key = (candidate, test_id, seed, size)
+    test = question_bank.load_test(test_id)
+    with _lock:
+        cached = _papers.get(key)
+        if cached is not None and cached[0] is test:
+            _papers.move_to_end(key)
+            return cached[1]
+    paper = build_paper(candidate, test_id, seed, size, test)
+    with _lock:
+        _papers[key] = (test, paper)
+        _papers.move_to_end(key)
+        while len(_papers) > PAPER_CACHE_SIZE:
+            _papers.popitem(last=False)
+    return paper
+
+def shown_options(paper, index):
+    """Options of the paper's index-th question in the order the candidate sees them"""
+    return shuffled(paper.questions[index].options, paper.option_ranks[index])
+
+def original_option(paper, index, shown):
+    """Bank option index of the option displayed at position shown, for grading"""
+    return to_original(paper.option_ranks[index], len(paper.questions[index].options), shown)
+
+def benchmark(candidates=BENCH_CANDIDATES, test_id="aptitude-reasoning"):
+    """Microseconds per paper: assembling it versus a cached rerun"""
+    started = time.perf_counter()
+    papers = [build_paper(f"candidate-{n}", test_id, 1) for n in range(candidates)]
+    build_us = (time.perf_counter() - started) * 1e6 / candidates
+    for n in range(min(candidates, PAPER_CACHE_SIZE)):
+        get_paper(f"candidate-{n}", test_id, 1)
+    started = time.perf_counter()
+    for n in range(min(candidates, PAPER_CACHE_SIZE)):
+        get_paper(f"candidate-{n}", test_id, 1)
+    cached_us = (time.perf_counter() - started) * 1e6 / min(candidates, PAPER_CACHE_SIZE)
+    assert build_paper("candidate-0", test_id, 1) == papers[0]
+    distinct = len({paper.option_ranks.tobytes() for paper in papers})
+    return build_us, cached_us, distinct
+
+def session_bytes(questions=100, options=4):
+    """Bytes an attempt holds for its option order: shuffled option lists versus packed ranks"""
+    texts = [f"Option {n}" for n in range(options)]
+    lists = [list(reversed(texts)) for _ in range(questions)]
+    ranks = array(RANK_TYPECODE, [permutation_rank(range(options - 1, -1, -1))] * questions)
+    # The option strings themselves are shared with the bank either way
+    return sys.getsizeof(lists) + sum(sys.getsizeof(options) for options in lists), sys.getsizeof(ranks)
+
+if __name__ == "__main__":
+    candidates = int(sys.argv[1]) if len(sys.argv) > 1 else BENCH_CANDIDATES
+    build_us, cached_us, distinct = benchmark(candidates)
+    print(f"{candidates} candidates: assembled in {build_us:.1f} us/paper, cached rerun {cached_us:.1f} us/paper, "
+          f"{distinct} distinct option orders")
+    lists, ranks = session_bytes()
+    print(f"100-question attempt: shuffled option lists {lists} bytes, packed ranks {ranks} bytes")
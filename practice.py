@@ -0,0 +1,46 @@
+import streamlit as st
+
+import question_bank
+import search_index
+
+# Practice configuration
+RESULTS_PER_SEARCH = 10
+
+def practice_panel(key="practice"):
+    """Keyword search over the question bank with instant answer checking"""
+    query = st.text_input("Search questions", placeholder="e.g. train crosses pole, average natural numbers",
+                          key=f"{key}_query")
+    if not query.strip():
+        st.write("Search the question bank by keyword to practice any topic.")
+        return
+
+    hits = search_index.search(query, RESULTS_PER_SEARCH)
+    if not hits:
+        st.info(f"No questions match '{query}'")
+        return
+
+    for hit in hits:
+        try:
+            test = question_bank.load_test(hit.test_id)
+        except FileNotFoundError:
+            continue  # the test was removed since the index last checked the bank
+        question = test.numbered.get(hit.number)
+        if question is None:
+            continue  # the shard was rewritten with fewer questions; the index catches up on its next check
+        with st.expander(f"{test.title} - Question {hit.number}"):
+            st.write(question.text)
+            widget_key = f"{key}_{hit.test_id}_{hit.number}"
+            if question.options:
+                answer = st.radio("Select your answer:", range(len(question.options)), index=None,
+                                  format_func=question.options.__getitem__, key=widget_key)
+            else:
+                answer = st.number_input("Your answer", step=1, value=None, key=widget_key)
+            if st.button("Check Answer", key=f"{widget_key}_check"):
+                if answer is None:
+                    st.warning("Choose an answer first")
+                elif answer == question.answer:
+                    st.success("Correct! 🎉")
+                else:
+                    st.error(f"Wrong! The correct answer was {question.correct_option}")
+                if question.solution:
+                    st.markdown(f"**{question.solution}**")
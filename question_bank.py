@@ -0,0 +1,341 @@
+import json
+import os
+import sys
+import threading
+import traceback
+import weakref
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+from facet_index import FacetIndex
+
+# Question bank configuration: one shard file per test plus a catalogue manifest
+BANK_DIR = os.environ.get("QUESTION_BANK_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_banks"))
+CATALOG_FILE = "catalog.json"
+CACHE_SIZE = 32           # tests kept in memory; the least recently opened is evicted
+PREFETCH_COUNT = 8        # most popular tests loaded in the background at startup
+BENCH_QUESTIONS = 50000   # bank size used by the memory benchmark
+
+# numbered maps 1-based question numbers to questions, as the ICET apps index them
+Test = namedtuple("Test", ["test_id", "title", "subject", "questions", "numbered"])
+
+# Catalogue entry: everything the dashboards list or filter on without opening the shard
+TestInfo = namedtuple("TestInfo", ["test_id", "title", "exam", "test_type", "subject", "sections",
+                                   "languages", "difficulties", "questions"])
+
+# Filter name -> TestInfo field for the catalogue's inverted indexes
+CATALOG_FACETS = {
+    "exam": "exam",
+    "test_type": "test_type",
+    "subject": "subject",
+    "section": "sections",
+    "language": "languages",
+    "difficulty": "difficulties"
+}
+
+_lock = threading.Lock()
+_cache = OrderedDict()                   # test_id -> (mtime, Test), least recently opened first
+_catalog = (None, (), None)              # (mtime, entries, FacetIndex)
+_passages = weakref.WeakValueDictionary()  # "test_id:passage" -> Passage, while any question cites it
+_prefetch_thread = None
+
+class Passage:
+    """Stimulus text shared by every question of a reading set"""
+    __slots__ = ("passage_id", "text", "__weakref__")
+
+    def __init__(self, passage_id, text):
+        self.passage_id = passage_id
+        self.text = text
+
+class Question:
+    """One question: the answer is an option index and options/passages are shared, not copied"""
+    __slots__ = ("stem", "options", "answer", "passage", "solution")
+
+    def __init__(self, stem, options, answer, passage=None, solution=None):
+        set_slot = object.__setattr__
+        set_slot(self, "stem", stem)
+        set_slot(self, "options", options)
+        set_slot(self, "answer", answer)       # option index, or the expected value when there are no options
+        set_slot(self, "passage", passage)
+        set_slot(self, "solution", solution)
+
+    def __setattr__(self, name, value):
+        # Questions are shared by every session in the process
+        raise AttributeError("questions are read-only")
+
+    @property
+    def passage_id(self):
+        return self.passage.passage_id if self.passage else None
+
+    @property
+    def text(self):
+        """Stem with its passage in front, as shown to the candidate"""
+        return f"{self.passage.text}\n\n{self.stem}" if self.passage else self.stem
+
+    @property
+    def correct_option(self):
+        """The correct option text, or the expected value for open-answer questions"""
+        return self.options[self.answer] if self.options else self.answer
+
+def _intern_options(options, option_sets):
+    # Strings are interned process-wide; identical option tuples are shared within a shard
+    # so evicting a shard releases its tuples
+    options = tuple(sys.intern(option) for option in options)
+    return option_sets.setdefault(options, options)
+
+def _compile_question(data, passages, option_sets):
+    options = _intern_options(data.get("options", ()), option_sets)
+    if options:
+        answer = data["correct_answer"]
+        if not isinstance(answer, int):
+            answer = options.index(answer)
+    else:
+        answer = data["answer"]
+    return Question(data["question"], options, answer, passages.get(data.get("passage")),
+                    data.get("solution", data.get("explanation")))
+
+def _compile_test(data):
+    test_id = data["test_id"]
+    passages = {}
+    for local_id, text in data.get("passages", {}).items():
+        passage_id = sys.intern(f"{test_id}:{local_id}")
+        passage = _passages.get(passage_id)
+        if passage is None or passage.text != text:
+            passage = Passage(passage_id, sys.intern(text))
+            _passages[passage_id] = passage
+        passages[local_id] = passage
+    option_sets = {}
+    questions = tuple(_compile_question(question, passages, option_sets) for question in data["questions"])
+    return Test(
+        test_id=test_id,
+        title=data.get("title", test_id),
+        subject=data.get("subject"),
+        questions=questions,
+        numbered=MappingProxyType(dict(enumerate(questions, 1)))
+    )
+
+def test_path(test_id):
+    return os.path.join(BANK_DIR, f"{test_id}.json")
+
+def _read_test(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return _compile_test(json.load(f))
+
+def read_test(test_id):
+    """Compile a test straight from its shard, bypassing the cache, for bulk tools"""
+    return _read_test(test_path(test_id))
+
+def load_test(test_id):
+    """Return a test, reading its shard on first use and reloading it when the file changes"""
+    path = test_path(test_id)
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _cache.get(test_id)
+        if cached is not None and cached[0] == mtime:
+            _cache.move_to_end(test_id)
+            return cached[1]
+    # Read and compiled outside the lock, so a cold shard never holds up lookups of other tests
+    test = _read_test(path)
+    with _lock:
+        cached = _cache.get(test_id)
+        # Another session may have loaded this version meanwhile; the first copy in is the one everyone shares.
+        # Any other mtime replaces it, older ones included, as a restored backup or checkout brings back
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, test)
+            _cache[test_id] = cached
+            # Bounded LRU: sessions still holding an evicted test keep their own reference
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        _cache.move_to_end(test_id)
+        return cached[1]
+
+def cached_tests():
+    """Ids of the tests currently in memory, least recently opened first"""
+    with _lock:
+        return list(_cache)
+
+def _current_catalog():
+    """(mtime, entries, FacetIndex) for the catalogue as it is on disk"""
+    global _catalog
+    path = os.path.join(BANK_DIR, CATALOG_FILE)
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        current = _catalog
+    if current[0] == mtime:
+        return current
+    # Read and indexed outside the lock, like a test shard
+    with open(path, "r", encoding="utf-8") as f:
+        entries = tuple(TestInfo(**entry) for entry in json.load(f))
+    loaded = (mtime, entries, FacetIndex(entries, CATALOG_FACETS))
+    with _lock:
+        if _catalog[0] is None or _catalog[0] < mtime:
+            _catalog = loaded
+        return _catalog
+
+def catalog():
+    """Every test in the bank, read from the catalogue manifest rather than the shards"""
+    return _current_catalog()[1]
+
+def catalog_index():
+    """Inverted indexes over the catalogue, rebuilt with it, for filtering by any CATALOG_FACETS"""
+    return _current_catalog()[2]
+
+def list_tests():
+    """Ids of every test in the bank"""
+    return [info.test_id for info in catalog()]
+
+def build_catalog():
+    """Rewrite the catalogue manifest from the shard files"""
+    entries = []
+    for name in sorted(os.listdir(BANK_DIR)):
+        if not name.endswith(".json") or name == CATALOG_FILE:
+            continue
+        with open(os.path.join(BANK_DIR, name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        subject = data.get("subject")
+        difficulty = data.get("difficulty", "Medium")
+        questions = data["questions"]
+        entries.append(TestInfo(
+            test_id=data["test_id"],
+            title=data.get("title", data["test_id"]),
+            exam=data.get("exam"),
+            test_type=data.get("test_type"),
+            subject=subject,
+            # Full length tests tag questions with their section and difficulty
+            sections=sorted({q.get("section", subject) for q in questions}),
+            languages=data.get("languages", ["English"]),
+            difficulties=sorted({q.get("difficulty", difficulty) for q in questions}),
+            questions=len(questions)
+        )._asdict())
+    path = os.path.join(BANK_DIR, CATALOG_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=4, ensure_ascii=False)
+        f.write("\n")
+    os.replace(path + ".tmp", path)
+    return len(entries)
+
+def prefetch(popular_tests):
+    """Load the most popular tests on a background thread, once per process
+
+    popular_tests is called on that thread and returns test ids, most popular first.
+    """
+    global _prefetch_thread
+    with _lock:
+        if _prefetch_thread is None:
+            _prefetch_thread = threading.Thread(target=_prefetch, args=(popular_tests,),
+                                                name="question-bank-prefetch", daemon=True)
+            _prefetch_thread.start()
+        return _prefetch_thread
+
+def _prefetch(popular_tests):
+    try:
+        known = set(list_tests())
+        test_ids = [test_id for test_id in popular_tests() if test_id in known]
+        for test_id in test_ids[:min(PREFETCH_COUNT, CACHE_SIZE)]:
+            load_test(test_id)
+    except Exception:
+        traceback.print_exc()
+
+def _bench_documents(count):
+    """The same synthetic bank as a dict-of-strings document and as a passage-referencing one"""
+    import random
+    with open(test_path("aptitude-reasoning"), "r", encoding="utf-8") as f:
+        template = json.load(f)
+    directions, sequence = template["passages"]["sequence"].split("\n", 1)
+    symbols = sequence.split()
+    per_passage = len(template["questions"])
+    flat, passages, referenced = [], {}, []
+    for n in range(count):
+        group = n // per_passage
+        if n % per_passage == 0:
+            # Every block of questions gets its own sequence, like a real bank's reading sets
+            random.Random(group).shuffle(symbols)
+            passages[str(group)] = f"{directions}\n{' '.join(symbols)}"
+        question = dict(template["questions"][n % per_passage])
+        del question["passage"]
+        flat.append(dict(question, question=f"{passages[str(group)]}\n\n{question['question']}"))
+        referenced.append(dict(question, passage=str(group)))
+    return (json.dumps({"test_id": "bench", "questions": flat}),
+            json.dumps({"test_id": "bench", "passages": passages, "questions": referenced}))
+
+def memory_benchmark(count=BENCH_QUESTIONS):
+    """Bytes per question held after loading a bank as dicts of strings versus compiled Questions"""
+    import gc
+    import tracemalloc
+    flat_document, referenced_document = _bench_documents(count)
+
+    tracemalloc.start()
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    flat = json.loads(flat_document)["questions"]
+    gc.collect()
+    flat_bytes = tracemalloc.get_traced_memory()[0] - before
+    del flat
+
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    test = _compile_test(json.loads(referenced_document))
+    gc.collect()
+    compact_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    assert [q.correct_option for q in test.questions[:5]] == ["Two", "P", "L", "One", "J"]
+    return flat_bytes / count, compact_bytes / count
+
+_STARTUP_PROBE = """
+import os, sys, time
+started = time.perf_counter()
+import question_bank
+tests = question_bank.catalog()
+if sys.argv[1] == "eager":
+    question_bank.CACHE_SIZE = len(tests)
+    for info in tests:
+        question_bank.load_test(info.test_id)
+else:
+    question_bank.prefetch(lambda: [info.test_id for info in tests]).join()
+elapsed = time.perf_counter() - started
+rss = [line for line in open("/proc/self/status") if line.startswith("VmRSS")][0].split()[1]
+print(elapsed * 1000, int(rss) / 1024)
+"""
+
+def startup_benchmark(test_counts=(10, 100, 1000), questions_per_test=50):
+    """Cold-start time and resident memory as the catalogue grows, lazy versus loading every shard"""
+    import subprocess
+    import tempfile
+    _, document = _bench_documents(questions_per_test)
+    shard = json.loads(document)
+    results = []
+    for count in test_counts:
+        with tempfile.TemporaryDirectory() as bank_dir:
+            for n in range(count):
+                with open(os.path.join(bank_dir, f"bench-{n}.json"), "w", encoding="utf-8") as f:
+                    json.dump(dict(shard, test_id=f"bench-{n}"), f, ensure_ascii=False)
+            env = dict(os.environ, QUESTION_BANK_DIR=bank_dir)
+            subprocess.run([sys.executable, __file__, "catalog"], env=env, check=True, stdout=subprocess.DEVNULL)
+            row = [count]
+            for mode in ("lazy", "eager"):
+                output = subprocess.run(
+                    [sys.executable, "-c", _STARTUP_PROBE, mode], env=env, check=True,
+                    capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                ).stdout
+                row.extend(float(value) for value in output.split())
+            results.append(row)
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    if command == "catalog":
+        print(f"Catalogued {build_catalog()} tests in {BANK_DIR}")
+        import dedup
+        for group in dedup.scan_bank():
+            print("Warning: near-duplicate questions " + ", ".join(f"{test_id} Q{number}" for test_id, number in group))
+    elif command == "startup":
+        print(f"{'tests':>6} {'lazy ms':>9} {'lazy MB':>9} {'eager ms':>9} {'eager MB':>9}")
+        for count, lazy_ms, lazy_mb, eager_ms, eager_mb in startup_benchmark():
+            print(f"{count:>6} {lazy_ms:>9.1f} {lazy_mb:>9.1f} {eager_ms:>9.1f} {eager_mb:>9.1f}")
+    else:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_QUESTIONS
+        flat, compact = memory_benchmark(count)
+        print(f"{count} questions: dict of strings {flat:.0f} B/question, "
+              f"compact {compact:.0f} B/question ({flat / compact:.1f}x smaller)")
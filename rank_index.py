@@ -0,0 +1,196 @@
+import bisect
+import http.client
+import threading
+import time
+
+import results_db
+import state_backend
+
+# Rank index configuration
+SCORE_STEP = 0.5       # finest score difference any marking scheme produces (-0.5 negative marking)
+SHARED_REFRESH = 5.0   # seconds between checks of a shared results store for other workers' submissions
+
+class FenwickTree:
+    """Binary indexed tree of counts supporting O(log n) updates and prefix sums"""
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Build a tree from a list of counts in O(n)"""
+        tree = cls(len(counts))
+        tree.tree[1:] = counts
+        for i in range(1, tree.size + 1):
+            parent = i + (i & -i)
+            if parent <= tree.size:
+                tree.tree[parent] += tree.tree[i]
+        return tree
+
+    def add(self, index, delta=1):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index):
+        """Sum of counts at positions 0..index inclusive"""
+        total = 0
+        i = index + 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+def parse_completion_time(value):
+    """Convert a "MM:SS" completion time into seconds"""
+    if not value:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    minutes, _, seconds = str(value).partition(":")
+    return int(minutes) * 60 + int(seconds or 0)
+
+class TestRankIndex:
+    """Rank index for one test: higher score first, then faster completion_time"""
+    def __init__(self, entries=()):
+        self.count = 0
+        self.low = 0
+        self.times = {}          # score bucket -> sorted completion seconds
+        self.tree = FenwickTree(0)
+        self._rebuild([(self._bucket(score), seconds) for score, seconds in entries])
+
+    @staticmethod
+    def _bucket(score):
+        return round(score / SCORE_STEP)
+
+    def _rebuild(self, entries, low=None, high=None):
+        """Re-lay the tree over a bucket range wide enough for every entry"""
+        for bucket, seconds in entries:
+            self.times.setdefault(bucket, []).append(seconds)
+            self.count += 1
+        for times in self.times.values():
+            times.sort()
+        buckets = list(self.times)
+        if low is not None:
+            buckets += [low, high]
+        if not buckets:
+            return
+        self.low = min(buckets)
+        size = max(buckets) - self.low + 1
+        counts = [0] * size
+        for bucket, times in self.times.items():
+            counts[bucket - self.low] = len(times)
+        self.tree = FenwickTree.from_counts(counts)
+
+    def add(self, score, completion_time):
+        """Insert one attempt"""
+        bucket, seconds = self._bucket(score), parse_completion_time(completion_time)
+        position = bucket - self.low
+        if self.count == 0 or position < 0 or position >= self.tree.size:
+            # Grow the range geometrically so out-of-range scores stay amortised O(log n)
+            width = max(self.tree.size, 1)
+            high = self.low + self.tree.size - 1
+            if self.count == 0:
+                low, high = bucket, bucket
+            elif position < 0:
+                low = min(bucket, self.low - width)
+            else:
+                low, high = self.low, max(bucket, high + width)
+            self._rebuild([(bucket, seconds)], low, high)
+            return
+        bisect.insort(self.times.setdefault(bucket, []), seconds)
+        self.tree.add(position)
+        self.count += 1
+
+    def rank(self, score, completion_time):
+        """Rank (1 = best) and percentile of an attempt with this score and time"""
+        bucket, seconds = self._bucket(score), parse_completion_time(completion_time)
+        position = bucket - self.low
+        if position < 0:
+            better = self.count
+        elif position >= self.tree.size:
+            better = 0
+        else:
+            better = self.count - self.tree.prefix_sum(position)
+        better += bisect.bisect_left(self.times.get(bucket, []), seconds)
+        rank = better + 1
+        percentile = 100.0 if self.count <= 1 else (self.count - rank) / (self.count - 1) * 100
+        return rank, percentile
+
+# Indexes live in each process. With a shared state backend they are rebuilt from
+# the shared results whenever those change, so every worker converges on the same
+# ranks within SHARED_REFRESH; meanwhile a worker also counts its own new attempts.
+_lock = threading.Lock()
+_indexes = {}
+_built_version = None      # store version the cached indexes were built from
+_results_version = None    # last version read from a shared store...
+_checked_at = 0.0          # ...and when
+
+def _store_version(backend):
+    """Version of the results the indexes are built from; a change rebuilds them"""
+    global _results_version, _checked_at
+    if not backend.shared:
+        # Only this node writes results and adds them as they are recorded, so only a re-grade invalidates
+        return results_db.scores_version()
+    now = time.monotonic()
+    if _results_version is None or now - _checked_at >= SHARED_REFRESH:
+        _checked_at = now
+        try:
+            _results_version = backend.results_version()
+        except (OSError, http.client.HTTPException):
+            pass  # keep ranking from the indexes already built until the state server answers again
+    return _results_version
+
+def _build(backend, test_id):
+    if backend.shared:
+        scores = backend.scores(test_id)
+    else:
+        scores = [(a["score"], a["completion_time"]) for a in results_db.attempts_for_test(test_id)]
+    return TestRankIndex((score, parse_completion_time(completion_time)) for score, completion_time in scores)
+
+def get_index(test_id):
+    """Return the rank index for a test, building it from the results store on first use"""
+    global _built_version
+    backend = state_backend.get_backend()
+    version = _store_version(backend)
+    with _lock:
+        # Stored results changed underneath, by a re-grade or another worker, so every index is rebuilt
+        if version != _built_version:
+            _indexes.clear()
+            _built_version = version
+        index = _indexes.get(test_id)
+    if index is not None:
+        return index
+    # Built outside the lock: with a shared backend this is a round trip to the state server
+    try:
+        index = _build(backend, test_id)
+    except (OSError, http.client.HTTPException):
+        # Ranks are advisory and must never fail a submission; the next call tries the server again
+        return TestRankIndex()
+    with _lock:
+        return _indexes.setdefault(test_id, index)
+
+def load_all():
+    """Build every test's index in a single pass over the results store"""
+    if state_backend.get_backend().shared:
+        return  # results are on the state server, and each index is fetched from it on first use
+    entries = {}
+    for test_id, score, completion_time in results_db.iter_scores():
+        entries.setdefault(test_id, []).append((score, parse_completion_time(completion_time)))
+    with _lock:
+        for test_id, test_entries in entries.items():
+            _indexes.setdefault(test_id, TestRankIndex(test_entries))
+
+def record_attempt(test_id, score, completion_time):
+    """Add a new attempt to its test's index and return its rank and percentile"""
+    index = get_index(test_id)
+    with _lock:
+        index.add(score, completion_time)
+        return index.rank(score, completion_time)
+
+def get_rank(test_id, score, completion_time):
+    """Rank and percentile an attempt would have among stored attempts"""
+    index = get_index(test_id)
+    with _lock:
+        return index.rank(score, completion_time)
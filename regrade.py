@@ -0,0 +1,86 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+import grading
+import question_bank
+import results_db
+
+SCHEMES = {
+    "icet": grading.ICET_SCHEME,
+    "aptitude": grading.APTITUDE_SCHEME,
+    "plain": grading.PLAIN_SCHEME,
+}
+
+def regrade_test(test_id, answer_key, scheme, page_size=10000, on_change=None):
+    """Re-score every stored attempt of a test against a corrected answer key
+
+    Returns (checked, changed, skipped); skipped attempts have a different
+    number of responses than the key has questions and are left as they are.
+    """
+    answer_key = np.asarray(answer_key, dtype=np.int8)
+    checked = changed = skipped = 0
+
+    # Memory stays bounded by one page of attempts regardless of how many are stored
+    for page in results_db.iter_responses(test_id, page_size):
+        matching = [row for row in page if len(row["responses"]) == len(answer_key)]
+        skipped += len(page) - len(matching)
+        page = matching
+        if not page:
+            continue
+        responses = np.frombuffer(b"".join(row["responses"] for row in page), dtype=np.int8)
+        responses = responses.reshape(len(page), len(answer_key))
+        new_scores = grading.grade(responses, answer_key, scheme)["score"]
+
+        changes = []
+        for row, new_score in zip(page, new_scores.tolist()):
+            if new_score != row["score"]:
+                changes.append((new_score, row["id"]))
+                if on_change is not None:
+                    on_change(row["id"], row["email"], row["score"], new_score)
+        if changes:
+            results_db.update_scores(changes)
+        checked += len(page)
+        changed += len(changes)
+
+    return checked, changed, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-grade stored attempts after an answer-key correction")
+    parser.add_argument("test_id", help="test whose attempts are re-graded")
+    parser.add_argument("answer_key", nargs="?",
+                        help="JSON file with the corrected answer key as option indices (default: the question bank)")
+    parser.add_argument("--scheme", choices=sorted(SCHEMES), default="aptitude")
+    parser.add_argument("--report", help="CSV file listing every attempt whose score changed")
+    args = parser.parse_args()
+
+    if args.answer_key:
+        with open(args.answer_key, "r") as f:
+            answer_key = json.load(f)
+    else:
+        answer_key = grading.answer_key(question_bank.load_test(args.test_id).questions)
+
+    report = open(args.report, "w", newline="") if args.report else sys.stdout
+    writer = csv.writer(report)
+    writer.writerow(["attempt_id", "email", "old_score", "new_score"])
+    started = time.perf_counter()
+    try:
+        checked, changed, skipped = regrade_test(
+            args.test_id, answer_key, SCHEMES[args.scheme],
+            on_change=lambda *row: writer.writerow(row)
+        )
+    finally:
+        if args.report:
+            report.close()
+    print(f"Re-graded {checked} attempts of {args.test_id} in {time.perf_counter() - started:.2f}s, "
+          f"{changed} scores changed", file=sys.stderr)
+    if skipped:
+        print(f"Warning: skipped {skipped} attempts whose responses do not match the {len(answer_key)}-question "
+              f"answer key; they keep their old scores", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import os
+from array import array
+import sqlite3
+import threading
+
+import results_log
+
+# Results store configuration
+DB_FILE = "user_data.db"
+DEFAULT_TEST_ID = "default"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY,
+        test_id TEXT NOT NULL,
+        name TEXT,
+        email TEXT,
+        score REAL NOT NULL,
+        total_questions INTEGER NOT NULL,
+        completion_time TEXT,
+        completion_date TEXT NOT NULL,
+        responses BLOB,
+        submission_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_attempts_email ON attempts (email, completion_date);
+    CREATE INDEX IF NOT EXISTS idx_attempts_test ON attempts (test_id, score);
+    CREATE INDEX IF NOT EXISTS idx_attempts_date ON attempts (completion_date);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS live_registrations (
+        live_id TEXT NOT NULL,
+        candidate TEXT NOT NULL,
+        registered REAL NOT NULL,
+        name TEXT,
+        email TEXT,
+        PRIMARY KEY (live_id, candidate)
+    );
+"""
+
+# Statements are kept as constants so sqlite3's statement cache reuses the prepared form
+ATTEMPT_COLUMNS = "id, test_id, name, email, score, total_questions, completion_time, completion_date"
+# A submission written twice, by a retried batch or a replayed log, is stored once
+INSERT_ATTEMPT = """
+    INSERT OR IGNORE INTO attempts
+        (test_id, name, email, score, total_questions, completion_time, completion_date, responses, submission_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_BY_EMAIL = f"""
+    SELECT {ATTEMPT_COLUMNS} FROM attempts WHERE email = ? ORDER BY completion_date DESC LIMIT ?
+"""
+SELECT_RECENT = f"""
+    SELECT {ATTEMPT_COLUMNS} FROM attempts ORDER BY completion_date DESC LIMIT ?
+"""
+SELECT_BY_TEST = f"""
+    SELECT {ATTEMPT_COLUMNS} FROM attempts WHERE test_id = ?
+"""
+SELECT_RESPONSES_PAGE = """
+    SELECT id, email, score, responses FROM attempts
+    WHERE test_id = ? AND id > ? AND responses IS NOT NULL
+    ORDER BY id LIMIT ?
+"""
+UPDATE_SCORE = """
+    UPDATE attempts SET score = ? WHERE id = ?
+"""
+SELECT_SCORES = """
+    SELECT test_id, score, completion_time FROM attempts
+"""
+SELECT_SCORES_VERSION = """
+    SELECT value FROM meta WHERE key = 'scores_version'
+"""
+BUMP_SCORES_VERSION = """
+    INSERT INTO meta (key, value) VALUES ('scores_version', 1)
+    ON CONFLICT (key) DO UPDATE SET value = value + 1
+"""
+SELECT_LAST_ID = """
+    SELECT COALESCE(MAX(id), 0) FROM attempts
+"""
+SELECT_USER_SUMMARY = """
+    SELECT COUNT(*) AS attempts, AVG(score) AS average_score FROM attempts WHERE email = ?
+"""
+SELECT_POPULAR_TESTS = """
+    SELECT test_id FROM attempts GROUP BY test_id ORDER BY COUNT(*) DESC LIMIT ?
+"""
+INSERT_REGISTRATION = """
+    INSERT INTO live_registrations (live_id, candidate, registered, name, email) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (live_id, candidate) DO UPDATE SET
+        name = COALESCE(excluded.name, name), email = COALESCE(excluded.email, email)
+"""
+SELECT_REGISTRANTS = """
+    SELECT candidate, name, email FROM live_registrations WHERE live_id = ? ORDER BY registered
+"""
+SELECT_REGISTRATION = """
+    SELECT name, email FROM live_registrations WHERE live_id = ? AND candidate = ?
+"""
+
+_lock = threading.RLock()
+_conn = None
+_conn_pid = None
+
+def get_connection():
+    """Return the process-wide connection, opening it on first use"""
+    global _conn, _conn_pid
+    with _lock:
+        # A forked worker must not share its parent's connection
+        if _conn is None or _conn_pid != os.getpid():
+            conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=64,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            _upgrade_schema(conn)
+            _seed_from_log(conn)
+            conn.isolation_level = ""
+            _conn, _conn_pid = conn, os.getpid()
+        return _conn
+
+def _upgrade_schema(conn):
+    """Add columns introduced after a store was first created"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(attempts)")}
+    for column, kind in (("responses", "BLOB"), ("submission_id", "TEXT")):
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE attempts ADD COLUMN {column} {kind}")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+    # Attempts stored before submission ids existed have none, and NULLs never collide
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attempts_submission ON attempts (submission_id)")
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(live_registrations)")}
+    for column in ("name", "email"):
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE live_registrations ADD COLUMN {column} TEXT")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+def _seed_from_log(conn):
+    """Import the results log exactly once, even when several workers start together"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is None:
+            conn.executemany(INSERT_ATTEMPT, (_attempt_row(r) for r in results_log.iter_results()))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('seeded', '1')")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _attempt_row(user_data):
+    return (
+        user_data.get("test_id", DEFAULT_TEST_ID),
+        user_data.get("name"),
+        user_data.get("email"),
+        user_data["score"],
+        user_data["total_questions"],
+        user_data.get("completion_time"),
+        user_data["completion_date"],
+        encode_responses(user_data.get("responses")),
+        user_data.get("submission_id"),
+    )
+
+def encode_responses(responses):
+    """Pack a list of option indices (-1 for unattempted) into one byte per question"""
+    if responses is None:
+        return None
+    return array("b", responses).tobytes()
+
+def decode_responses(blob):
+    """Unpack stored responses back into a list of option indices"""
+    return array("b", blob).tolist()
+
+def insert_result(user_data):
+    """Store a single attempt"""
+    insert_results([user_data])
+
+def insert_results(records):
+    """Store several attempts in one transaction"""
+    conn = get_connection()
+    with _lock, conn:
+        conn.executemany(INSERT_ATTEMPT, [_attempt_row(r) for r in records])
+
+def attempts_for_email(email, limit=10):
+    """Most recent attempts by one candidate"""
+    with _lock:
+        return [dict(row) for row in get_connection().execute(SELECT_BY_EMAIL, (email, limit))]
+
+def recent_attempts(limit=10):
+    """Most recent attempts across all candidates"""
+    with _lock:
+        return [dict(row) for row in get_connection().execute(SELECT_RECENT, (limit,))]
+
+def attempts_for_test(test_id):
+    """Yield every attempt for one test"""
+    with _lock:
+        rows = get_connection().execute(SELECT_BY_TEST, (test_id,)).fetchall()
+    for row in rows:
+        yield dict(row)
+
+def iter_responses(test_id, page_size=10000):
+    """Yield pages of (id, email, score, responses blob) for a test in id order"""
+    last_id = 0
+    while True:
+        with _lock:
+            page = get_connection().execute(SELECT_RESPONSES_PAGE, (test_id, last_id, page_size)).fetchall()
+        if not page:
+            return
+        last_id = page[-1]["id"]
+        yield page
+
+def update_scores(changes):
+    """Rewrite scores for (score, attempt id) pairs and bump the scores version"""
+    conn = get_connection()
+    with _lock, conn:
+        conn.executemany(UPDATE_SCORE, changes)
+        conn.execute(BUMP_SCORES_VERSION)
+
+def scores_version():
+    """Counter bumped whenever stored scores are rewritten"""
+    with _lock:
+        row = get_connection().execute(SELECT_SCORES_VERSION).fetchone()
+    return int(row[0]) if row else 0
+
+def results_version():
+    """Changes whenever an attempt is stored or stored scores are rewritten"""
+    with _lock:
+        conn = get_connection()
+        row = conn.execute(SELECT_SCORES_VERSION).fetchone()
+        last_id = conn.execute(SELECT_LAST_ID).fetchone()[0]
+    return f"{int(row[0]) if row else 0}:{last_id}"
+
+def iter_scores():
+    """Yield (test_id, score, completion_time) for every stored attempt"""
+    with _lock:
+        rows = get_connection().execute(SELECT_SCORES).fetchall()
+    for row in rows:
+        yield tuple(row)
+
+def user_summary(email):
+    """Attempt count and average score for one candidate"""
+    with _lock:
+        row = get_connection().execute(SELECT_USER_SUMMARY, (email,)).fetchone()
+    return {"attempts": row["attempts"], "average_score": row["average_score"] or 0}
+
+def popular_tests(limit=10):
+    """Test ids ordered by number of attempts, most attempted first"""
+    with _lock:
+        return [row["test_id"] for row in get_connection().execute(SELECT_POPULAR_TESTS, (limit,))]
+
+def register_live(live_id, candidate, registered, name=None, email=None):
+    """Add a candidate to a live test's registration list; registering again only fills in name and email"""
+    conn = get_connection()
+    with _lock, conn:
+        conn.execute(INSERT_REGISTRATION, (live_id, candidate, registered, name, email))
+
+def live_registrants(live_id):
+    """{candidate: (name, email)} of everyone registered for a live test, in registration order"""
+    with _lock:
+        return {row["candidate"]: (row["name"], row["email"])
+                for row in get_connection().execute(SELECT_REGISTRANTS, (live_id,))}
+
+def live_registration(live_id, candidate):
+    """(name, email) a candidate registered for a live test with, or None if they have not registered"""
+    with _lock:
+        row = get_connection().execute(SELECT_REGISTRATION, (live_id, candidate)).fetchone()
+    return None if row is None else (row["name"], row["email"])
@@ -0,0 +1,185 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends still go through a single O_APPEND write
+    fcntl = None
+
+# Results log configuration
+LOG_FILE = "user_data.jsonl"       # append-only results log, one JSON record per line
+LEGACY_FILE = "user_data.json"     # old single JSON array written by save_user_data
+FSYNC_EVERY = 32                   # fsync after this many appended records...
+FSYNC_INTERVAL = 1.0               # ...or after this many seconds, whichever comes first
+
+_lock = threading.Lock()
+_fd = None
+_fd_pid = None
+_pending = 0
+_last_sync = 0.0
+
+class _FileLock:
+    """Exclusive advisory lock on a file descriptor, shared by every server process"""
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+def _open_log():
+    """Open the results log for appending, migrating the legacy file on first use"""
+    global _fd, _fd_pid, _pending, _last_sync
+    # A forked worker opens its own descriptor instead of sharing the parent's
+    if _fd is None or _fd_pid != os.getpid():
+        if not os.path.exists(LOG_FILE) and os.path.exists(LEGACY_FILE):
+            migrate_user_data()
+        _fd = os.open(LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _fd_pid = os.getpid()
+        _pending = 0
+        _last_sync = time.monotonic()
+    return _fd
+
+def _sync(force=False):
+    """fsync appended records once the batch size or interval is reached"""
+    global _pending, _last_sync
+    if _fd is None or _pending == 0:
+        return
+    now = time.monotonic()
+    if force or _pending >= FSYNC_EVERY or now - _last_sync >= FSYNC_INTERVAL:
+        os.fsync(_fd)
+        _pending = 0
+        _last_sync = now
+
+def append_result(user_data):
+    """Append a single result record to the log"""
+    append_results([user_data])
+
+def append_results(records):
+    """Append several result records to the log in one write"""
+    global _pending
+    lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    if not lines:
+        return
+    data = lines.encode("utf-8")
+    with _lock:
+        fd = _open_log()
+        # The lock only covers this one append, never a whole-file rewrite, so
+        # processes interleave whole lines without serialising on anything else
+        with _FileLock(fd):
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+        _pending += len(records)
+        _sync()
+
+def flush():
+    """Force any buffered records to disk"""
+    with _lock:
+        _sync(force=True)
+
+def iter_results(filename=LOG_FILE):
+    """Yield result records from the log one at a time"""
+    flush()
+    if not os.path.exists(filename):
+        if filename == LOG_FILE and os.path.exists(LEGACY_FILE):
+            with open(LEGACY_FILE, "r") as f:
+                yield from json.load(f)
+        return
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            # A torn final line from a crash mid-write is skipped, not fatal
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def migrate_user_data(source=LEGACY_FILE, target=LOG_FILE):
+    """One-time conversion of the legacy JSON array into the results log"""
+    # Serialise migrations across processes so a late migrator cannot replace
+    # a log that another worker has already started appending to
+    lock_fd = os.open(target + ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        with _FileLock(lock_fd):
+            if os.path.exists(target):
+                return 0
+            with open(source, "r") as f:
+                existing_data = json.load(f)
+
+            # Write to a temp file and rename so a crash never leaves a half-migrated log
+            temp = f"{target}.{os.getpid()}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                for record in existing_data:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, target)
+            return len(existing_data)
+    finally:
+        os.close(lock_fd)
+
+def _stress_worker(args):
+    """Submit a run of quiz payloads the way save_user_data does"""
+    directory, worker, count = args
+    import results_db
+    os.chdir(directory)
+    for i in range(count):
+        user_data = {
+            "test_id": "stress",
+            "name": f"worker-{worker}",
+            "email": f"{worker}-{i}@stress",
+            "score": i % 11,
+            "total_questions": 5,
+            "completion_time": "00:00",
+            "completion_date": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        results_db.insert_result(user_data)
+        append_result(user_data)
+    flush()
+
+def stress_test(workers=8, per_worker=500):
+    """Fire parallel submissions from several processes and check none are lost"""
+    import multiprocessing
+    import tempfile
+    import results_db
+
+    directory = tempfile.mkdtemp(prefix="results-stress-")
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        pool.map(_stress_worker, [(directory, w, per_worker) for w in range(workers)])
+    elapsed = time.perf_counter() - started
+
+    expected = {f"{w}-{i}@stress" for w in range(workers) for i in range(per_worker)}
+    logged = [r["email"] for r in iter_results(os.path.join(directory, LOG_FILE))]
+    conn = results_db.sqlite3.connect(os.path.join(directory, results_db.DB_FILE))
+    stored = [row[0] for row in conn.execute("SELECT email FROM attempts")]
+    conn.close()
+
+    total = workers * per_worker
+    print(f"{total} submissions from {workers} processes in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    print(f"results log:   {len(logged)} records, {len(expected - set(logged))} lost, {len(logged) - len(set(logged))} duplicated")
+    print(f"results store: {len(stored)} records, {len(expected - set(stored))} lost, {len(stored) - len(set(stored))} duplicated")
+    return set(logged) == expected == set(stored) and len(logged) == len(stored) == total
+
+atexit.register(flush)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        print(f"Migrated {migrate_user_data()} records to {LOG_FILE}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "stress":
+        counts = [int(arg) for arg in sys.argv[2:4]]
+        sys.exit(0 if stress_test(*counts) else 1)
+    else:
+        print(f"Usage: python {sys.argv[0]} migrate | stress [workers] [per_worker]")
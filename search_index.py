@@ -0,0 +1,272 @@
+import bisect
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+import question_bank
+
+# Search configuration
+INDEX_FILE = "search_index.npz"   # written next to the question bank shards
+K1 = 1.2                          # BM25 term frequency saturation
+B = 0.75                          # BM25 document length normalisation
+MAX_PREFIX_TERMS = 64             # most frequent completions used for a trailing partial word
+VERSION_CHECK_INTERVAL = 5.0      # seconds between checks for a changed bank
+BENCH_QUESTIONS = 100000          # bank size used by the benchmark
+BENCH_QUERIES = 300               # timed queries per query kind
+
+Hit = namedtuple("Hit", ["test_id", "number", "score"])
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+class SearchIndex:
+    """BM25 inverted index with every posting list packed into flat NumPy arrays"""
+    def __init__(self, version, test_ids, doc_tests, doc_numbers, doc_lengths, terms, offsets, doc_ids, term_freqs):
+        self.version = version
+        self.test_ids = test_ids                 # doc_tests indexes into this list
+        self.doc_tests = doc_tests               # per document: test number
+        self.doc_numbers = doc_numbers           # per document: 1-based question number
+        self.doc_lengths = doc_lengths           # per document: token count
+        self.terms = terms                       # sorted, so a prefix is a contiguous range
+        self.offsets = offsets                   # postings of terms[i] are [offsets[i], offsets[i + 1])
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self._term_numbers = {term: number for number, term in enumerate(terms)}
+        self._doc_freqs = np.diff(offsets)
+        # Length normalisation is fixed per document, so it is computed once
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self._length_norm = (K1 * (1 - B + B * doc_lengths / average_length)).astype(np.float32)
+
+    @classmethod
+    def build(cls, documents, version=None):
+        """Index (test_id, question number, text) documents"""
+        test_numbers = {}
+        doc_tests, doc_numbers, doc_lengths = [], [], []
+        postings = {}   # term -> ([doc ids], [term frequencies])
+        for doc, (test_id, number, text) in enumerate(documents):
+            tokens = tokenize(text)
+            doc_tests.append(test_numbers.setdefault(test_id, len(test_numbers)))
+            doc_numbers.append(number)
+            doc_lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                docs, frequencies = postings.setdefault(term, ([], []))
+                docs.append(doc)
+                frequencies.append(frequency)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        term_freqs = np.empty(offsets[-1], dtype=np.float32)
+        for number, term in enumerate(terms):
+            docs, frequencies = postings[term]
+            doc_ids[offsets[number]:offsets[number + 1]] = docs
+            term_freqs[offsets[number]:offsets[number + 1]] = frequencies
+        return cls(version, list(test_numbers), np.array(doc_tests, dtype=np.int32),
+                   np.array(doc_numbers, dtype=np.int32), np.array(doc_lengths, dtype=np.float32),
+                   terms, offsets, doc_ids, term_freqs)
+
+    def _query_terms(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        numbers = {self._term_numbers[token] for token in tokens if token in self._term_numbers}
+        # Search as you type: the last word also matches terms it is a prefix of
+        if not query[-1].isspace():
+            prefix = tokens[-1]
+            start = bisect.bisect_left(self.terms, prefix)
+            end = bisect.bisect_left(self.terms, prefix + "\uffff", start)
+            completions = np.arange(start, end)
+            if len(completions) > MAX_PREFIX_TERMS:
+                completions = completions[np.argsort(-self._doc_freqs[start:end])[:MAX_PREFIX_TERMS]]
+            numbers.update(completions.tolist())
+        return sorted(numbers)
+
+    def search(self, query, limit=10):
+        """Best matching questions for a keyword query, highest BM25 score first"""
+        numbers = self._query_terms(query)
+        if not numbers:
+            return []
+        documents = len(self.doc_numbers)
+        scores = np.zeros(documents, dtype=np.float32)
+        for number in numbers:
+            start, end = self.offsets[number], self.offsets[number + 1]
+            docs = self.doc_ids[start:end]
+            frequencies = self.term_freqs[start:end]
+            doc_freq = end - start
+            idf = math.log(1 + (documents - doc_freq + 0.5) / (doc_freq + 0.5))
+            # Each document appears once per posting list, so fancy-index += is safe
+            scores[docs] += idf * frequencies * (K1 + 1) / (frequencies + self._length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [Hit(self.test_ids[self.doc_tests[doc]], int(self.doc_numbers[doc]), float(scores[doc]))
+                for doc in matched]
+
+    def save(self, path):
+        """Write the index atomically so concurrent readers never see half a file"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            version=np.frombuffer((self.version or "").encode(), dtype=np.uint8),
+            test_ids=np.frombuffer(json.dumps(self.test_ids).encode(), dtype=np.uint8),
+            terms=np.frombuffer("\n".join(self.terms).encode(), dtype=np.uint8),
+            doc_tests=self.doc_tests,
+            doc_numbers=self.doc_numbers,
+            doc_lengths=self.doc_lengths,
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs
+        )
+        with open(path + ".tmp", "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            terms = data["terms"].tobytes().decode()
+            return cls(
+                data["version"].tobytes().decode(),
+                json.loads(data["test_ids"].tobytes()),
+                data["doc_tests"], data["doc_numbers"], data["doc_lengths"],
+                terms.split("\n") if terms else [],
+                data["offsets"], data["doc_ids"], data["term_freqs"]
+            )
+
+def question_document(question):
+    """Searchable text of a question: passage, stem, options and explanation"""
+    return " ".join([question.text, *map(str, question.options), question.solution or ""])
+
+def bank_version():
+    """Fingerprint of the catalogue and every shard it lists"""
+    digest = hashlib.sha1()
+    for info in question_bank.catalog():
+        try:
+            stat = os.stat(question_bank.test_path(info.test_id))
+        except FileNotFoundError:
+            # Deleted or renamed before the catalogue was rebuilt; the index leaves it out
+            digest.update(f"{info.test_id}:missing\n".encode())
+            continue
+        digest.update(f"{info.test_id}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+def build_bank_index(version=None):
+    """Index every question in the bank, reading shards without disturbing the test cache"""
+    def documents():
+        for info in question_bank.catalog():
+            try:
+                test = question_bank.read_test(info.test_id)
+            except FileNotFoundError:
+                continue
+            for number, question in enumerate(test.questions, 1):
+                yield info.test_id, number, question_document(question)
+    return SearchIndex.build(documents(), version or bank_version())
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+def get_index():
+    """The bank's search index, loaded from disk or rebuilt once per bank version"""
+    global _index, _checked_at
+    if _index is not None and time.time() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _index
+    with _lock:
+        if _index is not None and time.time() - _checked_at < VERSION_CHECK_INTERVAL:
+            return _index
+        version = bank_version()
+        if _index is None or _index.version != version:
+            path = os.path.join(question_bank.BANK_DIR, INDEX_FILE)
+            index = SearchIndex.load(path) if os.path.exists(path) else None
+            if index is None or index.version != version:
+                index = build_bank_index(version)
+                index.save(path)
+            _index = index
+        _checked_at = time.time()
+        return _index
+
+def search(query, limit=10):
+    return get_index().search(query, limit)
+
+def _bench_vocabulary(rng):
+    """Pronounceable pseudo-words, most frequent first"""
+    syllables = ["ba", "ce", "di", "fo", "gu", "ha", "je", "ki", "lo", "mu", "na", "pe", "qi", "ro",
+                 "su", "ta", "ve", "wi", "xo", "yu", "za", "tri", "pla", "sto", "gre", "cho", "sha", "thi"]
+    vocabulary = sorted({"".join(rng.choice(syllables, size=rng.integers(2, 5))) for _ in range(40000)})
+    rng.shuffle(vocabulary)
+    return vocabulary
+
+def _bench_documents(count, vocabulary, rng):
+    """Synthetic questions with Zipf-distributed word frequencies, 100 to a test"""
+    lengths = rng.integers(30, 90, size=count)
+    ranks = np.minimum(rng.zipf(1.2, size=int(lengths.sum())), len(vocabulary)) - 1
+    position = 0
+    for number in range(count):
+        words = ranks[position:position + lengths[number]]
+        position += lengths[number]
+        yield f"bench-{number // 100}", number % 100 + 1, " ".join(vocabulary[rank] for rank in words)
+
+def benchmark(count=BENCH_QUESTIONS, queries=BENCH_QUERIES):
+    """Build, save, load and query timings for a synthetic bank"""
+    import tempfile
+    rng = np.random.default_rng(0)
+    vocabulary = _bench_vocabulary(rng)
+    started = time.perf_counter()
+    index = SearchIndex.build(_bench_documents(count, vocabulary, rng), "bench")
+    build_s = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, INDEX_FILE)
+        index.save(path)
+        size_mb = os.path.getsize(path) / 1e6
+        started = time.perf_counter()
+        index = SearchIndex.load(path)
+        load_s = time.perf_counter() - started
+
+    common, middle, rare = vocabulary[:50], vocabulary[200:2000], vocabulary[5000:20000]
+    kinds = {
+        "two common words": lambda: f"{rng.choice(common)} {rng.choice(common)} ",
+        "common + rare word": lambda: f"{rng.choice(common)} {rng.choice(rare)} ",
+        "three mid words": lambda: " ".join(rng.choice(middle, size=3)) + " ",
+        "word + prefix": lambda: f"{rng.choice(middle)} {rng.choice(middle)[:3]}"
+    }
+    timings = []
+    for label, make_query in kinds.items():
+        samples = []
+        for _ in range(queries):
+            query = make_query()
+            started = time.perf_counter()
+            index.search(query)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        timings.append((label, samples[len(samples) // 2], samples[int(len(samples) * 0.99)]))
+    return build_s, size_mb, load_s, timings
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_QUESTIONS
+        build_s, size_mb, load_s, timings = benchmark(count)
+        print(f"{count} questions: built in {build_s:.1f}s, {size_mb:.1f} MB on disk, loaded in {load_s * 1000:.0f} ms")
+        for label, median_ms, p99_ms in timings:
+            print(f"{label:<20} median {median_ms:6.2f} ms   p99 {p99_ms:6.2f} ms")
+    else:
+        index = get_index()
+        print(f"Search index for bank version {index.version[:12]}: "
+              f"{len(index.doc_numbers)} questions, {len(index.terms)} terms")
+        for query in sys.argv[2:]:
+            for hit in index.search(query):
+                print(f"  {hit.score:6.2f}  {hit.test_id} Q{hit.number}")
@@ -0,0 +1,308 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import question_bank
+
+# Sequence reasoning configuration
+CONSONANTS = "BCDFGHJKLMNPQRSTVWXYZ"
+VOWELS = "AEIOU"
+NUMBERS = "123456789"
+SYMBOLS = "%&@©€¥#$*£δ↑"
+COMPOSITION = {"consonant": 13, "vowel": 3, "number": 7, "symbol": 6}   # elements of each kind, 29 in all
+DIRECTIONS = "Directions: Study the following digit-letter-symbol sequence carefully:"
+NONE_OF_THESE = "None of these"
+BENCH_SETS = 20000        # sequences (five questions each) generated by the benchmark
+
+# (counted kind, kind immediately before, kind immediately after) for the counting questions
+COUNT_PATTERNS = [
+    ("symbol", "consonant", "number"),
+    ("number", "vowel", "consonant"),
+    ("number", "consonant", "symbol"),
+    ("symbol", "number", "consonant"),
+    ("consonant", "symbol", "number"),
+    ("number", "symbol", "letter"),
+    ("symbol", "letter", "number"),
+    ("vowel", "consonant", "number"),
+    ("consonant", "number", "symbol"),
+    ("number", "letter", "letter")
+]
+DROPPED_KINDS = ["number", "symbol", "vowel", "consonant"]
+
+ALPHABET = tuple(CONSONANTS + VOWELS + NUMBERS + SYMBOLS)
+# Kinds are bits so "letter" (consonant or vowel) is just another mask
+KIND_BITS = {"consonant": 1, "vowel": 2, "letter": 3, "number": 4, "symbol": 8}
+PLURALS = {"consonant": "consonants", "vowel": "vowels", "letter": "letters", "number": "numbers", "symbol": "symbols"}
+COUNT_WORDS = ["None", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten",
+               "Eleven", "Twelve"]
+ORDINALS = ["zeroth", "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth"]
+
+_ELEMENT_BITS = np.array([KIND_BITS["consonant"]] * len(CONSONANTS) + [KIND_BITS["vowel"]] * len(VOWELS) +
+                         [KIND_BITS["number"]] * len(NUMBERS) + [KIND_BITS["symbol"]] * len(SYMBOLS))
+_POOLS = [("consonant", CONSONANTS), ("vowel", VOWELS), ("number", NUMBERS), ("symbol", SYMBOLS)]
+_MEMBERS = {"consonant": set(CONSONANTS), "vowel": set(VOWELS), "letter": set(CONSONANTS + VOWELS),
+            "number": set(NUMBERS), "symbol": set(SYMBOLS)}
+
+def _count_word(count):
+    return COUNT_WORDS[count] if count < len(COUNT_WORDS) else str(count)
+
+def _nth(number):
+    suffix = "th" if 11 <= number % 100 <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+# Vectorized evaluation: every function answers one question for a whole batch of sequences,
+# given as a sequences x length array of ALPHABET indices
+
+def random_sequences(rng, count):
+    """count sequences of distinct elements with COMPOSITION of each kind, in random order"""
+    parts, offset = [], 0
+    for kind, pool in _POOLS:
+        picks = np.argsort(rng.random((count, len(pool))), axis=1)[:, :COMPOSITION[kind]]
+        parts.append(picks + offset)
+        offset += len(pool)
+    elements = np.concatenate(parts, axis=1)
+    return np.take_along_axis(elements, np.argsort(rng.random(elements.shape), axis=1), axis=1)
+
+def flanked(elements, target, before, after):
+    """Which positions hold a target-kind element preceded by before and followed by after
+
+    target, before and after are per-sequence KIND_BITS masks; the result has one
+    column per interior position (1 to length - 2).
+    """
+    bits = _ELEMENT_BITS[elements]
+    return (((bits[:, 1:-1] & target[:, None]) != 0) & ((bits[:, :-2] & before[:, None]) != 0)
+            & ((bits[:, 2:] & after[:, None]) != 0))
+
+def relative_position(length, nth, from_right, steps, to_right):
+    """0-based position of the element steps to the left/right of the nth from the left/right"""
+    anchor = np.where(from_right, length - nth, nth - 1)
+    return anchor + np.where(to_right, steps, -steps)
+
+def position_after_dropping(elements, dropped, nth, from_right):
+    """0-based position of the nth remaining element from an end once the dropped kinds are removed"""
+    keep = (_ELEMENT_BITS[elements] & dropped[:, None]) == 0
+    ordered = np.where(from_right[:, None], keep[:, ::-1], keep)
+    index = np.argmax((np.cumsum(ordered, axis=1) == nth[:, None]) & ordered, axis=1)
+    return np.where(from_right, elements.shape[1] - 1 - index, index)
+
+def series_positions(start, gap, terms=5):
+    """0-based positions of a series whose gaps grow by one: start, +gap, +gap+1, ..."""
+    steps = np.arange(terms)
+    return start[:, None] + steps * gap[:, None] + steps * (steps - 1) // 2
+
+# Reference solver: plain loops over element strings, used to verify every generated answer
+
+def _is(element, kind):
+    return element in _MEMBERS[kind]
+
+def _solve(sequence, template, params):
+    if template == "count":
+        target, before, after = params
+        count = sum(1 for i in range(1, len(sequence) - 1) if _is(sequence[i], target)
+                    and _is(sequence[i - 1], before) and _is(sequence[i + 1], after))
+        return _count_word(count)
+    if template == "relative":
+        nth, from_right, steps, to_right = params
+        anchor = sequence.index(sequence[-nth] if from_right else sequence[nth - 1])
+        return sequence[anchor + steps if to_right else anchor - steps]
+    if template == "dropped":
+        dropped, nth, from_right = params
+        kept = [element for element in sequence if not _is(element, dropped)]
+        return kept[-nth] if from_right else kept[nth - 1]
+    shown = [sequence.index(element) for element in params]
+    return sequence[shown[-1] + (shown[-1] - shown[-2]) + 1]
+
+def _element_options(sequence, answer, mistakes, order):
+    """The answer, three plausible wrong elements and 'None of these', shuffled by order"""
+    chosen = []
+    for position in mistakes + [answer + d for k in range(2, len(sequence)) for d in (k, -k)]:
+        if 0 <= position < len(sequence) and position != answer and position not in chosen:
+            chosen.append(position)
+            if len(chosen) == 3:
+                break
+    elements = [sequence[answer]] + [sequence[position] for position in chosen]
+    options = [elements[i] for i in order]
+    return options + [NONE_OF_THESE], options.index(sequence[answer])
+
+def _count_question(sequence, hits, pattern, offset):
+    target, before, after = pattern
+    instances = ["".join(sequence[i:i + 3]) for i in np.flatnonzero(hits).tolist()]
+    count = len(instances)
+    base = max(0, count - offset)
+    condition = f"a {target} is preceded by a {before} and followed by a {after}"
+    if count == 0:
+        solution = f"Solution: No {target} in the sequence is immediately preceded by a {before} and followed by a {after}."
+    elif count == 1:
+        solution = f"Solution: Only {instances[0]} satisfies the condition where {condition}."
+    else:
+        solution = (f"Solution: {', '.join(instances[:-1])} and {instances[-1]} are the {_count_word(count).lower()} "
+                    f"instances where {condition}.")
+    return {
+        "question": f"How many such {PLURALS[target]} are there in the above sequence, each of which is immediately "
+                    f"preceded by a {before} and immediately followed by a {after}?",
+        "options": [_count_word(base + i) for i in range(4)] + [NONE_OF_THESE],
+        "correct_answer": count - base,
+        "solution": solution
+    }, ("count", pattern)
+
+def generate_sets(count, seed=0, verify=True):
+    """count (sequence, questions) sets in the shape of the original reasoning passage
+
+    Each set is five bank-format questions on one random sequence: two counting
+    questions, a relative position, a position after dropping a kind, and a series.
+    The same seed always yields the same sets. With verify, every answer is
+    re-derived by a plain reference solver and a disagreement raises RuntimeError.
+    """
+    rng = np.random.default_rng(seed)
+    elements = random_sequences(rng, count)
+    length = elements.shape[1]
+
+    patterns = np.argsort(rng.random((count, len(COUNT_PATTERNS))), axis=1)[:, :2]
+    masks = np.array([[KIND_BITS[kind] for kind in pattern] for pattern in COUNT_PATTERNS])
+    count_hits = [flanked(elements, *masks[patterns[:, q]].T) for q in range(2)]
+    count_offsets = rng.integers(0, 4, size=(count, 2))
+
+    steps = rng.integers(2, 8, size=count)
+    to_right = rng.random(count) < 0.5
+    from_right = rng.random(count) < 0.5
+    low = np.where(to_right, 0, steps)
+    high = np.where(to_right, length - 1 - steps, length - 1)
+    anchor = low + (rng.random(count) * (high - low + 1)).astype(int)
+    nth = np.where(from_right, length - anchor, anchor + 1)
+    relative = relative_position(length, nth, from_right, steps, to_right)
+
+    dropped = rng.integers(0, len(DROPPED_KINDS), size=count)
+    dropped_bits = np.array([KIND_BITS[kind] for kind in DROPPED_KINDS])[dropped]
+    dropped_nth = rng.integers(2, 9, size=count)
+    dropped_from_right = rng.random(count) < 0.5
+    remaining = position_after_dropping(elements, dropped_bits, dropped_nth, dropped_from_right)
+
+    gap = rng.integers(1, 4, size=count)
+    start = (rng.random(count) * (length - 4 * gap - 6)).astype(int)
+    series = series_positions(start, gap)
+
+    orders = np.argsort(rng.random((count, 3, 4)), axis=2)
+    sets = []
+    for row in range(count):
+        sequence = [ALPHABET[element] for element in elements[row].tolist()]
+        order = orders[row].tolist()
+        first, second = (_count_question(sequence, count_hits[q][row], COUNT_PATTERNS[patterns[row, q]],
+                                         int(count_offsets[row, q])) for q in range(2))
+
+        n, s, answer = int(nth[row]), int(steps[row]), int(relative[row])
+        a, right, end = int(anchor[row]), "right" if to_right[row] else "left", "right" if from_right[row] else "left"
+        options, correct = _element_options(sequence, answer, [a - s if to_right[row] else a + s, answer - 1,
+                                                              answer + 1, a], order[0])
+        relative_question = ({
+            "question": f"Which of the following is {ORDINALS[s]} to the {right} of {_nth(n)} element from the {end}?",
+            "options": options,
+            "correct_answer": correct,
+            "solution": f"Solution: The {_nth(n)} element from the {end} is {sequence[a]}; counting {s} to the "
+                        f"{right} of it gives {sequence[answer]}."
+        }, ("relative", (n, bool(from_right[row]), s, bool(to_right[row]))))
+
+        kind, n, answer = DROPPED_KINDS[dropped[row]], int(dropped_nth[row]), int(remaining[row])
+        end = "right" if dropped_from_right[row] else "left"
+        kept = [position for position, element in enumerate(sequence) if not _is(element, kind)]
+        index = kept.index(answer)
+        neighbours = [kept[i] for i in (index - 1, index + 1) if 0 <= i < len(kept)]
+        options, correct = _element_options(sequence, answer, [length - n if end == "right" else n - 1] + neighbours,
+                                            order[1])
+        dropped_question = ({
+            "question": f"If all the {PLURALS[kind]} are dropped in the given series, then which element will be "
+                        f"at {ORDINALS[n]} position from {end} end?",
+            "options": options,
+            "correct_answer": correct,
+            "solution": f"Solution: After dropping the {PLURALS[kind]} the series is "
+                        f"{' '.join(sequence[p] for p in kept)}; the {ORDINALS[n]} element from the {end} end is "
+                        f"{sequence[answer]}."
+        }, ("dropped", (kind, n, end == "right")))
+
+        positions = series[row].tolist()
+        shown = [sequence[p] for p in positions[:4]]
+        g = int(gap[row])
+        options, correct = _element_options(sequence, positions[4], [positions[4] - 1, positions[4] + 1,
+                                                                     positions[4] + 2], order[2])
+        series_question = ({
+            "question": "What should come in place of question mark in the following on the basis of above "
+                        f"sequence?\n{', '.join(shown)}, ?",
+            "options": options,
+            "correct_answer": correct,
+            "solution": f"Solution: The elements are at positions {', '.join(str(p + 1) for p in positions[:4])} "
+                        f"from the left, {g}, {g + 1} and {g + 2} apart, so the next is {g + 3} further on at "
+                        f"position {positions[4] + 1}: {sequence[positions[4]]}."
+        }, ("series", shown))
+
+        # Same order as the original passage: count, relative, dropped, count, series
+        questions = [first, relative_question, dropped_question, second, series_question]
+
+        if verify:
+            for question, (template, params) in questions:
+                options = question["options"]
+                if len(set(options)) != len(options) or options[question["correct_answer"]] != _solve(sequence, template, params):
+                    raise RuntimeError(f"generated {template} question disagrees with the reference solver: {question}")
+        sets.append((" ".join(sequence), [question for question, _ in questions]))
+    return sets
+
+def generate_test(test_id, sets, seed=0, title=None):
+    """A bank shard of generated reasoning sets, each sequence stored once as a passage"""
+    passages, questions = {}, []
+    for number, (sequence, set_questions) in enumerate(generate_sets(sets, seed), 1):
+        passages[f"s{number}"] = f"{DIRECTIONS}\n{sequence}"
+        questions.extend(dict(question, passage=f"s{number}") for question in set_questions)
+    return {
+        "test_id": test_id,
+        "title": title or "Sequence Reasoning Practice",
+        "subject": "Logical Reasoning",
+        "exam": "ICET",
+        "test_type": "Topic Wise",
+        "difficulty": "Hard",
+        "languages": ["English"],
+        "passages": passages,
+        "questions": questions
+    }
+
+def check_original():
+    """Re-derive the hand-computed answers of the aptitude-reasoning passage with the vectorized evaluators"""
+    passage = question_bank.read_test("aptitude-reasoning").questions[0].passage.text
+    sequence = [element for element in passage.split("\n", 1)[1] if not element.isspace()]
+    elements = np.array([[ALPHABET.index(element) for element in sequence]])
+    one = lambda value: np.array([value])
+    answers = [
+        _count_word(int(flanked(elements, one(8), one(1), one(4)).sum())),
+        sequence[int(relative_position(len(sequence), one(15), one(False), one(5), one(False))[0])],
+        sequence[int(position_after_dropping(elements, one(4), one(6), one(True))[0])],
+        _count_word(int(flanked(elements, one(4), one(2), one(1)).sum())),
+        sequence[int(series_positions(one(2), one(3))[0, 4])]
+    ]
+    return answers
+
+def benchmark(sets=BENCH_SETS):
+    """Seconds to generate and verify sets of five questions"""
+    started = time.perf_counter()
+    generate_sets(sets, seed=1)
+    return time.perf_counter() - started
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if command == "bench":
+        sets = int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_SETS
+        expected = [q.correct_option for q in question_bank.read_test("aptitude-reasoning").questions]
+        assert check_original() == expected, check_original()
+        elapsed = benchmark(sets)
+        print(f"{sets * 5} verified questions in {elapsed:.2f}s ({sets * 5 * 60 / elapsed:,.0f} per minute)")
+    elif command == "write":
+        # python sequence_questions.py write <test_id> [sets] [seed]
+        test_id = sys.argv[2]
+        sets = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+        path = question_bank.test_path(test_id)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(generate_test(test_id, sets, seed), f, indent=4, ensure_ascii=False)
+            f.write("\n")
+        os.replace(path + ".tmp", path)
+        question_bank.build_catalog()
+        print(f"Wrote {sets * 5} questions to {path}")
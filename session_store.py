@@ -0,0 +1,327 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import state_backend
+from attempt_state import AttemptState
+
+# Session store configuration
+IDLE_SECONDS = 300        # attempts untouched this long are written out and dropped from memory
+MEMORY_LIMIT = 64 << 20   # bytes of attempt state kept in memory; least recently used beyond it spill
+SWEEP_INTERVAL = 5.0      # seconds between background sweeps, and so the most work a crash can lose
+LOCK_STRIPES = 64         # locks shared out among attempts by hash; I/O for an attempt holds only its own
+BENCH_SESSIONS = 20000    # concurrent attempts in the benchmark
+
+class SessionStore:
+    """In-progress attempts kept in memory while active and in a state backend while idle
+
+    Every get() marks the attempt as touched and possibly changed; save() after
+    changing it re-admits an attempt that was spilled in between. A sweep
+    writes changed attempts to the backend, drops the idle ones from memory,
+    and spills the least recently used ones while memory is over the limit, so
+    attempts survive both eviction and a server restart.
+
+    With a shared backend, such as the state server behind several workers,
+    save() writes through at once and get() revalidates a resident attempt
+    against the backend's version, so any worker resumes any attempt.
+
+    Every write is conditional on the version its copy was read at, so a copy
+    that another worker has moved on from, or an attempt already finished, is
+    rejected rather than overwriting newer answers. Backend I/O holds only the
+    lock of the attempt concerned, never the store's, so one slow round trip
+    delays only that candidate.
+    """
+    def __init__(self, backend=None, idle_seconds=IDLE_SECONDS, memory_limit=MEMORY_LIMIT):
+        self.backend = state_backend.LocalBackend() if backend is None else backend
+        self.shared = self.backend.shared
+        self.idle_seconds = idle_seconds
+        self.memory_limit = memory_limit
+        self._lock = threading.Lock()    # the resident map, dirty set and counters; never held during I/O
+        self._stripes = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self._resident = OrderedDict()   # attempt_id -> [state, last touched, bytes], least recent first
+        self._dirty = set()
+        self._resident_bytes = 0
+        self._counters = {"created": 0, "rehydrated": 0, "spilled": 0, "checkpointed": 0, "conflicts": 0}
+
+    def _stripe(self, attempt_id):
+        """The lock an attempt's backend I/O holds; attempts share LOCK_STRIPES of them"""
+        return self._stripes[hash(attempt_id) % LOCK_STRIPES]
+
+    @contextmanager
+    def _locked(self, attempt_ids):
+        """Hold several attempts' locks, taken in a fixed order so two sweeps never deadlock"""
+        stripes = sorted({hash(attempt_id) % LOCK_STRIPES for attempt_id in attempt_ids})
+        for stripe in stripes:
+            self._stripes[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._stripes[stripe].release()
+
+    def get(self, attempt_id):
+        """The attempt, from memory or rehydrated from the backend, or None if there is none in progress"""
+        with self._stripe(attempt_id):
+            state = self._get(attempt_id)
+        self._evict(keep=attempt_id)
+        return state
+
+    def _get(self, attempt_id):
+        with self._lock:
+            entry = self._resident.get(attempt_id)
+            if entry is not None and not self.shared:
+                return self._touch(attempt_id, entry)
+            known = None if entry is None else entry[0].version
+        loaded = self.backend.load(attempt_id, known)
+        with self._lock:
+            if loaded is None:
+                # Finished, possibly on another worker
+                self._drop(attempt_id)
+                return None
+            data, version = loaded
+            if data is None:
+                # Still the copy just revalidated: eviction skips attempts whose lock is held
+                entry = self._resident[attempt_id]
+            else:
+                state = AttemptState.from_bytes(data)
+                state.version = version
+                entry = self._admit(attempt_id, state)
+                self._counters["rehydrated"] += 1
+            return self._touch(attempt_id, entry)
+
+    def open(self, attempt_id, questions):
+        """Resume the attempt if it is in progress, otherwise start it"""
+        with self._stripe(attempt_id):
+            state = self._get(attempt_id)
+            if state is None:
+                state = AttemptState(questions)
+                with self._lock:
+                    self._touch(attempt_id, self._admit(attempt_id, state))
+                    self._counters["created"] += 1
+                # Written at once so even an attempt that is only opened survives a restart;
+                # if another worker opened it meanwhile, theirs is the attempt
+                if not self._write([attempt_id]):
+                    state = self._get(attempt_id)
+                elif not self.shared:
+                    with self._lock:
+                        self._dirty.add(attempt_id)   # the caller is about to change it
+        self._evict(keep=attempt_id)
+        return state
+
+    def in_progress(self, attempt_id):
+        """Whether the attempt has been opened and not finished, without loading it"""
+        if not self.shared:
+            with self._lock:
+                if attempt_id in self._resident:
+                    return True
+        return self.backend.exists(attempt_id)
+
+    def save(self, attempt_id, state):
+        """Note a change to an attempt returned by get() or open()
+
+        False when a shared backend rejects the change because the attempt
+        moved on without it, finished or changed by another worker since this
+        copy was read; the copy is dropped and the next get() returns the
+        current attempt.
+        """
+        with self._stripe(attempt_id):
+            with self._lock:
+                entry = self._resident.get(attempt_id)
+                if entry is None or entry[0] is not state:
+                    entry = self._admit(attempt_id, state)
+                self._touch(attempt_id, entry)
+            saved = self._write([attempt_id]) if self.shared else True
+        self._evict(keep=attempt_id)
+        return saved
+
+    def finish(self, attempt_id):
+        """Forget a submitted attempt, in memory and in the backend
+
+        True only for the call that finished it, so a result is recorded once
+        even when two tabs, workers or the live test close submit together.
+        """
+        with self._stripe(attempt_id):
+            with self._lock:
+                self._drop(attempt_id)
+            return self.backend.delete(attempt_id)
+
+    def _touch(self, attempt_id, entry):
+        self._resident.move_to_end(attempt_id)
+        entry[1] = time.time()
+        if not self.shared:
+            self._dirty.add(attempt_id)
+        return entry[0]
+
+    def _admit(self, attempt_id, state):
+        self._drop(attempt_id)
+        entry = [state, time.time(), state.nbytes()]
+        self._resident[attempt_id] = entry
+        self._resident_bytes += entry[2]
+        return entry
+
+    def _drop(self, attempt_id):
+        entry = self._resident.pop(attempt_id, None)
+        if entry is not None:
+            self._resident_bytes -= entry[2]
+        self._dirty.discard(attempt_id)
+
+    def _evict(self, keep=None):
+        """Spill least recently used attempts until memory is under the limit"""
+        with self._lock:
+            spill, excess = [], self._resident_bytes - self.memory_limit
+            for attempt_id, entry in self._resident.items():
+                if excess <= 0:
+                    break
+                if attempt_id != keep:
+                    spill.append(attempt_id)
+                    excess -= entry[2]
+        self._spill(spill)
+
+    def _spill(self, attempt_ids):
+        """Write out and drop attempts, passing over any another thread is using right now"""
+        held = []
+        try:
+            for attempt_id in attempt_ids:
+                stripe = self._stripe(attempt_id)
+                if stripe not in held and stripe.acquire(blocking=False):
+                    held.append(stripe)
+            attempt_ids = [attempt_id for attempt_id in attempt_ids if self._stripe(attempt_id) in held]
+            with self._lock:
+                dirty = [attempt_id for attempt_id in attempt_ids if attempt_id in self._dirty]
+            self._write(dirty)
+            with self._lock:
+                spilled = [attempt_id for attempt_id in attempt_ids
+                           if attempt_id in self._resident and attempt_id not in self._dirty]
+                for attempt_id in spilled:
+                    self._drop(attempt_id)
+                self._counters["spilled"] += len(spilled)
+        finally:
+            for stripe in held:
+                stripe.release()
+
+    def _write(self, attempt_ids):
+        """Store attempts as they are in memory, each conditional on the version it was read at
+
+        The caller holds the attempts' locks. True if every one was stored; a
+        rejected copy is stale and is dropped from memory.
+        """
+        with self._lock:
+            states = [(attempt_id, self._resident[attempt_id][0]) for attempt_id in attempt_ids
+                      if attempt_id in self._resident]
+            items = [(attempt_id, state.to_bytes(), state.version) for attempt_id, state in states]
+        if not items:
+            return True
+        versions = self.backend.store(items)
+        with self._lock:
+            for (attempt_id, state), version in zip(states, versions):
+                if version is None:
+                    self._counters["conflicts"] += 1
+                    if self._resident.get(attempt_id, [None])[0] is state:
+                        self._drop(attempt_id)
+                else:
+                    state.version = version
+                    self._dirty.discard(attempt_id)
+        return None not in versions
+
+    def sweep(self, now=None):
+        """Spill idle attempts and checkpoint changed ones; returns how many were spilled"""
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [attempt_id for attempt_id, entry in self._resident.items()
+                    if now - entry[1] >= self.idle_seconds]
+            spilled_before = self._counters["spilled"]
+        self._spill(idle)
+        self.flush()
+        with self._lock:
+            self._counters["checkpointed"] += 1
+            return self._counters["spilled"] - spilled_before
+
+    def flush(self):
+        """Write every changed attempt, as on shutdown"""
+        with self._lock:
+            dirty = list(self._dirty)
+        with self._locked(dirty):
+            self._write(dirty)
+
+    def stats(self):
+        stored = self.backend.count()
+        with self._lock:
+            return dict(self._counters, resident=len(self._resident), resident_bytes=self._resident_bytes,
+                        stored=stored)
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def _sweep_forever(store):
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            store.sweep()
+        except Exception:
+            pass  # a failed sweep leaves attempts dirty in memory; the next one retries
+
+def get_store():
+    """The process-wide store, with its background sweeper and a flush at exit"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(state_backend.get_backend())
+            threading.Thread(target=_sweep_forever, args=(_store,), name="session-sweeper", daemon=True).start()
+            atexit.register(_store.flush)
+        return _store
+
+def benchmark(sessions=BENCH_SESSIONS, questions=100, memory_limit=2 << 20):
+    """Resident memory, spill and rehydrate costs for many attempts under a small memory ceiling"""
+    import random
+    import tempfile
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, state_backend.STATE_FILE)
+        store = SessionStore(state_backend.LocalBackend(path), idle_seconds=60, memory_limit=memory_limit)
+        started = time.perf_counter()
+        for n in range(sessions):
+            state = store.open(f"candidate-{n}", questions)
+            state.answer(n % questions, n % 4)
+            store.save(f"candidate-{n}", state)
+        open_s = time.perf_counter() - started
+
+        # Revisit random attempts: recent ones are in memory, the rest come back from disk
+        timings = []
+        for _ in range(2000):
+            n = rng.randrange(sessions)
+            started = time.perf_counter()
+            state = store.get(f"candidate-{n}")
+            timings.append((time.perf_counter() - started) * 1e6)
+            assert state.response(n % questions) == n % 4
+        timings.sort()
+        stats = store.stats()
+
+        # Everything idle for a minute is written out and dropped
+        store.sweep(time.time() + 60)
+        idle = store.stats()
+        store.close()
+
+        # A restarted server finds every attempt where it was left
+        restarted = SessionStore(state_backend.LocalBackend(path), memory_limit=memory_limit)
+        resumed = sum(1 for n in range(0, sessions, 97)
+                      if restarted.get(f"candidate-{n}").response(n % questions) == n % 4)
+        restarted.close()
+        return open_s, timings, stats, idle, resumed, len(range(0, sessions, 97))
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else BENCH_SESSIONS
+    open_s, timings, stats, idle, resumed, checked = benchmark(sessions)
+    print(f"{sessions} attempts opened in {open_s:.2f}s under a 2 MB ceiling: {stats['resident']} resident "
+          f"({stats['resident_bytes'] / stats['resident']:.0f} B each), {stats['spilled']} spilled")
+    print(f"get: median {timings[len(timings) // 2]:.0f} us, p99 {timings[int(len(timings) * 0.99)]:.0f} us "
+          f"({stats['rehydrated']} rehydrated from disk)")
+    print(f"after an idle sweep: {idle['resident']} resident, {idle['stored']} on disk; "
+          f"after a restart {resumed}/{checked} sampled attempts resumed intact")
@@ -0,0 +1,590 @@
+"""Attempts and results, kept locally or on a state server that every worker shares
+
+History views (attempts_for_email, user_summary, popular_tests) still read each node's own results store.
+"""
+import hmac
+import http.client
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import results_db
+import results_log
+
+# State backend configuration
+STATE_URL = os.environ.get("EXAM_STATE_URL")  # state server shared by every worker, e.g. http://10.0.0.5:8765;
+                                              # unset keeps attempts and results in this process's own files
+STATE_FILE = "sessions.db"
+STATE_SECRET = os.environ.get("EXAM_STATE_SECRET")  # every request to the state server must carry it
+SECRET_HEADER = "X-Exam-State-Secret"
+HTTP_TIMEOUT = 5.0        # seconds before a state server request fails
+SERVER_HOST = "127.0.0.1" # the state server is reachable from other machines only when given their interface
+SERVER_PORT = 8765
+HARNESS_WORKERS = 4       # worker processes in the multi-process harness
+HARNESS_CANDIDATES = 200  # candidates the harness's load balancer moves between them
+HARNESS_QUESTIONS = 30
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        attempt_id TEXT PRIMARY KEY,
+        state BLOB NOT NULL,
+        updated REAL NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+"""
+UPSERT_SESSION = """
+    INSERT INTO sessions (attempt_id, state, updated, version) VALUES (?, ?, ?, ?)
+    ON CONFLICT (attempt_id) DO UPDATE SET
+        state = excluded.state, updated = excluded.updated, version = excluded.version
+"""
+# The blob is only read back when the caller's copy is out of date
+SELECT_SESSION = """
+    SELECT CASE WHEN version = ? THEN NULL ELSE state END, version FROM sessions WHERE attempt_id = ?
+"""
+SELECT_SESSION_VERSION = """
+    SELECT version FROM sessions WHERE attempt_id = ?
+"""
+SELECT_SESSION_EXISTS = """
+    SELECT 1 FROM sessions WHERE attempt_id = ?
+"""
+DELETE_SESSION = """
+    DELETE FROM sessions WHERE attempt_id = ?
+"""
+COUNT_SESSIONS = """
+    SELECT COUNT(*) FROM sessions
+"""
+
+# Every backend keeps serialised attempts under a version that changes on each store:
+#   load(attempt_id, version)        None if missing, else (data, version); data None if version is current
+#   store([(attempt_id, data, base)]) new versions, None where base (None: must not exist) is stale
+#   delete(attempt_id)               True only for the call that removed it
+#   exists, count, add_results, close, results_version, scores(test_id)
+#   register_live, live_registrants(live_id), live_registration(live_id, candidate)
+# shared is True when other worker processes write through the same backend.
+
+def _next_version(last):
+    """Versions increase within a process and, being clock based, across restarts"""
+    return max(last + 1, time.time_ns())
+
+class MemoryBackend:
+    """Attempts and results in this process's memory, as the harness's state server keeps them"""
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attempts = {}   # attempt_id -> (data, version)
+        self._version = 0
+        self.results = []
+        self._submissions = set()
+        self._registrations = {}   # live_id -> {candidate: (name, email)}, in registration order
+
+    def load(self, attempt_id, version=None):
+        with self._lock:
+            entry = self._attempts.get(attempt_id)
+        if entry is None:
+            return None
+        return (None, version) if entry[1] == version else entry
+
+    def store(self, items):
+        versions = []
+        with self._lock:
+            for attempt_id, data, base in items:
+                entry = self._attempts.get(attempt_id)
+                if (None if entry is None else entry[1]) != base:
+                    versions.append(None)
+                    continue
+                self._version = _next_version(self._version)
+                self._attempts[attempt_id] = (bytes(data), self._version)
+                versions.append(self._version)
+        return versions
+
+    def delete(self, attempt_id):
+        with self._lock:
+            return self._attempts.pop(attempt_id, None) is not None
+
+    def exists(self, attempt_id):
+        with self._lock:
+            return attempt_id in self._attempts
+
+    def count(self):
+        with self._lock:
+            return len(self._attempts)
+
+    def add_results(self, records):
+        with self._lock:
+            for record in records:
+                # A retried batch is stored once, as the results store does by submission id
+                submission = record.get("submission_id")
+                if submission is None or submission not in self._submissions:
+                    self._submissions.add(submission)
+                    self.results.append(record)
+
+    def results_version(self):
+        with self._lock:
+            return str(len(self.results))
+
+    def scores(self, test_id):
+        with self._lock:
+            return [(r["score"], r.get("completion_time")) for r in self.results if r.get("test_id") == test_id]
+
+    def register_live(self, live_id, candidate, registered, name=None, email=None):
+        with self._lock:
+            registrants = self._registrations.setdefault(live_id, {})
+            known = registrants.get(candidate, (None, None))
+            registrants[candidate] = (known[0] if name is None else name, known[1] if email is None else email)
+
+    def live_registrants(self, live_id):
+        with self._lock:
+            return dict(self._registrations.get(live_id, {}))
+
+    def live_registration(self, live_id, candidate):
+        with self._lock:
+            return self._registrations.get(live_id, {}).get(candidate)
+
+    def close(self):
+        pass
+
+class LocalBackend:
+    """Attempts in a SQLite file, results in the results store and log; one process owns them"""
+    shared = False
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = 0
+
+    def _connection(self):
+        # Opened on first use so processes that only submit results never create the file
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            _upgrade_schema(conn)
+            self._version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM sessions").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def load(self, attempt_id, version=None):
+        with self._lock:
+            row = self._connection().execute(SELECT_SESSION, (version, attempt_id)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def store(self, items):
+        now = time.time()
+        versions = []
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = []
+                for attempt_id, data, base in items:
+                    row = conn.execute(SELECT_SESSION_VERSION, (attempt_id,)).fetchone()
+                    if (None if row is None else row[0]) != base:
+                        versions.append(None)
+                        continue
+                    self._version = _next_version(self._version)
+                    rows.append((attempt_id, data, now, self._version))
+                    versions.append(self._version)
+                conn.executemany(UPSERT_SESSION, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return versions
+
+    def delete(self, attempt_id):
+        with self._lock:
+            return self._connection().execute(DELETE_SESSION, (attempt_id,)).rowcount > 0
+
+    def exists(self, attempt_id):
+        with self._lock:
+            return self._connection().execute(SELECT_SESSION_EXISTS, (attempt_id,)).fetchone() is not None
+
+    def count(self):
+        with self._lock:
+            return self._connection().execute(COUNT_SESSIONS).fetchone()[0]
+
+    def add_results(self, records):
+        results_db.insert_results(records)
+        results_log.append_results(records)
+
+    def results_version(self):
+        return results_db.results_version()
+
+    def scores(self, test_id):
+        return [(a["score"], a["completion_time"]) for a in results_db.attempts_for_test(test_id)]
+
+    def register_live(self, live_id, candidate, registered, name=None, email=None):
+        results_db.register_live(live_id, candidate, registered, name, email)
+
+    def live_registrants(self, live_id):
+        return results_db.live_registrants(live_id)
+
+    def live_registration(self, live_id, candidate):
+        return results_db.live_registration(live_id, candidate)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def _upgrade_schema(conn):
+    """Add columns introduced after a store was first created"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+    if "version" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+class HTTPBackend:
+    """Attempts and results kept by a state server that every worker process shares"""
+    shared = True
+
+    def __init__(self, url=STATE_URL, secret=STATE_SECRET, timeout=HTTP_TIMEOUT):
+        if not secret:
+            raise ValueError("the state server needs its shared secret: set EXAM_STATE_SECRET")
+        parts = urlsplit(url)
+        self.url = url
+        self._secret = secret
+        self.timeout = timeout
+        self._host, self._port = parts.hostname, parts.port or 80
+        self._prefix = parts.path.rstrip("/")
+        self._local = threading.local()   # one keep-alive connection per thread
+
+    def _request(self, method, path, body=None, headers=None, retry=True):
+        """Status, headers and body of one request; idempotent ones retry once on a dropped connection"""
+        while True:
+            conn = getattr(self._local, "conn", None)
+            try:
+                if conn is None:
+                    conn = self._local.conn = http.client.HTTPConnection(self._host, self._port,
+                                                                         timeout=self.timeout)
+                    conn.connect()
+                    # Headers and body go out as separate writes; without this each request waits on a delayed ACK
+                    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.request(method, self._prefix + path, body=body,
+                             headers=dict(headers or {}, **{SECRET_HEADER: self._secret}))
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                if conn is not None:
+                    conn.close()
+                self._local.conn = None
+                if not retry:
+                    raise
+                retry = False
+                continue
+            if response.status == 401:
+                raise PermissionError(f"state server {self.url} refused EXAM_STATE_SECRET")
+            if response.status >= 500 or response.status == 400:
+                raise ConnectionError(f"state server {self.url}: {response.status} {data.decode(errors='replace')}")
+            return response.status, response.headers, data
+
+    def load(self, attempt_id, version=None):
+        status, headers, data = self._request("GET", "/attempts/" + quote(attempt_id, safe=""),
+                                              headers=None if version is None else {"If-None-Match": str(version)})
+        if status == 404:
+            return None
+        version = int(headers["ETag"])
+        return (None, version) if status == 304 else (data, version)
+
+    def store(self, items):
+        versions = []
+        for attempt_id, data, base in items:
+            condition = {"If-None-Match": "*"} if base is None else {"If-Match": str(base)}
+            status, headers, _ = self._request("PUT", "/attempts/" + quote(attempt_id, safe=""), body=bytes(data),
+                                               headers=condition)
+            versions.append(None if status == 412 else int(headers["ETag"]))
+        return versions
+
+    def delete(self, attempt_id):
+        return self._request("DELETE", "/attempts/" + quote(attempt_id, safe=""))[0] == 200
+
+    def exists(self, attempt_id):
+        return self._request("HEAD", "/attempts/" + quote(attempt_id, safe=""))[0] == 200
+
+    def count(self):
+        return json.loads(self._request("GET", "/attempts")[2])["attempts"]
+
+    def add_results(self, records):
+        # Not retried here: the submission queue retries whole batches
+        self._request("POST", "/results", body=json.dumps(records).encode(),
+                      headers={"Content-Type": "application/json"}, retry=False)
+
+    def results_version(self):
+        return json.loads(self._request("GET", "/results/version")[2])["version"]
+
+    def scores(self, test_id):
+        return [tuple(entry) for entry in json.loads(self._request("GET", "/results/scores/" + quote(test_id, safe=""))[2])]
+
+    def register_live(self, live_id, candidate, registered, name=None, email=None):
+        registration = {"candidate": candidate, "registered": registered, "name": name, "email": email}
+        self._request("POST", f"/live/{quote(live_id, safe='')}/registrants", body=json.dumps(registration).encode(),
+                      headers={"Content-Type": "application/json"})
+
+    def live_registrants(self, live_id):
+        registrants = json.loads(self._request("GET", f"/live/{quote(live_id, safe='')}/registrants")[2])
+        return {candidate: (name, email) for candidate, name, email in registrants}
+
+    def live_registration(self, live_id, candidate):
+        status, _, data = self._request("GET", f"/live/{quote(live_id, safe='')}/registrants/{quote(candidate, safe='')}")
+        return None if status == 404 else tuple(json.loads(data))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class _StateHandler(BaseHTTPRequestHandler):
+    """Serves a backend to HTTPBackend clients; the server's backend attribute is the store"""
+    protocol_version = "HTTP/1.1"   # keep-alive, so each worker thread reuses one connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", version=None):
+        self.send_response(status)
+        if version is not None:
+            self.send_header("ETag", str(version))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _attempt_id(self):
+        if not self.path.startswith("/attempts/"):
+            return None
+        return unquote(self.path[len("/attempts/"):])
+
+    def _registration(self):
+        """(live_id, candidate or None) of a /live/<live_id>/registrants[/<candidate>] path, else None"""
+        parts = self.path.split("/")
+        if len(parts) not in (4, 5) or parts[1] != "live" or parts[3] != "registrants":
+            return None
+        return unquote(parts[2]), unquote(parts[4]) if len(parts) == 5 else None
+
+    def _authorised(self):
+        secret = self.headers.get(SECRET_HEADER, "")
+        return hmac.compare_digest(secret.encode(), self.server.secret.encode())
+
+    def _handle(self, method):
+        backend = self.server.backend
+        if not self._authorised():
+            self.close_connection = True   # its body is never read, so the connection cannot be reused
+            self._send(401)
+            return
+        try:
+            attempt_id = self._attempt_id()
+            if method == "GET" and attempt_id is not None:
+                version = self.headers.get("If-None-Match")
+                loaded = backend.load(attempt_id, None if version is None else int(version))
+                if loaded is None:
+                    self._send(404)
+                elif loaded[0] is None:
+                    self._send(304, version=loaded[1])
+                else:
+                    self._send(200, loaded[0], version=loaded[1])
+            elif method == "GET" and self.path == "/attempts":
+                self._send(200, json.dumps({"attempts": backend.count()}).encode())
+            elif method == "HEAD" and attempt_id is not None:
+                self._send(200 if backend.exists(attempt_id) else 404)
+            elif method == "PUT" and attempt_id is not None:
+                body = self._body()
+                if self.headers.get("If-None-Match") == "*":
+                    base = None
+                elif "If-Match" in self.headers:
+                    base = int(self.headers["If-Match"])
+                else:
+                    self._send(428)   # an unconditional write could overwrite newer answers
+                    return
+                version = backend.store([(attempt_id, body, base)])[0]
+                self._send(412 if version is None else 200, version=version)
+            elif method == "DELETE" and attempt_id is not None:
+                self._send(200 if backend.delete(attempt_id) else 404)
+            elif method == "GET" and self.path == "/results/version":
+                self._send(200, json.dumps({"version": backend.results_version()}).encode())
+            elif method == "GET" and self.path.startswith("/results/scores/"):
+                test_id = unquote(self.path[len("/results/scores/"):])
+                self._send(200, json.dumps(backend.scores(test_id)).encode())
+            elif method == "POST" and self.path == "/results":
+                backend.add_results(json.loads(self._body()))
+                self._send(200)
+            elif self._registration() is not None:
+                live_id, candidate = self._registration()
+                if method == "POST" and candidate is None:
+                    registration = json.loads(self._body())
+                    backend.register_live(live_id, registration["candidate"], registration["registered"],
+                                          registration.get("name"), registration.get("email"))
+                    self._send(200)
+                elif method == "GET" and candidate is None:
+                    registrants = [[registrant, name, email]
+                                   for registrant, (name, email) in backend.live_registrants(live_id).items()]
+                    self._send(200, json.dumps(registrants).encode())
+                elif method == "GET":
+                    registration = backend.live_registration(live_id, candidate)
+                    if registration is None:
+                        self._send(404)
+                    else:
+                        self._send(200, json.dumps(registration).encode())
+                else:
+                    self._send(404)
+            else:
+                self._send(404)
+        except ValueError as e:
+            self._send(400, str(e).encode())
+        except Exception as e:
+            self._send(500, repr(e).encode())
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_HEAD(self):
+        self._handle("HEAD")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def do_POST(self):
+        self._handle("POST")
+
+def make_server(backend, host=SERVER_HOST, port=SERVER_PORT, secret=STATE_SECRET):
+    """A state server over a backend; port 0 picks a free one. Call serve_forever() to run it"""
+    if not secret:
+        raise ValueError("the state server needs a shared secret: set EXAM_STATE_SECRET")
+    server = ThreadingHTTPServer((host, port), _StateHandler)
+    server.backend = backend
+    server.secret = secret
+    return server
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """The process-wide backend: the state server at EXAM_STATE_URL if set, otherwise local files"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = HTTPBackend(STATE_URL) if STATE_URL else LocalBackend()
+        return _backend
+
+def _harness_option(attempt_id, number):
+    """The option a harness candidate picks for a question"""
+    return zlib.crc32(f"{attempt_id}:{number}".encode()) % 4
+
+def _harness_worker(url, secret, tasks, results):
+    """One worker process: serve whichever candidates the load balancer sends, from the shared backend"""
+    import session_store
+    store = session_store.SessionStore(HTTPBackend(url, secret))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        attempt_id, number, questions = task
+        started = time.perf_counter()
+        state = store.open(attempt_id, questions)
+        # Every earlier answer must be there, whichever worker recorded it
+        intact = all(state.response(n) == _harness_option(attempt_id, n) for n in range(number))
+        if number < questions:
+            state.visit(number)
+            state.answer(number, _harness_option(attempt_id, number))
+            store.save(attempt_id, state)
+        else:
+            store.backend.add_results([{"test_id": "harness", "email": attempt_id, "score": 0,
+                                        "total_questions": questions, "completion_date": "",
+                                        "responses": state.responses.tolist()}])
+            store.finish(attempt_id)
+        results.put((intact, time.perf_counter() - started))
+    store.close()
+
+def harness(workers=HARNESS_WORKERS, candidates=HARNESS_CANDIDATES, questions=HARNESS_QUESTIONS):
+    """Candidates answer a test through worker processes chosen at random for every request
+
+    The workers share an in-memory state server; halfway through one worker is
+    killed and replaced, losing everything it held in memory.
+    """
+    import multiprocessing
+    import random
+    backend = MemoryBackend()
+    secret = secrets.token_hex(16)
+    server = make_server(backend, port=0, secret=secret)
+    threading.Thread(target=server.serve_forever, name="state-server", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    queues = [context.Queue() for _ in range(workers)]
+    processes = [context.Process(target=_harness_worker, args=(url, secret, queues[n], results)) for n in range(workers)]
+    for process in processes:
+        process.start()
+
+    rng = random.Random(0)
+    last_worker, moves, broken, timings = {}, 0, 0, []
+    started = time.perf_counter()
+    # One round per question, then one to submit; a round finishes before the next begins
+    for number in range(questions + 1):
+        if number == questions // 2:
+            processes[0].kill()
+            processes[0].join()
+            queues[0] = context.Queue()
+            processes[0] = context.Process(target=_harness_worker, args=(url, secret, queues[0], results))
+            processes[0].start()
+        for candidate in range(candidates):
+            worker = rng.randrange(workers)
+            moves += last_worker.get(candidate, worker) != worker
+            last_worker[candidate] = worker
+            queues[worker].put((f"harness-{candidate}", number, questions))
+        for _ in range(candidates):
+            intact, seconds = results.get(timeout=60)
+            broken += not intact
+            timings.append(seconds * 1000)
+    elapsed = time.perf_counter() - started
+    for queue, process in zip(queues, processes):
+        queue.put(None)
+        process.join()
+    server.shutdown()
+
+    expected = {f"harness-{candidate}": [_harness_option(f"harness-{candidate}", n) for n in range(questions)]
+                for candidate in range(candidates)}
+    submitted = sum(1 for record in backend.results if record["responses"] == expected[record["email"]])
+    timings.sort()
+    return {
+        "requests": len(timings), "seconds": elapsed, "moves": moves, "broken": broken,
+        "submitted": submitted, "left_open": backend.count(),
+        "median_ms": timings[len(timings) // 2], "p99_ms": timings[int(len(timings) * 0.99)]
+    }
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "harness"
+    if command == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else SERVER_PORT
+        host = sys.argv[3] if len(sys.argv) > 3 else SERVER_HOST
+        server = make_server(LocalBackend(), host, port)
+        print(f"Serving attempts from {STATE_FILE} and results on {host}:{port}")
+        server.serve_forever()
+    else:
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else HARNESS_WORKERS
+        candidates = int(sys.argv[3]) if len(sys.argv) > 3 else HARNESS_CANDIDATES
+        report = harness(workers, candidates)
+        print(f"{report['requests']} requests from {candidates} candidates over {workers} workers in "
+              f"{report['seconds']:.2f}s; {report['moves']} moved to another worker, one worker killed midway")
+        print(f"per request: median {report['median_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms")
+        print(f"{report['broken']} requests found an answer missing; {report['submitted']}/{candidates} "
+              f"submitted with every answer intact, {report['left_open']} attempts left open")
@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import results_log
+import state_backend
+
+# Write-behind queue configuration
+QUEUE_SIZE = 10000       # submissions held in memory before submit() falls back to a direct write
+BATCH_SIZE = 256         # submissions written per flush
+FLUSH_INTERVAL = 0.2     # seconds the worker waits to fill a batch
+MAX_RETRIES = 5          # failed flushes of a batch, with doubling waits, before it is written one by one
+DEAD_LETTER_FILE = "submissions_dead.jsonl"  # submissions that could not be written, for replay_dead_letters()
+SHUTDOWN_TIMEOUT = 30    # seconds shutdown() waits for the writer at exit
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "submitted": 0,
+    "written": 0,
+    "direct_writes": 0,
+    "failed_flushes": 0,
+    "dead_letters": 0,
+    "batches": 0,
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+    "total_flush_ms": 0.0,
+}
+
+def _write_batch(batch):
+    """Persist a batch through the state backend: the local results store and log, or the state server"""
+    started = time.perf_counter()
+    state_backend.get_backend().add_results(batch)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _metrics_lock:
+        _metrics["written"] += len(batch)
+        _metrics["batches"] += 1
+        _metrics["last_flush_ms"] = elapsed_ms
+        _metrics["max_flush_ms"] = max(_metrics["max_flush_ms"], elapsed_ms)
+        _metrics["total_flush_ms"] += elapsed_ms
+
+def _dead_letter(record, error):
+    """Set aside a submission that cannot be written so it stops blocking the ones behind it"""
+    line = json.dumps({"error": repr(error), "record": record}, ensure_ascii=False, default=str) + "\n"
+    with open(DEAD_LETTER_FILE, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    with _metrics_lock:
+        _metrics["dead_letters"] += 1
+
+def _write_with_retries(items):
+    """Write a batch, retrying transient failures; records that still fail alone are dead-lettered"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            _write_batch(items)
+            return
+        except Exception:
+            with _metrics_lock:
+                _metrics["failed_flushes"] += 1
+            time.sleep(FLUSH_INTERVAL * 2 ** attempt)
+    # Writing is idempotent per submission id, so records of a partly written batch are not doubled
+    for item in items:
+        try:
+            _write_batch([item])
+        except Exception as error:
+            _dead_letter(item, error)
+
+def replay_dead_letters(timeout=SHUTDOWN_TIMEOUT):
+    """Resubmit dead-lettered submissions, for example once the state server is back; returns how many"""
+    replay = DEAD_LETTER_FILE + ".replay"
+    if os.path.exists(DEAD_LETTER_FILE):
+        # Appended to what an interrupted replay left behind; a record in both is stored once by its id
+        with open(DEAD_LETTER_FILE, "rb") as dead, open(replay, "ab") as f:
+            f.write(dead.read())
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(DEAD_LETTER_FILE)
+    if not os.path.exists(replay):
+        return 0
+    with open(replay, encoding="utf-8") as f:
+        records = [json.loads(line)["record"] for line in f if line.strip()]
+    for record in records:
+        submit(record)
+    # Kept until every record is written or dead-lettered afresh, so an interrupted replay loses nothing
+    if drain(timeout):
+        os.remove(replay)
+    return len(records)
+
+def _run():
+    """Worker loop: collect submissions into batches and flush them"""
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        # None is the shutdown sentinel; anything queued before it is still written
+        stop = None in batch
+        items = [item for item in batch if item is not None]
+        try:
+            if items:
+                _write_with_retries(items)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+        if stop:
+            return
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="submission-writer", daemon=True)
+            _worker.start()
+
+def submit(user_data):
+    """Hand a submission to the background writer without waiting on disk"""
+    _ensure_worker()
+    # Lets a retried write recognise a submission it has already stored
+    user_data.setdefault("submission_id", uuid.uuid4().hex)
+    with _metrics_lock:
+        _metrics["submitted"] += 1
+    try:
+        _queue.put_nowait(user_data)
+    except queue.Full:
+        # Never lose a result: when the queue is saturated write it directly, dead-lettering it if that fails
+        with _metrics_lock:
+            _metrics["direct_writes"] += 1
+        _write_with_retries([user_data])
+
+def drain(timeout=None):
+    """Block until every queued submission has been written"""
+    if _worker is None:
+        return True
+    if timeout is None:
+        _queue.join()
+        return True
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def shutdown():
+    """Drain the queue and stop the worker"""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None and worker.is_alive():
+        _queue.put(None)
+        worker.join(SHUTDOWN_TIMEOUT)
+    results_log.flush()
+
+def metrics():
+    """Queue depth and flush latency figures"""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot["queue_depth"] = _queue.qsize()
+    snapshot["avg_flush_ms"] = snapshot["total_flush_ms"] / snapshot["batches"] if snapshot["batches"] else 0.0
+    return snapshot
+
+atexit.register(shutdown)
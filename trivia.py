@@ -1,8 +1,15 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
 import time
+import threading
+import uuid
+from countdown_timer import countdown_timer
+import admission
+import deadline_scheduler
+import grading
+import question_bank
+import rank_index
+import submission_queue
 
 # Initialize session state variables
 if 'current_question' not in st.session_state:
@@ -17,72 +24,27 @@ if 'question_start_time' not in st.session_state:
     st.session_state.question_start_time = None
 if 'remaining_time' not in st.session_state:
     st.session_state.remaining_time = None
+if 'responses' not in st.session_state:
+    st.session_state.responses = []
 
 # Quiz configuration
 QUESTION_TIME_LIMIT = 45  # seconds per question
 TOTAL_TIME_LIMIT = 300   # 5 minutes for entire quiz
 TIME_WARNING = 60        # seconds remaining when to show warning
+TIMER_THRESHOLDS = {'critical': TIME_WARNING / 3, 'caution': TIME_WARNING}  # red blinking / orange
 CORRECT_MARKS = 2        # marks for correct answer
 WRONG_MARKS = -0.5       # negative marking for wrong answer
+MARKING_SCHEME = grading.MarkingScheme(correct=CORRECT_MARKS, wrong=WRONG_MARKS)
+TEST_ID = "aptitude-reasoning"  # results store key for this quiz
+FINALIZE_WAIT = 10       # seconds a submit waits for a concurrent finalise to rank the attempt
 
-# Quiz questions
-questions = [
-    {
-        "question": """Directions: Study the following digit-letter-symbol sequence carefully:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        How many such symbols are there in the above sequence, each of which is immediately preceded by a consonant and immediately followed by a number?""",
-        "options": ["None", "One", "Two", "Four", "None of these"],
-        "correct_answer": "Two"
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        Which of the following is fifth to the left of 15th element from the left?""",
-        "options": ["S", "P", "E", "#", "None of these"],
-        "correct_answer": "P"
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        If all the numbers are dropped in the given series, then which element will be at sixth position from right end?""",
-        "options": ["Z", "M", "L", "D", "None of these"],
-        "correct_answer": "L"
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        How many such numbers are there in the above sequence, each of which is immediately preceded by a vowel and immediately followed by a consonant?""",
-        "options": ["Three", "Two", "None", "One", "None of these"],
-        "correct_answer": "One"
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        What should come in place of question mark in the following on the basis of above sequence?
-        B, &, P, 7, ?""",
-        "options": ["#", "M", "D", "2", "J"],
-        "correct_answer": "J"
-    }
-]
+# Quiz questions, shared from the process-wide question bank cache
+questions = question_bank.load_test(TEST_ID).questions
+admission_control = admission.get_controller()
 
 def save_user_data(user_data):
-    """Save user data to a JSON file"""
-    filename = "user_data.json"
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            existing_data = json.load(f)
-    else:
-        existing_data = []
-    
-    existing_data.append(user_data)
-    
-    with open(filename, "w") as f:
-        json.dump(existing_data, f, indent=4)
+    """Queue user data for the background results writer"""
+    submission_queue.submit(user_data)
 
 def format_time(seconds):
     """Format seconds into minutes:seconds"""
@@ -92,29 +54,110 @@ def format_time(seconds):
     seconds = int(seconds % 60)
     return f"{minutes:02d}:{seconds:02d}"
 
-def get_timer_color(remaining_time):
-    """Return color based on remaining time"""
-    if remaining_time <= TIME_WARNING/3:
-        return "red"
-    elif remaining_time <= TIME_WARNING:
-        return "orange"
-    return "green"
+def start_attempt(ticket):
+    """Open an attempt and register its deadlines with the server-side scheduler"""
+    now = time.time()
+    attempt = {
+        "id": ticket,
+        "name": st.session_state.user_name,
+        "email": st.session_state.user_email,
+        "score": 0,
+        "responses": st.session_state.responses,
+        "current_question": 0,
+        "start_time": now,
+        "deadline": now + TOTAL_TIME_LIMIT,
+        "finalized": False,
+        "rank": None,
+        "lock": threading.Lock(),
+        "done": threading.Event()   # set once the finalising path has queued the result and ranked it
+    }
+    st.session_state.attempt = attempt
+    # Abandoned tabs are finalised by the scheduler thread, not by a browser rerun
+    deadline_scheduler.get_scheduler().schedule(attempt["id"], attempt["deadline"], lambda: finalize_attempt(attempt))
+    schedule_question_deadline(attempt)
+
+def schedule_question_deadline(attempt):
+    """Enforce QUESTION_TIME_LIMIT on the attempt's current question"""
+    question = attempt["current_question"]
+    attempt["question_deadline"] = min(time.time() + QUESTION_TIME_LIMIT, attempt["deadline"])
+    deadline_scheduler.get_scheduler().schedule(
+        attempt["id"] + ":question", attempt["question_deadline"], lambda: expire_question(attempt, question)
+    )
+
+def expire_question(attempt, question):
+    """Scheduler callback: leave the question unattempted and move on"""
+    with attempt["lock"]:
+        if attempt["finalized"] or attempt["current_question"] != question:
+            return
+        attempt["responses"].append(grading.UNATTEMPTED)
+        if question < len(questions) - 1:
+            attempt["current_question"] += 1
+            schedule_question_deadline(attempt)
+            return
+    finalize_attempt(attempt)
+
+def finalize_attempt(attempt):
+    """Persist an attempt exactly once, whether the candidate or the scheduler submits it"""
+    with attempt["lock"]:
+        if attempt["finalized"]:
+            return
+        attempt["finalized"] = True
+    try:
+        final_time = min(time.time() - attempt["start_time"], TOTAL_TIME_LIMIT)
+        
+        # Save user data first, so a failure below never loses the result
+        responses = attempt["responses"]
+        user_data = {
+            "test_id": TEST_ID,
+            "name": attempt["name"],
+            "email": attempt["email"],
+            "score": attempt["score"],
+            "total_questions": len(questions),
+            "completion_time": format_time(final_time),
+            "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            # Option index per question (-1 unattempted) so scores can be re-graded later
+            "responses": responses + [grading.UNATTEMPTED] * (len(questions) - len(responses))
+        }
+        save_user_data(user_data)
+        scheduler = deadline_scheduler.get_scheduler()
+        scheduler.cancel(attempt["id"])
+        scheduler.cancel(attempt["id"] + ":question")
+        admission_control.release(attempt["id"])
+        attempt["rank"] = rank_index.record_attempt(TEST_ID, user_data["score"], user_data["completion_time"])
+    finally:
+        attempt["done"].set()
 
 def submit_quiz():
     """Handle quiz submission"""
     st.session_state.quiz_complete = True
-    final_time = TOTAL_TIME_LIMIT - st.session_state.remaining_time
-    
-    # Save user data
-    user_data = {
-        "name": st.session_state.user_name,
-        "email": st.session_state.user_email,
-        "score": st.session_state.score,
-        "total_questions": len(questions),
-        "completion_time": format_time(final_time),
-        "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_user_data(user_data)
+    attempt = st.session_state.attempt
+    finalize_attempt(attempt)
+    # The scheduler may be finalising it at the same moment; its rank is known once that finishes
+    attempt["done"].wait(FINALIZE_WAIT)
+    st.session_state.rank = attempt["rank"]
+
+def begin_quiz():
+    """Start the quiz once the admission controller has a slot for this candidate"""
+    admitted, position, eta = admission_control.request(st.session_state.ticket, TOTAL_TIME_LIMIT)
+    if admitted:
+        del st.session_state.waiting
+        st.session_state.quiz_started = True
+        st.session_state.remaining_time = TOTAL_TIME_LIMIT
+        st.session_state.question_start_time = time.time()
+        start_attempt(st.session_state.ticket)
+    return admitted, position, eta
+
+@st.fragment(run_every=admission.WAIT_POLL_SECONDS)
+def waiting_room():
+    """Hold the candidate's place in line, asking again every few seconds"""
+    admitted, position, eta = begin_quiz()
+    if admitted:
+        st.rerun()
+    if position is None:
+        st.error("Too many candidates are waiting right now. This page will keep trying.")
+    else:
+        st.info(f"The assessment is full right now. You are number {position} in line, "
+                f"about {format_time(eta)} to go. Your quiz will start automatically.")
 
 def main():
     # Page configuration
@@ -174,10 +217,14 @@ def main():
     if not st.session_state.quiz_started and not st.session_state.quiz_complete:
         if st.session_state.user_name and st.session_state.user_email:
             st.info("Important: Read each question carefully. There is negative marking for wrong answers.")
+            if 'waiting' in st.session_state:
+                waiting_room()
+                return
             if st.button("Start Quiz"):
-                st.session_state.quiz_started = True
-                st.session_state.remaining_time = TOTAL_TIME_LIMIT
-                st.session_state.question_start_time = time.time()
+                st.session_state.ticket = uuid.uuid4().hex
+                st.session_state.waiting = True
+                if not begin_quiz()[0]:
+                    st.rerun()
                 #st.rerun()
         else:
             st.warning("Please enter your details in the sidebar to start the quiz!")
@@ -185,60 +232,83 @@ def main():
 
     # Quiz section
     if st.session_state.quiz_started and not st.session_state.quiz_complete:
-        # Update timer
-        current_time = time.time()
-        time_elapsed = current_time - st.session_state.question_start_time
-        st.session_state.remaining_time = max(0, TOTAL_TIME_LIMIT - time_elapsed)
+        # In-test runs are never shed, and count towards shedding optional work elsewhere
+        with admission_control.in_test():
+            # Pick up anything the deadline scheduler did while the browser was idle
+            attempt = st.session_state.attempt
+            if not attempt["finalized"] and not admission_control.heartbeat(attempt["id"]):
+                # The slot lapsed while the browser was idle; the quiz is under way, so it gets one back
+                admission_control.readmit(attempt["id"], TOTAL_TIME_LIMIT)
+            if attempt["current_question"] != st.session_state.current_question:
+                st.session_state.current_question = attempt["current_question"]
+                st.session_state.question_start_time = time.time()
+            if attempt["finalized"]:
+                # Submitted while the browser was idle: show the result, not a question that no longer takes answers
+                submit_quiz()
+                st.rerun()
         
-        # Display timer with color coding
-        timer_color = get_timer_color(st.session_state.remaining_time)
-        timer_html = f"""
-            <div style='text-align: center; color: {timer_color}; 
-                {"animation: blink 1s linear infinite" if timer_color == "red" else ""}'>
-                <h2>⏱️ Time Remaining: {format_time(st.session_state.remaining_time)}</h2>
-            </div>
-        """
-        st.markdown(timer_html, unsafe_allow_html=True)
+            # Update timer
+            st.session_state.remaining_time = max(0, attempt["deadline"] - time.time())
         
-        # Display current question
-        current_q = questions[st.session_state.current_question]
-        st.subheader(f"Question {st.session_state.current_question + 1} of {len(questions)}")
-        st.markdown(f"<div class='question-text'>{current_q['question']}", unsafe_allow_html=True)
+            # Display timer with color coding; it ticks in the browser and reruns only at expiry
+            timer_expired = countdown_timer(attempt["deadline"], TIMER_THRESHOLDS, key="quiz_timer")
         
-        # Answer options
-        answer = st.radio("Select your answer:", current_q["options"], key=f"q_{st.session_state.current_question}")
+            # Display current question
+            current_q = questions[st.session_state.current_question]
+            st.subheader(f"Question {st.session_state.current_question + 1} of {len(questions)}")
+            st.markdown(f"<div class='question-text'>{current_q.text}", unsafe_allow_html=True)
         
-        # Submit answer button or auto-submit on time out
-        if st.session_state.remaining_time <= 0:
-            submit_quiz()
-            #st.rerun()
+            # Answer options; the radio returns the chosen option index
+            answer = st.radio("Select your answer:", range(len(current_q.options)), format_func=current_q.options.__getitem__,
+                              key=f"q_{st.session_state.current_question}")
         
-        col1, col2, col3 = st.columns([1,1,1])
-        with col2:
-            if st.button("Submit Answer"):
-                if answer == current_q["correct_answer"]:
-                    st.success("Correct! 🎉")
-                    st.session_state.score += CORRECT_MARKS
-                else:
-                    st.error(f"Wrong! The correct answer was {current_q['correct_answer']}")
-                    st.session_state.score += WRONG_MARKS
-                
-                if st.session_state.current_question < len(questions) - 1:
-                    st.session_state.current_question += 1
-                    st.session_state.question_start_time = time.time()
-                else:
+            # Submit answer button or auto-submit on time out
+            if st.session_state.remaining_time <= 0 or timer_expired:
+                if not st.session_state.quiz_complete:
                     submit_quiz()
                 #st.rerun()
         
-        # Submit entire quiz button
-        if st.button("Submit Quiz"):
-            submit_quiz()
-            #st.experimental_rerun()
+            col1, col2, col3 = st.columns([1,1,1])
+            with col2:
+                if st.button("Submit Answer") and not st.session_state.quiz_complete:
+                    with attempt["lock"]:
+                        # The scheduler may have closed this question between render and click
+                        on_time = not attempt["finalized"] and attempt["current_question"] == st.session_state.current_question
+                        if on_time:
+                            attempt["responses"].append(answer)
+                            result = grading.grade_one([answer], [current_q.answer], MARKING_SCHEME)
+                            st.session_state.score += result["score"]
+                            attempt["score"] = st.session_state.score
+                            is_last = st.session_state.current_question == len(questions) - 1
+                            if not is_last:
+                                st.session_state.current_question += 1
+                                st.session_state.question_start_time = time.time()
+                                attempt["current_question"] = st.session_state.current_question
+                                schedule_question_deadline(attempt)
+                
+                    if not on_time:
+                        st.warning("Time is up for this question.")
+                    else:
+                        if result["correct"]:
+                            st.success("Correct! 🎉")
+                        else:
+                            st.error(f"Wrong! The correct answer was {current_q.correct_option}")
+                        if is_last:
+                            submit_quiz()
+                    #st.rerun()
+        
+            # Submit entire quiz button
+            if st.button("Submit Quiz") and not st.session_state.quiz_complete:
+                submit_quiz()
+                #st.experimental_rerun()
 
     # Display results if quiz is complete
     if st.session_state.quiz_complete:
         st.success("Assessment Complete! 🎉")
         st.markdown(f"<p class='score-display'>Final Score: {st.session_state.score}/{len(questions)*CORRECT_MARKS}</p>", unsafe_allow_html=True)
+        if st.session_state.get('rank') is not None:
+            rank, percentile = st.session_state.rank
+            st.markdown(f"<p class='score-display'>🏆 All India Rank: {rank} (Percentile: {percentile:.1f})</p>", unsafe_allow_html=True)
         
         if st.button("Start New Assessment"):
             for key in st.session_state.keys():
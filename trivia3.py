@@ -3,6 +3,11 @@ import json
 import os
 from datetime import datetime
 import time
+from countdown_timer import countdown_timer
+import secrets
+import grading
+import papers
+import question_bank
 
 # Initialize session state variables
 if 'current_question' not in st.session_state:
@@ -22,61 +27,26 @@ if 'user_answers' not in st.session_state:
 
 # Quiz configuration
 TOTAL_TIME_LIMIT = 420   # 7 minutes
+CORRECT_MARKS = 2        # marks for correct answer
+WRONG_MARKS = -0.5       # negative marking for wrong answer
+MARKING_SCHEME = grading.MarkingScheme(correct=CORRECT_MARKS, wrong=WRONG_MARKS)
+TEST_ID = "aptitude-reasoning"  # question bank test for this quiz
 WARNING_THRESHOLDS = {
     'critical': 60,      # Red blinking - 1 minute
     'warning': 120,      # Red - 2 minutes
     'caution': 180      # Orange - 3 minutes
 }
+WARNING_MESSAGES = {
+    'critical': "⚠️ HURRY UP! Less than 1 minute remaining!",
+    'warning': "⚠️ 2 minutes remaining!",
+    'caution': "⚠️ 3 minutes remaining!"
+}
 
-# Questions with solutions
-questions = [
-    {
-        "question": """Directions: Study the following digit-letter-symbol sequence carefully:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        How many such symbols are there in the above sequence, each of which is immediately preceded by a consonant and immediately followed by a number?""",
-        "options": ["None", "One", "Two", "Four", "None of these"],
-        "correct_answer": "Two",
-        "solution": "Solution: Q@7 and M#8 are the two instances where a symbol is preceded by a consonant and followed by a number."
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        Which of the following is fifth to the left of 15th element from the left?""",
-        "options": ["S", "P", "E", "#", "None of these"],
-        "correct_answer": "P",
-        "solution": "Solution: Count 15 elements from left, then count 5 more to the left to find 'P'."
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        If all the numbers are dropped in the given series, then which element will be at sixth position from right end?""",
-        "options": ["Z", "M", "L", "D", "None of these"],
-        "correct_answer": "L",
-        "solution": "Solution: After removing numbers and counting from right end: M, D, ¥, €, J, L"
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        How many such numbers are there in the above sequence, each of which is immediately preceded by a vowel and immediately followed by a consonant?""",
-        "options": ["Three", "Two", "None", "One", "None of these"],
-        "correct_answer": "One",
-        "solution": "Solution: Only E4Q satisfies the condition where '4' is preceded by vowel 'E' and followed by consonant 'Q'."
-    },
-    {
-        "question": """Using the same sequence:
-        C%B K 1 & A W 5 P E 4 Q @ 7 F 6 G © Z J L 2 € D ¥ M #8
-        
-        What should come in place of question mark in the following on the basis of above sequence?
-        B, &, P, 7, ?""",
-        "options": ["#", "M", "D", "2", "J"],
-        "correct_answer": "J",
-        "solution": "Solution: The pattern follows elements at regular intervals in the sequence B → & → P → 7 → J"
-    }
-]
+# Questions with solutions, shared from the process-wide question bank cache
+questions = question_bank.load_test(TEST_ID).questions
+if 'option_ranks' not in st.session_state:
+    # Options are shuffled per candidate, kept as one 2-byte order rank per question
+    st.session_state.option_ranks = papers.option_ranks(secrets.token_hex(8), questions)
 
 def format_time(seconds):
     """Format seconds into minutes:seconds"""
@@ -86,81 +56,104 @@ def format_time(seconds):
     seconds = int(seconds % 60)
     return f"{minutes:02d}:{seconds:02d}"
 
-def get_timer_style(remaining_time):
-    """Return timer style based on remaining time"""
-    if remaining_time <= WARNING_THRESHOLDS['critical']:
-        return "red", True  # Color, Should blink
-    elif remaining_time <= WARNING_THRESHOLDS['warning']:
-        return "red", False
-    elif remaining_time <= WARNING_THRESHOLDS['caution']:
-        return "orange", False
-    return "green", False
-
-def display_timer(remaining_time):
+def display_timer(deadline):
     """Display a prominent timer with appropriate styling"""
-    color, should_blink = get_timer_style(remaining_time)
-    
-    # Warning messages based on time
-    warning_message = ""
-    if remaining_time <= WARNING_THRESHOLDS['critical']:
-        warning_message = "⚠️ HURRY UP! Less than 1 minute remaining!"
-    elif remaining_time <= WARNING_THRESHOLDS['warning']:
-        warning_message = "⚠️ 2 minutes remaining!"
-    elif remaining_time <= WARNING_THRESHOLDS['caution']:
-        warning_message = "⚠️ 3 minutes remaining!"
-
-    timer_html = f"""
-        <div style='text-align: center; margin: 10px 0;'>
-            <div style='
-                font-size: 2.5rem;
-                font-weight: bold;
-                color: {color};
-                {"animation: blink 1s linear infinite" if should_blink else ""};
-                padding: 10px;
-                border: 2px solid {color};
-                border-radius: 10px;
-                display: inline-block;
-            '>
-                ⏱️ {format_time(remaining_time)}
-            </div>
-            <div style='color: {color}; font-weight: bold; margin-top: 5px;'>
-                {warning_message}
-            </div>
-        </div>
-    """
-    st.markdown(timer_html, unsafe_allow_html=True)
+    # The countdown, colours and warning messages run in the browser; the
+    # script only reruns once, when the deadline passes
+    return countdown_timer(deadline, WARNING_THRESHOLDS, WARNING_MESSAGES, key="quiz_timer")
 
 def display_solutions():
     """Display solutions with detailed explanations"""
     st.markdown("### 📝 Review Solutions")
     
     for i, question in enumerate(questions):
+        # user_answers hold shown positions; options are reviewed in the order the candidate saw them
+        rank = st.session_state.option_ranks[i]
         with st.expander(f"Question {i + 1}"):
-            st.markdown(f"**Question:**\n{question['question']}")
+            st.markdown(f"**Question:**\n{question.text}")
             st.markdown("**Options:**")
-            for option in question['options']:
-                prefix = "✅" if option == question['correct_answer'] else "❌"
-                highlight = "background-color: #90EE90;" if option == question['correct_answer'] else ""
-                selected = "👉 " if st.session_state.user_answers.get(i) == option else ""
+            for shown, index in enumerate(papers.permutation(rank, len(question.options))):
+                option = question.options[index]
+                prefix = "✅" if index == question.answer else "❌"
+                highlight = "background-color: #90EE90;" if index == question.answer else ""
+                selected = "👉 " if st.session_state.user_answers.get(i) == shown else ""
                 st.markdown(f"""
                     <div style='{highlight} padding: 5px; border-radius: 5px;'>
                         {prefix} {selected} {option}
                     </div>
                 """, unsafe_allow_html=True)
             
-            st.markdown(f"**Your Answer:** {st.session_state.user_answers.get(i, 'Not answered')}")
-            st.markdown(f"**Correct Answer:** {question['correct_answer']}")
-            st.markdown(f"**{question['solution']}**")
+            answer = None
+            if i in st.session_state.user_answers:
+                answer = papers.to_original(rank, len(question.options), st.session_state.user_answers[i])
+                st.markdown(f"**Your Answer:** {question.options[answer]}")
+            else:
+                st.markdown("**Your Answer:** Not answered")
+            st.markdown(f"**Correct Answer:** {question.correct_option}")
+            st.markdown(f"**{question.solution}**")
             
             # Show if answer was correct and marks awarded
-            if i in st.session_state.user_answers:
-                if st.session_state.user_answers[i] == question['correct_answer']:
+            if answer is not None:
+                if answer == question.answer:
                     st.markdown("✅ **+2 marks awarded**")
                 else:
                     st.markdown("❌ **-0.5 marks deducted**")
             else:
                 st.markdown("❌ **No answer submitted**")
 
+@st.fragment
+def timer_pane():
+    """Countdown timer; its expiry event reruns only this fragment"""
+    # Update and display timer
+    current_time = time.time()
+    time_elapsed = current_time - st.session_state.question_start_time
+    st.session_state.remaining_time = max(0, TOTAL_TIME_LIMIT - time_elapsed)
+    
+    timer_expired = display_timer(st.session_state.question_start_time + TOTAL_TIME_LIMIT)
+    
+    # Auto-submit needs the whole page, so it escalates to a full rerun
+    if st.session_state.remaining_time <= 0 or timer_expired:
+        submit_quiz()
+        st.rerun()
+
+@st.fragment
+def question_pane():
+    """Current question, answer options, Submit Answer and progress bar"""
+    # Feedback on the previous answer, kept across the rerun that moved to this question
+    feedback = st.session_state.pop('feedback', None)
+    if feedback is not None:
+        correct, message = feedback
+        (st.success if correct else st.error)(message)
+    current_q = questions[st.session_state.current_question]
+    # The radio returns the chosen position in this candidate's option order
+    rank = st.session_state.option_ranks[st.session_state.current_question]
+    options = papers.shuffled(current_q.options, rank)
+    shown = st.radio("Select your answer:", range(len(options)), format_func=options.__getitem__,
+                     key=f"q_{st.session_state.current_question}")
+    st.session_state.user_answers[st.session_state.current_question] = shown
+    answer = papers.to_original(rank, len(options), shown)
+    
+    col1, col2, col3 = st.columns([1,1,1])
+    with col2:
+        if st.button("Submit Answer"):
+            result = grading.grade_one([answer], [current_q.answer], MARKING_SCHEME)
+            st.session_state.score += result["score"]
+            
+            if st.session_state.current_question < len(questions) - 1:
+                st.session_state.feedback = (result["correct"], "Correct! 🎉" if result["correct"]
+                                             else f"Wrong! The correct answer was {current_q.correct_option}")
+                st.session_state.current_question += 1
+                st.session_state.question_start_time = time.time()
+                # The timer counts from question_start_time, so the timer fragment has to be redrawn too
+                st.rerun()
+            else:
+                submit_quiz()
+                st.rerun()
+    
+    # Display progress bar
+    progress = (st.session_state.current_question + 1) / len(questions)
+    st.progress(progress)
+
 def main():
     # Page configuration and CSS remain the same...
     # Page configuration
@@ -220,44 +213,16 @@ def main():
     
     # Quiz section
     if st.session_state.quiz_started and not st.session_state.quiz_complete:
-        # Update and display timer
-        current_time = time.time()
-        time_elapsed = current_time - st.session_state.question_start_time
-        st.session_state.remaining_time = max(0, TOTAL_TIME_LIMIT - time_elapsed)
-        
-        display_timer(st.session_state.remaining_time)
-        
-        # Rest of the quiz logic remains the same, but store user answers
-        current_q = questions[st.session_state.current_question]
-        answer = st.radio("Select your answer:", current_q["options"], key=f"q_{st.session_state.current_question}")
-        st.session_state.user_answers[st.session_state.current_question] = answer
-        
-        # Auto-submit logic and buttons remain the same...
-        if st.session_state.remaining_time <= 0:
-            submit_quiz()
-            st.experimental_rerun()
-        
-        col1, col2, col3 = st.columns([1,1,1])
-        with col2:
-            if st.button("Submit Answer"):
-                if answer == current_q["correct_answer"]:
-                    st.success("Correct! 🎉")
-                    st.session_state.score += CORRECT_MARKS
-                else:
-                    st.error(f"Wrong! The correct answer was {current_q['correct_answer']}")
-                    st.session_state.score += WRONG_MARKS
-                
-                if st.session_state.current_question < len(questions) - 1:
-                    st.session_state.current_question += 1
-                    st.session_state.question_start_time = time.time()
-                else:
-                    submit_quiz()
-                st.experimental_rerun()
+        # The timer and the question pane are fragments: choosing an option reruns only
+        # the question pane instead of the CSS, header and sidebar of the whole script;
+        # moving to the next question reruns the page, as the timer restarts with it
+        timer_pane()
+        question_pane()
         
         # Submit entire quiz button
         if st.button("Submit Quiz"):
             submit_quiz()
-            st.experimental_rerun()
+            st.rerun()
 
     # Display results and solutions if quiz is complete
     if st.session_state.quiz_complete:
@@ -270,12 +235,7 @@ def main():
         if st.button("Start New Assessment"):
             for key in st.session_state.keys():
                 del st.session_state[key]
-            st.experimental_rerun()
-
-    # Display progress bar
-    if st.session_state.quiz_started and not st.session_state.quiz_complete:
-        progress = (st.session_state.current_question + 1) / len(questions)
-        st.progress(progress)
+            st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file